@@ -0,0 +1,139 @@
+"""Shared helpers of the DataDash benchmarks.
+
+Every measurement runs in a fresh interpreter with the offscreen Qt platform
+and its own home directory, so the config, logs and caches of the machine
+are neither used nor touched. Results are compared against a baseline
+recorded earlier on the same machine with --save-baseline.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(APP_DIR, 'benchmarks')
+
+
+def isolated_env(home):
+    """Return the environment of a benchmark child living in home."""
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    env['APPDATA'] = os.path.join(home, 'AppData', 'Roaming')
+    env['LOCALAPPDATA'] = os.path.join(home, 'AppData', 'Local')
+    env['QT_QPA_PLATFORM'] = 'offscreen'
+    return env
+
+
+def run_child(code, env, python_args=(), timeout=120):
+    """Run code in a new interpreter inside the app folder and return (stdout, stderr).
+
+    The child reports its result as JSON on the last line of stdout.
+    """
+    completed = subprocess.run([sys.executable, *python_args, '-c', code], cwd=APP_DIR, env=env,
+                               capture_output=True, text=True, timeout=timeout)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark child failed with {completed.returncode}:\n{completed.stderr[-2000:]}")
+    return completed.stdout, completed.stderr
+
+
+def child_result(stdout):
+    lines = [line for line in stdout.splitlines() if line.startswith('{')]
+    if not lines:
+        raise RuntimeError("Benchmark child printed no result")
+    return json.loads(lines[-1])
+
+
+def medians(samples):
+    """Reduce a list of {metric: value} to the median of every metric."""
+    metrics = {}
+    for sample in samples:
+        for name, value in sample.items():
+            metrics.setdefault(name, []).append(value)
+    return {name: statistics.median(values) for name, values in metrics.items()}
+
+
+def compare(results, baseline, thresholds):
+    """Return the metrics of results that regressed against baseline.
+
+    thresholds maps a metric name or fnmatch pattern to (relative tolerance,
+    absolute slack), the first matching entry applies. A metric regresses
+    when it exceeds baseline * (1 + tolerance) + slack, one missing from the
+    baseline counts from 0. Metrics without a threshold are reported but
+    never fail.
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        threshold = next((t for pattern, t in thresholds.items() if fnmatch.fnmatchcase(name, pattern)), None)
+        if threshold is None:
+            continue
+        tolerance, slack = threshold
+        base = baseline.get(name, 0)
+        limit = base * (1 + tolerance) + slack
+        if value > limit:
+            regressions.append((name, base, value, limit))
+    return regressions
+
+
+def report(results, baseline):
+    width = max((len(name) for name in results), default=0)
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        delta = f"  (baseline {base:.1f})" if base is not None else ""
+        print(f"  {name:<{width}}  {value:10.1f}{delta}")
+
+
+def main(name, measure, thresholds, description, add_arguments=None, runs=5):
+    """Command line entry of a benchmark.
+
+    measure(env, home, args) runs one round and returns {metric: value}, it
+    is called --runs times and the medians are compared with the baseline.
+    add_arguments(parser) adds the benchmark's own options. The exit status
+    is 1 if any metric regressed and 2 if there is no baseline to compare
+    with, a baseline is only written with --save-baseline.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--runs', type=int, default=runs, help="rounds to take the median of")
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, f'{name}_baseline.json'),
+                        help="baseline file to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="record the results as the new baseline")
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    if add_arguments:
+        add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='datadash-bench-') as home:
+        env = isolated_env(home)
+        samples = []
+        for i in range(args.runs):
+            samples.append(measure(env, home, args))
+            print(f"{name}: round {i + 1} of {args.runs} done", file=sys.stderr)
+    results = medians(samples)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"{name} (median of {args.runs}):")
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {args.baseline}, nothing compared, record one with --save-baseline")
+        return 2
+
+    regressions = compare(results, baseline, thresholds)
+    for metric, base, value, limit in regressions:
+        print(f"REGRESSION {metric}: {value:.1f} against baseline {base:.1f}, limit {limit:.1f}")
+    return 1 if regressions else 0
@@ -0,0 +1,105 @@
+"""Startup benchmark of DataDash.
+
+Measures, in a fresh offscreen interpreter each round:
+  import.<module>  cumulative import time of every DataDash module and of
+                   the heavy packages kept out of startup, in ms
+  import.total     time to import main, in ms
+  shown_ms         time from the start of the process to MainApp shown with
+                   its UI built, in ms
+  idle_threads     threads of the process once it has been idle for a second
+
+    python benchmarks/startup.py --save-baseline   # record this machine's numbers
+    python benchmarks/startup.py                   # exits with 1 on a regression, 2 without a baseline
+"""
+import os
+import sys
+
+import harness
+
+# Imported only once a transfer or the update check needs them
+DEFERRED_PACKAGES = ('requests', 'cryptography')
+IDLE_MS = 1000
+
+THRESHOLDS = {
+    'import.total': (0.25, 10),
+    'import.*': (0.5, 3),
+    'shown_ms': (0.25, 20),
+    'idle_threads': (0, 0),
+}
+
+_SHOWN_CHILD = '''
+import time
+started = time.perf_counter()
+import json, os, sys, threading
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+import main
+
+result = {}
+app = QApplication(sys.argv)
+
+
+def thread_count():
+    if os.path.isdir('/proc/self/task'):
+        return len(os.listdir('/proc/self/task'))
+    return threading.active_count()
+
+
+def idle():
+    result['idle_threads'] = thread_count()
+    window.close()
+
+
+class BenchMainApp(main.MainApp):
+    def on_config_ready(self):
+        super().on_config_ready()
+        if 'shown_ms' not in result:
+            QTimer.singleShot(0, shown)
+
+
+def shown():
+    result['shown_ms'] = (time.perf_counter() - started) * 1000
+    QTimer.singleShot(%d, idle)
+
+
+window = BenchMainApp(skip_version_check=True)
+window.show()
+app.exec()
+print(json.dumps(result))
+''' % IDLE_MS
+
+
+def app_modules():
+    return {name[:-3] for name in os.listdir(harness.APP_DIR) if name.endswith('.py')}
+
+
+def import_times(env):
+    """Return {import.<module>: ms} from python -X importtime."""
+    _, stderr = harness.run_child('import main', env, python_args=('-X', 'importtime'))
+    watched = app_modules()
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            cumulative = int(cumulative) / 1000
+        except ValueError:
+            continue  # the header line
+        name = name.strip()
+        if name == 'main':
+            times['import.total'] = cumulative
+        elif name in watched or name in DEFERRED_PACKAGES:
+            times[f'import.{name}'] = cumulative
+    return times
+
+
+def measure(env, home, args):
+    results = import_times(env)
+    stdout, _ = harness.run_child(_SHOWN_CHILD, env)
+    results.update(harness.child_result(stdout))
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(harness.main('startup', measure, THRESHOLDS, __doc__.splitlines()[0]))
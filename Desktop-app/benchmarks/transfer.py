@@ -0,0 +1,266 @@
+"""Loopback transfer benchmark of DataDash.
+
+Every pairing of a sender and a receiver sends every dataset over
+127.0.0.1, each transfer in a fresh offscreen interpreter so its peak RSS is
+its own. Pairings:
+  python  FileSender to ReceiveWorkerPython, the desktop to desktop protocol
+  java    FileSenderJava to ReceiveWorkerJava, the protocol of the Android app
+  swift   FileSenderSwift to ReceiveWorkerSwift, the protocol of the Apple apps
+The Android and Apple apps are stood in for by the desktop's own end of
+their protocol. Datasets:
+  huge       one large file
+  tiny       a folder of many tiny files
+  mixed      a folder tree of small, medium and large files, partly compressible
+  encrypted  the mixed tree with encryption on
+Metrics per <pairing>.<dataset>, both ends of a transfer run in one process:
+  seconds, mb_s, files_s  from the receiver accepting the connection to the halt,
+                          mb_s counts the bytes of the dataset
+  cpu_pct                 CPU time of the process over that time
+  peak_rss_mb             peak resident memory of the process, where known
+
+    python benchmarks/transfer.py --save-baseline
+    python benchmarks/transfer.py --pairings python --datasets huge,tiny --output results.json
+"""
+import hashlib
+import os
+import random
+import shutil
+import sys
+
+import harness
+
+PAIRINGS = ('python', 'java', 'swift')
+DATASETS = ('huge', 'tiny', 'mixed', 'encrypted')
+PASSWORD = 'benchmark'
+
+THRESHOLDS = {
+    '*.seconds': (0.25, 0.5),
+    '*.peak_rss_mb': (0.25, 20),
+}
+
+_CHILD = '''
+import sys
+sys.path.insert(0, %r)
+import transfer
+transfer.child(%r, %r, %r, %r, %r)
+'''
+
+
+def add_arguments(parser):
+    parser.add_argument('--pairings', default=','.join(PAIRINGS), help="comma separated pairings to run")
+    parser.add_argument('--datasets', default=','.join(DATASETS), help="comma separated datasets to send")
+    parser.add_argument('--huge-mb', type=int, default=1024, help="size of the huge file")
+    parser.add_argument('--tiny-files', type=int, default=100000, help="number of tiny files")
+    parser.add_argument('--mixed-mb', type=int, default=256, help="size of the mixed tree")
+
+
+def _write(path, size, rng, compressible=False):
+    with open(path, 'wb') as f:
+        if compressible:
+            line = b'DataDash benchmark line %d of mostly repeated text\n'
+            while size > 0:
+                data = b''.join(line % i for i in range(1000))[:size]
+                f.write(data)
+                size -= len(data)
+        else:
+            while size > 0:
+                data = rng.randbytes(min(size, 4 * 1024 * 1024))
+                f.write(data)
+                size -= len(data)
+
+
+def create_datasets(root, args):
+    """Write the datasets below root once, returns {dataset: (paths to send, file count, bytes)}."""
+    rng = random.Random(20260101)
+    datasets = {}
+    os.makedirs(root, exist_ok=True)
+
+    huge = os.path.join(root, 'huge.bin')
+    if not os.path.exists(huge):
+        _write(huge, args.huge_mb * 1024 * 1024, rng)
+    datasets['huge'] = ([huge], 1, os.path.getsize(huge))
+
+    tiny = os.path.join(root, 'tiny')
+    if not os.path.exists(tiny):
+        for i in range(args.tiny_files):
+            folder = os.path.join(tiny, f'{i // 1000:03d}')
+            if i % 1000 == 0:
+                os.makedirs(folder)
+            _write(os.path.join(folder, f'{i:06d}.txt'), rng.randint(64, 4096), rng, compressible=i % 2 == 0)
+    datasets['tiny'] = ([tiny], *_count(tiny))
+
+    mixed = os.path.join(root, 'mixed')
+    if not os.path.exists(mixed):
+        # A quarter of the bytes in small files, half in medium ones and a quarter in large ones
+        budget = args.mixed_mb * 1024 * 1024
+        sizes = []
+        for share, low, high in ((4, 1024, 64 * 1024), (2, 256 * 1024, 4 * 1024 * 1024),
+                                 (4, 16 * 1024 * 1024, 16 * 1024 * 1024)):
+            left = budget // share
+            while left > 0:
+                size = min(rng.randint(low, high), left)
+                sizes.append(size)
+                left -= size
+        rng.shuffle(sizes)
+        for i, size in enumerate(sizes):
+            folder = os.path.join(mixed, f'd{i % 8}', f's{i % 5}')
+            os.makedirs(folder, exist_ok=True)
+            _write(os.path.join(folder, f'f{i}.bin'), size, rng, compressible=i % 3 == 0)
+    datasets['mixed'] = datasets['encrypted'] = ([mixed], *_count(mixed))
+    return datasets
+
+
+def _count(folder):
+    files = size = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _digests(folder):
+    """Return {relative path: sha256} of the files below folder."""
+    digests = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            digests[os.path.relpath(path, folder).replace(os.sep, '/')] = _file_digest(path)
+    return digests
+
+
+def _received_digests(folder):
+    """Return the digests of the files received into folder, .crypt files are decrypted first."""
+    from crypt_handler import decrypt_file
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith('.crypt'):
+                path = os.path.join(root, name)
+                decrypt_file(path, PASSWORD)
+                os.remove(path)
+    return _digests(folder)
+
+
+def _pairing(pairing):
+    if pairing == 'python':
+        from file_sender import FileSender
+        from file_receiver_python import ReceiveWorkerPython
+        return FileSender, ReceiveWorkerPython
+    if pairing == 'java':
+        from file_sender_java import FileSenderJava
+        from file_receiver_android import ReceiveWorkerJava
+        return FileSenderJava, ReceiveWorkerJava
+    from file_sender_swift import FileSenderSwift
+    from file_receiver_swift import ReceiveWorkerSwift
+    return FileSenderSwift, ReceiveWorkerSwift
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def child(pairing, paths, files, size, encrypted):
+    """Send paths from pairing's sender to its receiver in this process and print the metrics as JSON.
+
+    files and size are those of the dataset, every received file is compared with the one sent.
+    """
+    import json
+    import threading
+    import time
+    from PyQt6.QtCore import Qt
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication([])
+    from constant import ConfigManager
+    from compression import available_codecs
+    from integrity import available_checksums
+    from portsss import DESKTOP_FEATURES
+
+    config_manager = ConfigManager.shared()
+    config_manager.ensure_checked()
+    config = config_manager.get_config()
+    config.update(encryption=encrypted, swift_encryption=encrypted, show_warning=False)
+    config_manager.write_config(config)
+    received = config['save_to_directory']
+
+    Sender, Receiver = _pairing(pairing)
+    receiver = Receiver('127.0.0.1')
+    started = {}
+
+    def on_started():
+        started['time'] = time.perf_counter()
+        started['cpu'] = time.process_time()
+
+    receiver.receiving_started.connect(on_started, Qt.ConnectionType.DirectConnection)
+    if hasattr(receiver, 'password_required'):
+        receiver.password_required.connect(lambda name, attempts: receiver.set_password(PASSWORD),
+                                           Qt.ConnectionType.DirectConnection)
+    receiving = threading.Thread(target=receiver.run)
+    receiving.start()
+
+    # Sent by the receiver during discovery, see file_receiver.py
+    receiver_data = {'features': DESKTOP_FEATURES, 'compression': available_codecs(),
+                     'checksums': available_checksums()}
+    sender = Sender('127.0.0.1', paths, PASSWORD if encrypted else None, receiver_data)
+    sender.run()
+    receiving.join()
+    if 'time' not in started:
+        raise RuntimeError(f"{pairing} receiver never accepted the connection")
+    elapsed = time.perf_counter() - started['time']
+    cpu = time.process_time() - started['cpu']
+
+    # Every dataset is one file or a folder, which is saved in a folder of its name
+    path, = paths
+    if os.path.isdir(path):
+        sent = _digests(path)
+        saved_to = os.path.join(received, os.path.basename(path))
+    else:
+        sent = {os.path.basename(path): _file_digest(path)}
+        saved_to = received
+    try:
+        got = _received_digests(saved_to)
+    finally:
+        shutil.rmtree(received)
+    wrong = sorted(name for name in sent.keys() | got.keys() if sent.get(name) != got.get(name))
+    if wrong:
+        raise RuntimeError(f"{pairing} received {len(wrong)} of {len(sent)} files wrong, missing or extra, "
+                           f"first {wrong[:5]}")
+
+    # The bytes of the dataset, encrypted outputs are larger than what was sent
+    result = {'seconds': elapsed, 'mb_s': size / (1024 * 1024) / elapsed, 'files_s': files / elapsed,
+              'cpu_pct': cpu * 100 / elapsed}
+    peak_rss = _peak_rss_mb()
+    if peak_rss is not None:
+        result['peak_rss_mb'] = peak_rss
+    print(json.dumps(result))
+    app.quit()
+
+
+def measure(env, home, args):
+    datasets = create_datasets(os.path.join(home, 'datasets'), args)
+    results = {}
+    for pairing in args.pairings.split(','):
+        for dataset in args.datasets.split(','):
+            paths, files, size = datasets[dataset]
+            code = _CHILD % (harness.BENCHMARK_DIR, pairing, paths, files, size, dataset == 'encrypted')
+            stdout, _ = harness.run_child(code, env, timeout=3600)
+            for metric, value in harness.child_result(stdout).items():
+                results[f'{pairing}.{dataset}.{metric}'] = value
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(harness.main('transfer', measure, THRESHOLDS, __doc__.splitlines()[0], add_arguments, runs=3))
@@ -12,10 +12,9 @@ from PyQt6.QtCore import QThread, pyqtSignal, Qt, QPointF, QTimer, QSize
 from PyQt6.QtGui import QScreen, QColor, QLinearGradient, QPainter, QPen, QFont, QIcon, QKeySequence, QKeyEvent
 from loges import logger
 from constant import ConfigManager
-from portsss import BROADCAST_PORT, LISTEN_PORT, RECEIVER_JSON
-from file_sender import SendApp
-from file_sender_java import SendAppJava
-from file_sender_swift import SendAppSwift
+from portsss import BROADCAST_PORT, LISTEN_PORT, RECEIVER_JSON, DESKTOP_FEATURES
+from compression import available_codecs
+from integrity import available_checksums
 import os
 import time
 
@@ -89,8 +88,8 @@ class BroadcastWorker(QThread):
         self.socket = None
         self.client_socket = None
         self.receiver_data = None
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         self.running = True
 
     def run(self):
@@ -155,7 +154,10 @@ class BroadcastWorker(QThread):
 
             device_data = {
                 'device_type': 'python',
-                'os': platform.system()
+                'os': platform.system(),
+                'features': DESKTOP_FEATURES,
+                'compression': available_codecs(),
+                'checksums': available_checksums()
             }
             logger.debug(f"Sending device data: {device_data}")
             device_data_json = json.dumps(device_data)
@@ -217,10 +219,9 @@ class BroadcastWorker(QThread):
 class Broadcast(QWidget):
     def __init__(self):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.setWindowTitle('Device Discovery')
         self.setFixedSize(853, 480)
         self.center_window()
@@ -451,12 +452,15 @@ class Broadcast(QWidget):
     def show_send_app(self, device_ip, device_name, receiver_data):
         self.clean()
         self.hide()
+        # Each sender is imported once its peer is picked, see main.py
+        from file_sender import SendApp
         self.send_app = SendApp(device_ip, device_name, receiver_data)
         self.send_app.show()
 
     def show_send_app_java(self, device_ip, device_name, receiver_data):
         self.clean()
         self.hide()
+        from file_sender_java import SendAppJava
         self.send_app_java = SendAppJava(device_ip, device_name, receiver_data)
         self.send_app_java.show()
         #com.an.Datadash
@@ -513,6 +517,7 @@ class Broadcast(QWidget):
                 msg_box.exec() 
         
         self.hide()
+        from file_sender_swift import SendAppSwift
         self.send_app_swift = SendAppSwift(device_ip, device_name, receiver_data)
         self.send_app_swift.show()
         #com.an.Datadash
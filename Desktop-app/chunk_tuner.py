@@ -0,0 +1,86 @@
+import socket
+import struct
+import time
+from loges import logger
+from portsss import CHUNK_SIZE_DESKTOP, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX, SOCKET_BUFFER_MIN, SOCKET_BUFFER_MAX
+
+# Offset of tcpi_rtt (microseconds) inside Linux's struct tcp_info
+_TCP_INFO_RTT_OFFSET = 68
+_TCP_INFO_LEN = 104
+
+
+def measure_rtt(sock):
+    """Return the kernel's smoothed RTT estimate for sock in seconds, or None if unavailable."""
+    tcp_info = getattr(socket, 'TCP_INFO', None)
+    if tcp_info is None:
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, tcp_info, _TCP_INFO_LEN)
+        rtt_us = struct.unpack_from('<I', info, _TCP_INFO_RTT_OFFSET)[0]
+    except (OSError, struct.error):
+        return None
+    return rtt_us / 1_000_000 if rtt_us else None
+
+
+def tune_socket_buffers(sock, size):
+    """Set SO_SNDBUF and SO_RCVBUF on sock to size, clamped to the configured bounds."""
+    size = max(SOCKET_BUFFER_MIN, min(SOCKET_BUFFER_MAX, int(size)))
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError as e:
+            logger.debug("Could not set socket buffer option %s: %s", option, e)
+    return size
+
+
+class ChunkSizer:
+    """Adapts the read/send/recv size of one connection to its measured throughput.
+
+    Throughput is sampled over short windows. The size keeps moving in the same
+    direction (doubling or halving) while throughput improves and reverses once
+    it drops. Socket buffers follow the bandwidth-delay product of the link.
+    """
+
+    def __init__(self, sock=None, initial=CHUNK_SIZE_DESKTOP, minimum=CHUNK_SIZE_MIN, maximum=CHUNK_SIZE_MAX, window=0.25):
+        self.sock = sock
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.size = max(minimum, min(maximum, initial))
+        self.direction = 1
+        self.throughput = 0.0  # bytes per second over the last window
+        self.rtt = None
+        self.buffer_size = None
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+        self._last_throughput = 0.0
+        if sock is not None:
+            self.buffer_size = tune_socket_buffers(sock, self.size * 4)
+
+    def record(self, nbytes):
+        """Account nbytes moved by one call and retune once the sample window is full."""
+        self._window_bytes += nbytes
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return self.size
+
+        self.throughput = self._window_bytes / elapsed
+        if self._last_throughput:
+            if self.throughput < self._last_throughput * 0.95:
+                self.direction = -self.direction
+            new_size = self.size * 2 if self.direction > 0 else self.size // 2
+            self.size = max(self.minimum, min(self.maximum, new_size))
+        self._last_throughput = self.throughput
+        self._window_bytes = 0
+        self._window_start = now
+
+        if self.sock is not None:
+            self.rtt = measure_rtt(self.sock)
+            # Keep at least two chunks and the bandwidth-delay product in flight
+            target = self.size * 2
+            if self.rtt:
+                target = max(target, self.throughput * self.rtt * 2)
+            if self.buffer_size is None or abs(target - self.buffer_size) > self.buffer_size // 2:
+                self.buffer_size = tune_socket_buffers(self.sock, target)
+        return self.size
@@ -0,0 +1,315 @@
+"""Transfers from the command line, without any window.
+
+    DataDash send HOST PATH... [--password PASSWORD] [--json]
+    DataDash receive [--dest FOLDER] [--password PASSWORD] [--json]
+
+main.py hands its arguments here when the first one is send or receive. The
+same FileSender and ReceiveWorkerPython as in the GUI do the transfer, so
+both ends work with the DataDash desktop app. With --json, progress and the
+summary are printed to stdout as one JSON object per line, everything else
+goes to stderr. receive saves to the current directory unless --dest is
+given, so it needs no configured save folder. The exit status is 0 if the
+transfer completed and 1 if it failed.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import struct
+import sys
+import threading
+import time
+from PyQt6.QtCore import QCoreApplication, Qt
+from loges import logger, stop_logging_thread
+from constant import ConfigManager
+from portsss import BROADCAST_PORT, LISTEN_PORT, RECEIVER_JSON, DESKTOP_FEATURES
+from compression import available_codecs
+from integrity import available_checksums
+from transfer_io import recv_exact
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+# Seconds between progress reports
+PROGRESS_INTERVAL = 1.0
+
+
+def device_data():
+    """What this end tells its peer about itself before a transfer, as the GUI does."""
+    return {
+        "device_type": "python",
+        "os": platform.system(),
+        "features": DESKTOP_FEATURES,
+        "compression": available_codecs(),
+        "checksums": available_checksums()
+    }
+
+
+def exchange_device_data(sock):
+    """Send this end's device data over sock and return the peer's."""
+    data = json.dumps(device_data()).encode()
+    sock.sendall(struct.pack('<Q', len(data)) + data)
+    size = struct.unpack('<Q', recv_exact(sock, 8))[0]
+    return json.loads(recv_exact(sock, size).decode())
+
+
+class Output:
+    """Progress and summary of a transfer, as JSON lines on stdout or as text."""
+
+    def __init__(self, json_output):
+        self.json_output = json_output
+        # Modules print to stdout here and there, with JSON only the events go there
+        self.stdout = sys.stdout
+        if json_output:
+            sys.stdout = sys.stderr
+        self.progress_line = False
+
+    def event(self, **fields):
+        self.stdout.write(json.dumps(fields) + '\n')
+        self.stdout.flush()
+
+    def progress(self, percent, files_done, files_total, bytes_done, elapsed):
+        speed = bytes_done / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        if self.json_output:
+            self.event(event='progress', percent=percent, files_done=files_done, files_total=files_total,
+                       bytes=bytes_done, seconds=round(elapsed, 3), mb_s=round(speed, 2))
+        elif sys.stderr.isatty():
+            sys.stderr.write(f"\r{percent:3d}%  {files_done}/{files_total} files  {speed:.1f} MB/s ")
+            sys.stderr.flush()
+            self.progress_line = True
+
+    def summary(self, action, ok, files, bytes_done, elapsed, error=None):
+        speed = bytes_done / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        if self.json_output:
+            self.event(event='summary', action=action, ok=ok, files=files, bytes=bytes_done,
+                       seconds=round(elapsed, 3), mb_s=round(speed, 2), error=error)
+            return
+        if self.progress_line:
+            sys.stderr.write('\n')
+        if ok:
+            self.stdout.write(f"{action.capitalize()} {files} files, {bytes_done / (1024 * 1024):.1f} MB "
+                              f"in {elapsed:.1f} s ({speed:.1f} MB/s)\n")
+        else:
+            sys.stderr.write(f"Transfer failed: {error}\n")
+
+
+class ProgressReporter:
+    """Samples the progress bus of a worker while it runs and passes it to an Output.
+
+    Without an event loop the bus's own timer never fires, its flush() is
+    called from here instead.
+    """
+
+    def __init__(self, worker, output, bytes_done, started):
+        self.worker = worker
+        self.output = output
+        self.bytes_done = bytes_done
+        self.started = started
+        self.percent = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.stopped = threading.Event()
+        worker.progress.overall_progress.connect(self.on_overall, Qt.ConnectionType.DirectConnection)
+        worker.progress.file_counts.connect(self.on_counts, Qt.ConnectionType.DirectConnection)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def on_overall(self, percent):
+        self.percent = percent
+
+    def on_counts(self, total_files, files_done, files_pending):
+        self.files_total, self.files_done = total_files, files_done
+
+    def report(self):
+        self.worker.progress.flush()
+        self.output.progress(self.percent, self.files_done, self.files_total, self.bytes_done(),
+                             time.time() - self.started())
+
+    def run(self):
+        while not self.stopped.wait(PROGRESS_INTERVAL):
+            self.report()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
+
+
+def send(args, output):
+    from file_sender import FileSender
+
+    class CommandLineSender(FileSender):
+        error = None
+
+        def show_message_box(self, title, message):
+            self.error = f"{title}: {message}"
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            output.summary('sent', False, 0, 0, 0.0, f"{path} does not exist")
+            return EXIT_FAILED
+
+    try:
+        with socket.create_connection((args.host, RECEIVER_JSON), timeout=args.timeout) as sock:
+            receiver_data = exchange_device_data(sock)
+    except (OSError, ValueError) as e:
+        output.summary('sent', False, 0, 0, 0.0, f"Could not reach a receiver at {args.host}: {e}")
+        return EXIT_FAILED
+    if receiver_data.get('device_type') != 'python':
+        output.summary('sent', False, 0, 0, 0.0,
+                       f"{args.host} is a {receiver_data.get('device_type')} device, only DataDash desktop "
+                       "receivers are supported from the command line")
+        return EXIT_FAILED
+
+    paths = [os.path.abspath(path) for path in args.paths]
+    sender = CommandLineSender(args.host, paths, args.password, receiver_data, encrypt=args.password is not None)
+    finished = threading.Event()
+    sender.transfer_finished.connect(finished.set, Qt.ConnectionType.DirectConnection)
+    started = time.time()
+    error = None
+    with ProgressReporter(sender, output, lambda: sender.sent_size, lambda: sender.start_time or started):
+        try:
+            sender.run()
+        except Exception as e:
+            logger.error("Command line send failed: %s", e)
+            error = str(e)
+    error = error or sender.error
+    ok = finished.is_set() and error is None
+    output.summary('sent', ok, sender.files_sent, sender.sent_size, time.time() - (sender.start_time or started),
+                   error if not ok else None)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def answer_discovery(device_name, stopped):
+    """Answer DISCOVER broadcasts of senders looking for receivers until stopped is set."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as search_socket:
+            search_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            search_socket.bind(('0.0.0.0', BROADCAST_PORT))
+            search_socket.settimeout(0.5)
+            while not stopped.is_set():
+                try:
+                    message, address = search_socket.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                if message == b'DISCOVER':
+                    search_socket.sendto(f'RECEIVER:{device_name}'.encode(), (address[0], LISTEN_PORT))
+    except OSError as e:
+        logger.warning("Not answering discovery broadcasts: %s", e)
+
+
+def receive(args, output):
+    from file_receiver_python import ReceiveWorkerPython
+
+    dest = os.path.abspath(args.dest)
+    try:
+        os.makedirs(dest, exist_ok=True)
+    except OSError as e:
+        output.summary('received', False, 0, 0, 0.0, f"Cannot save to {dest}: {e}")
+        return EXIT_FAILED
+    discovery_stopped = threading.Event()
+    if not args.no_discovery:
+        device_name = args.name or ConfigManager.shared().get_config().get("device_name", platform.node())
+        threading.Thread(target=answer_discovery, args=(device_name, discovery_stopped), daemon=True).start()
+
+    # Wait for a sender to introduce itself, as the receive window does
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(('0.0.0.0', RECEIVER_JSON))
+            server.listen(1)
+            server.settimeout(args.timeout)
+            while True:
+                sock, address = server.accept()
+                with sock:
+                    sock.settimeout(30)
+                    sender_data = exchange_device_data(sock)
+                if sender_data.get('device_type') == 'python':
+                    break
+                logger.warning("Ignoring %s sender at %s, only DataDash desktop senders are supported",
+                               sender_data.get('device_type'), address[0])
+    except (OSError, ValueError) as e:
+        output.summary('received', False, 0, 0, 0.0, f"No sender connected: {e}")
+        return EXIT_FAILED
+    finally:
+        discovery_stopped.set()
+    logger.info("Receiving from %s", address[0])
+
+    worker = ReceiveWorkerPython(address[0], save_directory=dest)
+    finished = threading.Event()
+    errors = []
+    encrypted_files = []
+    worker.transfer_finished.connect(finished.set, Qt.ConnectionType.DirectConnection)
+    worker.error_occurred.connect(lambda title, message, details: errors.append(f"{title}: {message}"),
+                                  Qt.ConnectionType.DirectConnection)
+    password_requests = []
+
+    def on_password_required(file_name, attempts_left):
+        # There is nobody to ask again, a second request means the password was wrong
+        if args.password is None or password_requests:
+            if not password_requests or password_requests[-1] is not None:
+                errors.append("The transfer is encrypted and " +
+                              ("the password is wrong" if args.password else "no --password was given"))
+            password_requests.append(None)
+            worker.set_password(None)
+        else:
+            password_requests.append(args.password)
+            worker.set_password(args.password)
+
+    worker.password_required.connect(on_password_required, Qt.ConnectionType.DirectConnection)
+    worker.decrypt_signal.connect(encrypted_files.extend, Qt.ConnectionType.DirectConnection)
+    started = time.time()
+    with ProgressReporter(worker, output, lambda: worker.total_bytes_received,
+                          lambda: worker.start_time or started):
+        try:
+            worker.run()
+        except Exception as e:
+            logger.error("Command line receive failed: %s", e)
+            errors.append(str(e))
+    if encrypted_files:
+        logger.warning("%d files were received encrypted, decrypt them in the app", len(encrypted_files))
+    ok = finished.is_set() and not errors
+    error = "; ".join(errors) if errors else (None if ok else "The sender stopped before the transfer was complete")
+    output.summary('received', ok, worker.files_received, worker.total_bytes_received,
+                   time.time() - (worker.start_time or started), error)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def parse_args(argv):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true', help="print progress and the summary as JSON lines")
+    common.add_argument('--log-level', default='WARNING',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="least severe messages logged")
+    parser = argparse.ArgumentParser(prog='DataDash', description="Send or receive files without the GUI.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    send_parser = commands.add_parser('send', parents=[common],
+                                      help="send files and folders to a DataDash receiver")
+    send_parser.add_argument('host', help="address of the receiver")
+    send_parser.add_argument('paths', nargs='+', help="files and folders to send")
+    send_parser.add_argument('--password', help="encrypt the transfer with this password")
+    send_parser.add_argument('--timeout', type=float, default=30, help="seconds to wait for the receiver")
+
+    receive_parser = commands.add_parser('receive', parents=[common], help="receive one transfer from a DataDash sender")
+    receive_parser.add_argument('--dest', default=os.curdir,
+                                help="folder to save to, created if missing, the current directory by default")
+    receive_parser.add_argument('--password', help="password of encrypted transfers")
+    receive_parser.add_argument('--timeout', type=float, default=None, help="seconds to wait for a sender")
+    receive_parser.add_argument('--name', help="name shown to senders, the configured one by default")
+    receive_parser.add_argument('--no-discovery', action='store_true', help="do not answer discovery broadcasts")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    logger.setLevel(getattr(logging, args.log_level))
+    app = QCoreApplication.instance() or QCoreApplication([sys.argv[0]])
+    output = Output(args.json)
+    try:
+        return send(args, output) if args.command == 'send' else receive(args, output)
+    finally:
+        stop_logging_thread()
@@ -0,0 +1,223 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+from loges import logger
+from transfer_io import recv_exact
+from read_ahead import advise
+
+# zstd and lz4 are optional, zlib is always there as the fallback codec
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# A compressed file is sent with flag 'encyp: z', the usual name and size (the
+# uncompressed size), a codec id <B and frames of
+#   stored_size <I | raw_size <I | stored_size bytes
+# until raw_size adds up to the file size. A frame that did not shrink is
+# stored as is, which the receiver recognises by stored_size == raw_size.
+COMPRESS_FRAME_SIZE = 1024 * 1024
+COMPRESS_MIN_FILE_SIZE = 4 * 1024
+# Frames are only worth compressing if they shrink below this ratio
+COMPRESS_MAX_RATIO = 0.9
+# After this many frames a file that does not compress is sent stored
+_PROBE_FRAMES = 4
+_QUEUE_DEPTH = 4
+_FRAME_HEADER = struct.Struct('<II')
+
+# Extensions whose content is already compressed
+INCOMPRESSIBLE_EXTENSIONS = {
+    '.7z', '.aac', '.apk', '.avi', '.br', '.bz2', '.cab', '.dmg', '.docx', '.epub', '.flac', '.gif',
+    '.gz', '.heic', '.heif', '.ipa', '.jar', '.jpeg', '.jpg', '.lz4', '.lzma', '.m4a', '.m4v', '.mkv',
+    '.mov', '.mp3', '.mp4', '.odt', '.ogg', '.opus', '.png', '.pptx', '.rar', '.tgz', '.webm',
+    '.webp', '.wmv', '.xlsx', '.xz', '.zip', '.zst',
+}
+
+
+# decompress(data, size) never returns more than size + 1 bytes, whatever the
+# frame claims, a frame that inflates beyond its raw size is cut off there and
+# fails the size check instead of exhausting memory
+def _zstd_codec():
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+    # decompress() trusts the content size in the frame header, a bounded read does not
+    return compressor.compress, lambda data, size: decompressor.stream_reader(data).read(size + 1)
+
+
+def _lz4_codec():
+    return lz4_frame.compress, lambda data, size: lz4_frame.LZ4FrameDecompressor().decompress(data, size + 1)
+
+
+def _zlib_codec():
+    return lambda data: zlib.compress(data, 1), lambda data, size: zlib.decompressobj().decompress(data, size + 1)
+
+
+# name: (wire id, factory returning (compress, decompress)), in order of preference
+_CODECS = {}
+if zstandard is not None:
+    _CODECS['zstd'] = (1, _zstd_codec)
+if lz4_frame is not None:
+    _CODECS['lz4'] = (2, _lz4_codec)
+_CODECS['zlib'] = (3, _zlib_codec)
+_CODEC_NAMES = {codec_id: name for name, (codec_id, _) in _CODECS.items()}
+
+
+def available_codecs():
+    """Codecs this installation supports, most preferred first."""
+    return list(_CODECS)
+
+
+def negotiate_codec(remote_codecs):
+    """Pick the first local codec the peer supports too, or None."""
+    for name in _CODECS:
+        if name in (remote_codecs or []):
+            return name
+    return None
+
+
+class CompressionPolicy:
+    """Decides per file whether compression is worth it and learns from the result.
+
+    Known compressed formats are never compressed. Extensions whose files turn
+    out not to shrink during this session are remembered and skipped as well.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.poor_extensions = set()
+
+    def should_compress(self, file_path, file_size):
+        if self.codec is None or file_size < COMPRESS_MIN_FILE_SIZE:
+            return False
+        extension = os.path.splitext(file_path)[1].lower()
+        return extension not in INCOMPRESSIBLE_EXTENSIONS and extension not in self.poor_extensions
+
+    def record(self, file_path, raw_size, stored_size):
+        if raw_size and stored_size > raw_size * COMPRESS_MAX_RATIO:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension:
+                logger.debug("%s files do not compress, sending them stored", extension)
+                self.poor_extensions.add(extension)
+
+
+class FrameCompressor:
+    """Reads and compresses a file in a worker thread, one frame ahead of the socket.
+
+    Iterating yields (frame, raw_size) pairs ready to be sent, so compression of
+    the next frames overlaps with sending the current one. The uncompressed data
+    is fed to hasher, if one is given, as it is read.
+    """
+
+    def __init__(self, file_path, codec, hasher=None):
+        self.file_path = file_path
+        self.codec_id, factory = _CODECS[codec]
+        self.compress = factory()[0]
+        self.hasher = hasher
+        self.frames = queue.Queue(_QUEUE_DEPTH)
+        self.raw_size = 0
+        self.stored_size = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            compressing = True
+            frames = 0
+            with open(self.file_path, 'rb') as f:
+                advise(f)
+                while not self.stopped:
+                    data = f.read(COMPRESS_FRAME_SIZE)
+                    if not data:
+                        break
+                    if self.hasher:
+                        self.hasher.update(data)
+                    stored = self.compress(data) if compressing else data
+                    if len(stored) >= len(data):
+                        stored = data
+                    self.raw_size += len(data)
+                    self.stored_size += len(stored)
+                    frames += 1
+                    if compressing and frames == _PROBE_FRAMES and self.stored_size > self.raw_size * COMPRESS_MAX_RATIO:
+                        # Not shrinking enough to pay for the CPU, store the rest
+                        compressing = False
+                    self.frames.put((_FRAME_HEADER.pack(len(stored), len(data)) + stored, len(data)))
+            self.frames.put(None)
+        except Exception as e:
+            self.frames.put(e)
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """Stop the worker, also when the transfer is aborted half way."""
+        self.stopped = True
+        while self.thread.is_alive():
+            try:
+                self.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def receive_compressed(sock, f, codec_id, file_size, on_chunk=None, hasher=None):
+    """Receive the frames of a compressed file from sock and write the data to f.
+
+    Frames are decompressed and written in a worker thread while the next ones
+    are received, hasher sees the decompressed data. on_chunk(n) is called with
+    the uncompressed size of every frame as it arrives.
+    """
+    name = _CODEC_NAMES.get(codec_id)
+    if name is None:
+        raise ValueError(f"Unsupported compression codec {codec_id}")
+    decompress = _CODECS[name][1]()[1]
+    frames = queue.Queue(_QUEUE_DEPTH)
+    errors = []
+
+    def write_frames():
+        while True:
+            item = frames.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            stored, raw_size = item
+            try:
+                data = stored if len(stored) == raw_size else decompress(bytes(stored), raw_size)
+                if len(data) != raw_size:
+                    raise ValueError("Compressed frame has the wrong size")
+                f.write(data)
+                if hasher:
+                    hasher.update(data)
+            except Exception as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=write_frames, daemon=True)
+    writer.start()
+    received = 0
+    try:
+        while received < file_size and not errors:
+            stored_size, raw_size = _FRAME_HEADER.unpack(recv_exact(sock, _FRAME_HEADER.size))
+            if raw_size == 0 or raw_size > COMPRESS_FRAME_SIZE or stored_size > raw_size:
+                raise ValueError("Malformed compressed frame")
+            frames.put((recv_exact(sock, stored_size), raw_size))
+            received += raw_size
+            if on_chunk:
+                on_chunk(raw_size)
+    finally:
+        frames.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+    return received
@@ -1,10 +1,80 @@
 import json
 import platform
 import os
+import threading
 from PyQt6.QtCore import QThread, pyqtSignal
 from loges import logger
 
+
+class _ConfigStore:
+    """Process-wide copy of .config.json behind ConfigManager.shared().
+
+    The file is read once and read again only when its mtime or size changed,
+    every other get() is served from memory. Writes replace the file
+    atomically and are emitted once, as config_updated of the shared manager.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.path = None
+        self.data = None
+        self.signature = None
+        # The file is checked and migrated once per process, see ConfigManager.ensure_checked()
+        self.checked = False
+        self.manager = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, log):
+        """Return a copy of the configuration, {} if there is no config file."""
+        with self.lock:
+            signature = self._signature()
+            if signature != self.signature or self.data is None:
+                changed = self.data is not None
+                try:
+                    with open(self.path, 'r') as file:
+                        self.data = json.load(file)
+                    log(f"Loaded configuration from {self.path}")
+                except FileNotFoundError:
+                    log(f"Configuration file {self.path} not found. Returning empty config.")
+                    self.data = {}
+                self.signature = signature
+                if changed and signature is not None:
+                    # Changed on disk by someone else
+                    self.notify(self.data)
+            return dict(self.data)
+
+    def write(self, data):
+        with self.lock:
+            # Per process, the app and a command line transfer may write at the same time
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file, indent=4)
+            os.replace(tmp_path, self.path)
+            self.data = dict(data)
+            self.signature = self._signature()
+        self.notify(data)
+
+    def notify(self, data):
+        if self.manager is not None:
+            self.manager.config_updated.emit(dict(data))
+
+
+_store = _ConfigStore()
+
+
 class ConfigManager(QThread):
+    """Handle on the process-wide configuration.
+
+    Windows and workers share the instance returned by shared() and connect to
+    its signals. MainApp starts its thread once at startup, run() creates or
+    migrates the config file there and emits config_ready.
+    """
     config_updated = pyqtSignal(dict)
     config_ready = pyqtSignal()
     log_message = pyqtSignal(str)
@@ -13,7 +83,19 @@ class ConfigManager(QThread):
         super().__init__()
         self.config_file_name = ".config.json"
         self.current_version = "4.4.1"
-        self.config_file = self.get_config_file_path()
+        with _store.lock:
+            if _store.path is None:
+                _store.path = self.get_config_file_path()
+        self.config_file = _store.path
+
+    @classmethod
+    def shared(cls):
+        """Return the ConfigManager of this process, created on first use."""
+        with _store.lock:
+            if _store.manager is None:
+                _store.manager = cls()
+                _store.manager.log_message.connect(logger.info)
+            return _store.manager
 
     def get_config_file_path(self):
         if platform.system() == 'Windows':
@@ -49,22 +131,30 @@ class ConfigManager(QThread):
         return file_path
 
     def write_config(self, data):
-        with open(self.config_file, 'w') as file:
-            json.dump(data, file, indent=4)
+        _store.write(data)
         self.log_message.emit(f"Configuration written to {self.config_file}")
-        self.config_updated.emit(data)
 
     def get_config(self):
-        try:
-            with open(self.config_file, 'r') as file:
-                data = json.load(file)
-            self.log_message.emit(f"Loaded configuration from {self.config_file}")
-            return data
-        except FileNotFoundError:
-            self.log_message.emit(f"Configuration file {self.config_file} not found. Returning empty config.")
-            return {}
+        return _store.get(self.log_message.emit)
+
+    @property
+    def checked(self):
+        """Whether the config file was already created or migrated in this process."""
+        return _store.checked
+
+    def ensure_checked(self):
+        """Create or migrate the config file unless that was already done in this process."""
+        with _store.lock:
+            if not _store.checked:
+                self.check_config()
+                _store.checked = True
 
     def run(self):
+        self.ensure_checked()
+        self.config_ready.emit()
+
+    def check_config(self):
+        """Create the config file, or rewrite it with the defaults if it is from another version."""
         if not os.path.exists(self.config_file):
             file_path = self.get_default_path()
             default_config = {
@@ -74,6 +164,8 @@ class ConfigManager(QThread):
                 "max_filesize": 1000,
                 "encryption": False,
                 "swift_encryption": False,
+                # Only set in the config file: 0 tunes the stream count, 1 sends over one connection
+                "parallel_streams": 0,
                 "show_warning": True,
                 "check_update": True,
                 "update_channel": "stable"
@@ -89,6 +181,7 @@ class ConfigManager(QThread):
                 encryption = config_data.get("encryption", False)
                 channel = config_data.get("update_channel", "stable")
                 warnings = config_data.get("show_warning", True)
+                parallel_streams = config_data.get("parallel_streams", 0)
 
                 default_config = {
                     "version": self.current_version,
@@ -97,6 +190,7 @@ class ConfigManager(QThread):
                     "max_filesize": 1000,
                     "encryption": encryption,
                     "swift_encryption": False,
+                    "parallel_streams": parallel_streams,
                     "show_warning": warnings,
                     "check_update": True,
                     "update_channel": channel
@@ -105,4 +199,3 @@ class ConfigManager(QThread):
             else:
                 self.log_message.emit(f"Loaded configuration: {config_data}")
                 self.config_updated.emit(config_data)
-        self.config_ready.emit()
@@ -1,10 +1,15 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
+from cryptography.exceptions import InvalidTag
+from functools import lru_cache
 import os
 import base64
+import struct
 import sys
 from loges import logger
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QDialog, QLabel, QGridLayout, QPushButton, QApplication, QSpacerItem, QSizePolicy, QMessageBox
@@ -12,6 +17,18 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont, QColor, QScreen
 from PyQt6.QtWidgets import QGraphicsDropShadowEffect
 
+CRYPT_CHUNK_SIZE = 1024 * 1024
+
+# Framed AES-GCM stream used between desktop peers:
+#   magic(4) | salt(16) | file_nonce(16) | frame_size(4) | key_check_tag(16)
+# followed by frames of min(frame_size, remaining) ciphertext bytes + 16 byte tag.
+GCM_MAGIC = b'DDG1'
+GCM_FRAME_SIZE = 1024 * 1024
+GCM_TAG_SIZE = 16
+GCM_HEADER_SIZE = 4 + 16 + 16 + 4 + GCM_TAG_SIZE
+_GCM_CHECK_COUNTER = 0xFFFFFFFFFFFFFFFF
+
+@lru_cache(maxsize=8)
 def derive_key(key: str, salt: bytes) -> bytes:
     """Derive a key using PBKDF2HMAC."""
     kdf = PBKDF2HMAC(
@@ -23,45 +40,201 @@ def derive_key(key: str, salt: bytes) -> bytes:
     )
     return kdf.derive(key.encode())
 
-def encrypt_file(filepath: str, key: str):
-    salt = os.urandom(16)
-    derived_key = derive_key(key, salt)
-
-    with open(filepath, 'rb') as f:
-        data = f.read()
-
-    padder = padding.PKCS7(128).padder()
-    padded_data = padder.update(data) + padder.finalize()
-    #com.an.Datadash
-
-    iv = os.urandom(16)
-    cipher = Cipher(algorithms.AES(derived_key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
+def _file_key(master_key: bytes, file_nonce: bytes) -> bytes:
+    """Derive the per-file AES-GCM key, so frame counters can restart at zero for every file."""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'DataDash file key' + file_nonce,
+        backend=default_backend()
+    )
+    return hkdf.derive(master_key)
+
+def _gcm_nonce(counter: int) -> bytes:
+    return struct.pack('>IQ', 0, counter)
+
+def _gcm_aad(header_prefix: bytes, final: bool) -> bytes:
+    return header_prefix + (b'\x01' if final else b'\x00')
+
+def cbc_stream_size(plain_size: int) -> int:
+    """Size of the legacy salt + iv + AES-CBC(PKCS7) stream for plain_size bytes."""
+    return 32 + (plain_size // 16 + 1) * 16
+
+def gcm_stream_size(plain_size: int, frame_size: int = GCM_FRAME_SIZE) -> int:
+    """Size of the framed AES-GCM stream for plain_size bytes."""
+    frames = max(1, -(-plain_size // frame_size))
+    return GCM_HEADER_SIZE + plain_size + frames * GCM_TAG_SIZE
+
+class CBCEncryptReader:
+    """Read-only file object yielding the legacy .crypt stream of a file.
+
+    The salt + iv + AES-CBC format matches encrypt_file and the mobile apps, but
+    the ciphertext is produced on the fly so no temporary copy is written.
+    """
+
+    def __init__(self, filepath: str, key: str):
+        salt = os.urandom(16)
+        iv = os.urandom(16)
+        cipher = Cipher(algorithms.AES(derive_key(key, salt)), modes.CBC(iv), backend=default_backend())
+        self.encryptor = cipher.encryptor()
+        self.padder = padding.PKCS7(128).padder()
+        self.file = open(filepath, 'rb')
+        self.size = cbc_stream_size(os.path.getsize(filepath))
+        self.pending = salt + iv
+        self.offset = 0
+        self.finished = False
+
+    def seek(self, offset):
+        if offset != 0 or self.offset or self.finished:
+            raise ValueError("Encrypted streams can only be read from the start")
+
+    def read(self, n=CRYPT_CHUNK_SIZE):
+        while self.offset >= len(self.pending):
+            if self.finished:
+                return b''
+            data = self.file.read(CRYPT_CHUNK_SIZE)
+            if data:
+                self.pending = self.encryptor.update(self.padder.update(data))
+            else:
+                self.pending = self.encryptor.update(self.padder.finalize()) + self.encryptor.finalize()
+                self.finished = True
+            self.offset = 0
+        out = self.pending[self.offset:self.offset + n]
+        self.offset += len(out)
+        return out
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class GCMEncryptReader:
+    """Read-only file object yielding the framed AES-GCM stream of a file.
+
+    Frames are encrypted as the socket asks for them, so memory use is bounded
+    by one frame regardless of file size. Pass the same salt for every file of a
+    transfer so the password is only run through PBKDF2 once.
+    """
+
+    def __init__(self, filepath: str, key: str, salt: bytes, frame_size: int = GCM_FRAME_SIZE):
+        file_nonce = os.urandom(16)
+        self.aead = AESGCM(_file_key(derive_key(key, salt), file_nonce))
+        self.header_prefix = GCM_MAGIC + salt + file_nonce + struct.pack('<I', frame_size)
+        self.frame_size = frame_size
+        self.file = open(filepath, 'rb')
+        plain_size = os.path.getsize(filepath)
+        self.frames = max(1, -(-plain_size // frame_size))
+        self.size = gcm_stream_size(plain_size, frame_size)
+        self.counter = 0
+        check_tag = self.aead.encrypt(_gcm_nonce(_GCM_CHECK_COUNTER), b'', self.header_prefix)
+        self.pending = self.header_prefix + check_tag
+        self.offset = 0
+
+    def seek(self, offset):
+        if offset != 0 or self.offset or self.counter:
+            raise ValueError("Encrypted streams can only be read from the start")
+
+    def read(self, n=GCM_FRAME_SIZE):
+        while self.offset >= len(self.pending):
+            if self.counter >= self.frames:
+                return b''
+            final = self.counter == self.frames - 1
+            data = self.file.read(self.frame_size)
+            self.pending = self.aead.encrypt(_gcm_nonce(self.counter), data, _gcm_aad(self.header_prefix, final))
+            self.counter += 1
+            self.offset = 0
+        out = self.pending[self.offset:self.offset + n]
+        self.offset += len(out)
+        return out
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class GCMDecryptWriter:
+    """Write-only file object that decrypts a framed AES-GCM stream into f.
+
+    header is the GCM_HEADER_SIZE bytes that start the stream and stream_size the
+    total stream length announced by the sender. Raises ValueError straight away
+    if key is not the password the stream was encrypted with.
+    """
+
+    def __init__(self, f, header: bytes, key: str, stream_size: int):
+        header = bytes(header)
+        if len(header) != GCM_HEADER_SIZE or header[:4] != GCM_MAGIC:
+            raise ValueError("Not a DataDash encrypted stream")
+        self.header_prefix = header[:40]
+        salt = header[4:20]
+        file_nonce = header[20:36]
+        self.frame_size = struct.unpack('<I', header[36:40])[0]
+        self.aead = AESGCM(_file_key(derive_key(key, salt), file_nonce))
+        try:
+            self.aead.decrypt(_gcm_nonce(_GCM_CHECK_COUNTER), header[40:], self.header_prefix)
+        except InvalidTag:
+            raise ValueError("Incorrect password")
+
+        payload = stream_size - GCM_HEADER_SIZE
+        self.frames = max(1, -(-payload // (self.frame_size + GCM_TAG_SIZE)))
+        self.plain_size = payload - self.frames * GCM_TAG_SIZE
+        self.f = f
+        self.counter = 0
+        self.frame = bytearray(self.frame_size + GCM_TAG_SIZE)
+        self.filled = 0
+
+    def _frame_length(self):
+        plain = min(self.frame_size, self.plain_size - self.counter * self.frame_size)
+        return plain + GCM_TAG_SIZE
+
+    def write(self, data):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            if self.counter >= self.frames:
+                raise ValueError("Unexpected data after the end of the encrypted stream")
+            frame_length = self._frame_length()
+            take = min(frame_length - self.filled, len(view) - pos)
+            self.frame[self.filled:self.filled + take] = view[pos:pos + take]
+            self.filled += take
+            pos += take
+            if self.filled == frame_length:
+                final = self.counter == self.frames - 1
+                try:
+                    plain = self.aead.decrypt(_gcm_nonce(self.counter), bytes(self.frame[:frame_length]),
+                                              _gcm_aad(self.header_prefix, final))
+                except InvalidTag:
+                    raise ValueError(f"Encrypted frame {self.counter} failed authentication")
+                self.f.write(plain)
+                self.counter += 1
+                self.filled = 0
+        return len(view)
+
+    def finish(self):
+        """Raise ValueError unless every frame of the stream has been decrypted."""
+        if self.counter != self.frames or self.filled:
+            raise ValueError("Encrypted stream ended early")
 
-    with open(filepath + '.crypt', 'wb') as f:
-        f.write(salt + iv + encrypted_data)
+def encrypt_file(filepath: str, key: str):
+    with CBCEncryptReader(filepath, key) as reader, open(filepath + '.crypt', 'wb') as f:
+        #com.an.Datadash
+        while True:
+            data = reader.read(CRYPT_CHUNK_SIZE)
+            if not data:
+                break
+            f.write(data)
 
     return filepath + '.crypt'
 
 def decrypt_file(filepath: str, key: str):
-    with open(filepath, 'rb') as f:
-        data = f.read()
-
-    salt = data[:16]
-    iv = data[16:32]
-    encrypted_data = data[32:]
-    #com.an.Datadash
-
-    derived_key = derive_key(key, salt)
-
-    cipher = Cipher(algorithms.AES(derived_key), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    padded_data = decryptor.update(encrypted_data) + decryptor.finalize()
-
-    unpadder = padding.PKCS7(128).unpadder()
-    decrypted_data = unpadder.update(padded_data) + unpadder.finalize()
-
     directory = os.path.dirname(filepath)
     original_name, extension = os.path.splitext(os.path.basename(filepath.replace('.crypt', '')))
     file_name = f"{original_name}{extension}"
@@ -73,8 +246,28 @@ def decrypt_file(filepath: str, key: str):
         #com.an.Datadash
 
     output_file_path = os.path.join(directory, file_name)
-    with open(output_file_path, 'wb') as f:
-        f.write(decrypted_data)
+    with open(filepath, 'rb') as src:
+        salt = src.read(16)
+        iv = src.read(16)
+        #com.an.Datadash
+
+        derived_key = derive_key(key, salt)
+
+        cipher = Cipher(algorithms.AES(derived_key), modes.CBC(iv), backend=default_backend())
+        decryptor = cipher.decryptor()
+        unpadder = padding.PKCS7(128).unpadder()
+
+        try:
+            with open(output_file_path, 'wb') as f:
+                while True:
+                    data = src.read(CRYPT_CHUNK_SIZE)
+                    if not data:
+                        break
+                    f.write(unpadder.update(decryptor.update(data)))
+                f.write(unpadder.update(decryptor.finalize()) + unpadder.finalize())
+        except Exception:
+            os.remove(output_file_path)
+            raise
 
 
 class Decryptor(QWidget):
@@ -413,6 +606,51 @@ class Decryptor(QWidget):
         #com.an.Datadash
 
 
+class PasswordDialog(QDialog):
+    """Modal prompt for the password of an encrypted transfer that is decrypted while it is received."""
+    set_background = Decryptor.set_background
+    style_button = Decryptor.style_button
+    style_label = Decryptor.style_label
+    style_input = Decryptor.style_input
+    center_window = Decryptor.center_window
+
+    def __init__(self, file_name, attempts_left, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Decryptor')
+        self.setModal(True)
+        self.setFixedSize(400, 200)
+        self.set_background()
+        self.center_window()
+
+        layout = QVBoxLayout()
+        layout.setSpacing(0)
+        layout.setContentsMargins(30, 20, 30, 20)
+
+        self.password_label = QLabel(f'Password for {os.path.basename(file_name)}:', self)
+        self.style_label(self.password_label)
+        layout.addWidget(self.password_label)
+
+        self.attempts_label = QLabel(f'Remaining attempts: {attempts_left}', self)
+        self.attempts_label.setStyleSheet("color: #FFFFFF; background-color: transparent; font-size: 14px;")
+        layout.addWidget(self.attempts_label)
+
+        self.password_input = QLineEdit(self)
+        self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
+        self.style_input(self.password_input)
+        layout.addWidget(self.password_input)
+
+        self.submit_button = QPushButton('Submit', self)
+        self.style_button(self.submit_button)
+        layout.addWidget(self.submit_button, alignment=Qt.AlignmentFlag.AlignCenter)
+
+        self.submit_button.clicked.connect(self.accept)
+        self.password_input.returnPressed.connect(self.accept)
+        self.setLayout(layout)
+
+    def getPassword(self):
+        return self.password_input.text()
+
+
 # if __name__ == '__main__':
 #     app = QApplication(sys.argv)
 #     dialog = PasswordDialog()
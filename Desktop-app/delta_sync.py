@@ -0,0 +1,221 @@
+import hashlib
+import os
+import struct
+import zlib
+from loges import logger
+from transfer_io import recv_exact
+
+# Delta sync of folders the receiver already holds an earlier copy of.
+#
+# After the metadata of a folder the sender asks with 'encyp: d' for the
+# signatures of that copy. The receiver answers with size <Q and
+#   file_count <I, per file path_size <H | path | chunk_count <I | chunks
+# where every chunk is length <I | digest (16 bytes), in file order. A file is
+# then sent with flag 'encyp: e', the usual name and size and a stream of ops
+#   copy:    1 <B | basis_offset <Q | length <Q
+#   literal: 2 <B | length <I | length bytes
+#   end:     0 <B
+# which the receiver applies to the earlier copy to rebuild the new file.
+#
+# Chunk boundaries are content defined, so an insertion only changes the
+# chunks around it instead of shifting every block after it. A boundary falls
+# after a byte whose DELTA_WINDOW byte window has a gear sum of 0 mod 256 and a
+# CRC32 with its low bits clear. The window sums of a whole buffer are built
+# with shifts of one big integer and searched with find(), so the scanning is
+# done in C. Files are read in _SCAN_SIZE steps and never have to fit in
+# memory.
+DELTA_MIN_CHUNK = 16 * 1024
+DELTA_MAX_CHUNK = 256 * 1024
+DELTA_WINDOW = 32
+DELTA_DIGEST_SIZE = 16
+# Every odd gear value keeps runs of one repeated byte from matching everywhere
+_GEAR = bytes(hashlib.sha256(bytes([b])).digest()[0] | 1 for b in range(256))
+_WINDOW_SHIFTS = (16, 32, 64, 128, 256)
+_CRC_MASK = 0x7f
+# Periodic data matches the gear sum at every position, give up after this many
+_MAX_CANDIDATES = 1024
+# Bytes read and scanned per pass
+_SCAN_SIZE = 4 * 1024 * 1024
+
+_OP_END = 0
+_OP_COPY = 1
+_OP_LITERAL = 2
+_COPY = struct.Struct('<BQQ')
+_LITERAL = struct.Struct('<BI')
+_COUNT = struct.Struct('<I')
+_PATH = struct.Struct('<H')
+_CHUNK = struct.Struct('<I')
+_COPY_BLOCK = 1024 * 1024
+
+
+def _window_sums(data):
+    """Return, per byte of data, the low byte of the gear sum of the window ending there."""
+    lanes = bytearray(2 * len(data))
+    lanes[0::2] = data.translate(_GEAR)
+    # One 16 bit lane per byte, sums of 32 gear values cannot overflow into the next lane
+    value = int.from_bytes(lanes, 'little')
+    for shift in _WINDOW_SHIFTS:
+        value += value << shift
+    return value.to_bytes(len(lanes) + 2 * DELTA_WINDOW, 'little')[:len(lanes):2]
+
+
+def _cut_point(data, sums, start):
+    """Return the end of the chunk of data that begins at start."""
+    limit = min(len(data), start + DELTA_MAX_CHUNK)
+    if limit - start <= DELTA_MIN_CHUNK:
+        return limit
+    position = start + DELTA_MIN_CHUNK - 1
+    for _ in range(_MAX_CANDIDATES):
+        position = sums.find(0, position, limit)
+        if position < 0:
+            return limit
+        end = position + 1
+        if zlib.crc32(data[end - DELTA_WINDOW:end]) & _CRC_MASK == 0:
+            return end
+        position += 1
+    return position
+
+
+def iter_chunks(f):
+    """Yield the content-defined chunks of the open file f in order."""
+    buffer = b''
+    eof = False
+    while True:
+        if not eof:
+            data = f.read(_SCAN_SIZE)
+            eof = not data
+            buffer += data
+        if not buffer:
+            return
+        # Window sums only depend on the bytes in the window, so one pass per read covers many chunks
+        sums = _window_sums(buffer)
+        start = 0
+        while start < len(buffer) and (eof or len(buffer) - start >= DELTA_MAX_CHUNK):
+            end = _cut_point(buffer, sums, start)
+            yield buffer[start:end]
+            start = end
+        buffer = buffer[start:]
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=DELTA_DIGEST_SIZE).digest()
+
+
+def file_signature(file_path):
+    """Return the (digest, length) pairs of the chunks of file_path."""
+    with open(file_path, 'rb') as f:
+        return [(chunk_digest(chunk), len(chunk)) for chunk in iter_chunks(f)]
+
+
+def encode_signatures(signatures):
+    """Encode {relative_path: [(digest, length)]} for the wire."""
+    parts = [_COUNT.pack(len(signatures))]
+    for relative_path, chunks in signatures.items():
+        path_bytes = relative_path.encode('utf-8')
+        parts.append(_PATH.pack(len(path_bytes)))
+        parts.append(path_bytes)
+        parts.append(_COUNT.pack(len(chunks)))
+        for digest, length in chunks:
+            parts.append(_CHUNK.pack(length))
+            parts.append(digest)
+    return b''.join(parts)
+
+
+def decode_signatures(data):
+    """Decode signatures into {relative_path: {digest: (basis_offset, length)}}."""
+    view = memoryview(data)
+    count = _COUNT.unpack_from(view, 0)[0]
+    offset = _COUNT.size
+    signatures = {}
+    for _ in range(count):
+        path_size = _PATH.unpack_from(view, offset)[0]
+        offset += _PATH.size
+        relative_path = bytes(view[offset:offset + path_size]).decode('utf-8')
+        offset += path_size
+        chunk_count = _COUNT.unpack_from(view, offset)[0]
+        offset += _COUNT.size
+        chunks = {}
+        basis_offset = 0
+        for _ in range(chunk_count):
+            length = _CHUNK.unpack_from(view, offset)[0]
+            digest = bytes(view[offset + _CHUNK.size:offset + _CHUNK.size + DELTA_DIGEST_SIZE])
+            offset += _CHUNK.size + DELTA_DIGEST_SIZE
+            chunks.setdefault(digest, (basis_offset, length))
+            basis_offset += length
+        signatures[relative_path] = chunks
+    return signatures
+
+
+def send_delta(sock, file_path, chunks, on_progress=None, hasher=None):
+    """Send file_path as ops against the receiver's copy described by chunks.
+
+    Chunks the receiver already has become copy ops, consecutive ones are merged
+    into a single op. Returns the number of literal bytes sent.
+    """
+    literal_bytes = 0
+    copy_offset = copy_length = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter_chunks(f):
+            if hasher:
+                hasher.update(chunk)
+            match = chunks.get(chunk_digest(chunk))
+            if match and match[1] == len(chunk):
+                if copy_length and copy_offset + copy_length == match[0]:
+                    copy_length += len(chunk)
+                else:
+                    if copy_length:
+                        sock.sendall(_COPY.pack(_OP_COPY, copy_offset, copy_length))
+                    copy_offset, copy_length = match[0], len(chunk)
+            else:
+                if copy_length:
+                    sock.sendall(_COPY.pack(_OP_COPY, copy_offset, copy_length))
+                    copy_length = 0
+                sock.sendall(_LITERAL.pack(_OP_LITERAL, len(chunk)))
+                sock.sendall(chunk)
+                literal_bytes += len(chunk)
+            if on_progress:
+                on_progress(len(chunk))
+    if copy_length:
+        sock.sendall(_COPY.pack(_OP_COPY, copy_offset, copy_length))
+    sock.sendall(bytes([_OP_END]))
+    logger.debug("Delta of %s sent with %d literal bytes", file_path, literal_bytes)
+    return literal_bytes
+
+
+def receive_delta(sock, f, basis_path, file_size, buffer, on_chunk=None, hasher=None):
+    """Rebuild a file into f from the ops on sock and the earlier copy at basis_path.
+
+    Literal data is received through buffer (a RecvBuffer or DiskWriter), copied ranges are
+    read from the basis in bounded blocks. Returns the number of bytes written.
+    """
+    written = 0
+    with open(basis_path, 'rb') as basis:
+        while True:
+            op = recv_exact(sock, 1)[0]
+            if op == _OP_END:
+                break
+            if op == _OP_COPY:
+                offset, length = struct.unpack('<QQ', recv_exact(sock, _COPY.size - 1))
+                basis.seek(offset)
+                remaining = length
+                while remaining:
+                    data = basis.read(min(_COPY_BLOCK, remaining))
+                    if not data:
+                        raise ValueError(f"{basis_path} changed during the delta transfer")
+                    f.write(data)
+                    if hasher:
+                        hasher.update(data)
+                    remaining -= len(data)
+                    if on_chunk:
+                        on_chunk(len(data))
+            elif op == _OP_LITERAL:
+                length = _CHUNK.unpack(recv_exact(sock, _CHUNK.size))[0]
+                buffer.recv_into_file(sock, f, length, on_chunk, hasher=hasher)
+            else:
+                raise ValueError(f"Unknown delta op {op}")
+            written = f.tell()
+            if written > file_size:
+                raise ValueError("Delta rebuilt more data than the file size")
+    if written != file_size:
+        raise ValueError(f"Delta rebuilt {written} of {file_size} bytes")
+    return written
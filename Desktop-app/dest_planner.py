@@ -0,0 +1,110 @@
+import os
+import sys
+
+# Names differing only in case are the same file on Windows and macOS
+_name_key = str.casefold if sys.platform in ('win32', 'darwin') else str
+
+
+def join_inside(folder, relative_path):
+    """Join a relative path sent by the peer onto folder, ValueError if the result is not below folder."""
+    folder = os.path.abspath(folder)
+    path = os.path.normpath(os.path.join(folder, relative_path.replace('\\', '/')))
+    try:
+        inside = os.path.commonpath([folder, path]) == folder and path != folder
+    except ValueError:
+        # Another drive on Windows
+        inside = False
+    if not inside:
+        raise ValueError(f"{relative_path!r} points outside of {folder}")
+    return path
+
+
+class DestinationPlanner:
+    """Decides where received files go while touching the file system as little as possible.
+
+    Every directory is listed once with os.scandir, existence checks and name
+    collisions are then resolved against that listing in memory. Names handed
+    out and directories created are remembered for the rest of the transfer.
+    Receivers call forget() when a new transfer starts, as files may have been
+    decrypted, moved or deleted in between.
+    """
+
+    def __init__(self):
+        self.listings = {}
+        self.created = set()
+
+    def forget(self):
+        self.listings.clear()
+        self.created.clear()
+
+    def _names(self, directory):
+        names = self.listings.get(directory)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        names.add(_name_key(entry.name))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            self.listings[directory] = names
+        return names
+
+    def _mark(self, path):
+        """Record that path exists now, in the listing of its directory if that was read."""
+        directory, name = os.path.split(path)
+        names = self.listings.get(directory)
+        if names is not None:
+            names.add(_name_key(name))
+
+    def exists(self, path):
+        directory, name = os.path.split(os.path.normpath(path))
+        return _name_key(name) in self._names(directory)
+
+    def reserve(self, path):
+        """Claim path for a file about to be written, later lookups see it as taken."""
+        path = os.path.normpath(path)
+        self._names(os.path.dirname(path))
+        self._mark(path)
+
+    def unique_folder(self, folder_path):
+        """Return folder_path, or folder_path (i) with the first free i, and reserve it."""
+        candidate = folder_path
+        i = 1
+        while self.exists(candidate):
+            candidate = f"{folder_path} ({i})"
+            i += 1
+        self.reserve(candidate)
+        return candidate
+
+    def unique_file(self, file_path):
+        """Return file_path, or the first free name (i) before its extension, and reserve it."""
+        base, extension = os.path.splitext(file_path)
+        candidate = file_path
+        i = 1
+        while self.exists(candidate):
+            candidate = f"{base} ({i}){extension}"
+            i += 1
+        self.reserve(candidate)
+        return candidate
+
+    def makedirs(self, directory):
+        """Create directory and its parents, once per session."""
+        directory = os.path.normpath(directory)
+        if directory in self.created:
+            return
+        os.makedirs(directory, exist_ok=True)
+        while directory not in self.created:
+            self.created.add(directory)
+            self._mark(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+
+    def create_tree(self, destination_folder, relative_folders):
+        """Create the skeleton of relative_folders below destination_folder in one go."""
+        self.makedirs(destination_folder)
+        for folder in sorted(relative_folders):
+            if folder:
+                self.makedirs(os.path.join(destination_folder, folder))
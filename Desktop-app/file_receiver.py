@@ -10,13 +10,12 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QScreen, QMovie, QKeySequence, QKeyEvent
 from constant import ConfigManager
-from portsss import BROADCAST_PORT, LISTEN_PORT, RECEIVER_JSON
+from portsss import BROADCAST_PORT, LISTEN_PORT, RECEIVER_JSON, DESKTOP_FEATURES
+from compression import available_codecs
+from integrity import available_checksums
 from loges import logger
 from time import sleep
 import json
-from file_receiver_python import ReceiveAppP
-from file_receiver_android import ReceiveAppPJava
-from file_receiver_swift import ReceiveAppPSwift
 
 
 class FileReceiver(QThread):
@@ -34,8 +33,8 @@ class FileReceiver(QThread):
         self.server_socket = None
         self.client_socket = None
         self.receiver_worker = None
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
 
     def run(self):
         logger.info("Starting FileReceiver thread")
@@ -84,7 +83,10 @@ class FileReceiver(QThread):
         try:
             device_data = {
                 "device_type": "python",
-                "os": platform.system()
+                "os": platform.system(),
+                "features": DESKTOP_FEATURES,
+                "compression": available_codecs(),
+                "checksums": available_checksums()
             }
             device_data_json = json.dumps(device_data)
             logger.debug(f"Sending device data: {device_data}")
@@ -130,10 +132,9 @@ class ReceiveApp(QWidget):
     def __init__(self):
         super().__init__()
         logger.info("Initializing ReceiveApp")
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.initUI()
         self.setFixedSize(853, 480)
         #com.an.Datadash
@@ -322,18 +323,22 @@ class ReceiveApp(QWidget):
     def show_receive_app_p(self, sender_os):
         client_ip = self.file_receiver.client_ip
         self.hide()
+        # Each receiver is imported once the sender's platform is known, see main.py
+        from file_receiver_python import ReceiveAppP
         self.receive_app_p = ReceiveAppP(client_ip, sender_os)
         self.receive_app_p.show()
 
     def show_receive_app_p_java(self):
         client_ip = self.file_receiver.client_ip
         self.hide()
+        from file_receiver_android import ReceiveAppPJava
         self.receive_app_p_java = ReceiveAppPJava(client_ip)
         self.receive_app_p_java.show()
 
     def show_receive_app_p_swift(self):
         client_ip = self.file_receiver.client_ip
         self.hide()
+        from file_receiver_swift import ReceiveAppPSwift
         self.receive_app_p_swift = ReceiveAppPSwift(client_ip)
         self.receive_app_p_swift.show()
 
@@ -3,17 +3,21 @@ import socket
 import struct
 import json
 from loges import logger
+from progress_bus import ProgressBus
 from PyQt6 import QtCore
 from PyQt6.QtCore import QThread, pyqtSignal, Qt, QMetaObject, QTimer
 from PyQt6.QtWidgets import QMessageBox, QWidget, QVBoxLayout, QLabel, QProgressBar, QApplication, QPushButton, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QStyledItemDelegate, QSizePolicy
 from PyQt6.QtGui import QScreen, QMovie, QFont, QKeyEvent, QKeySequence
 from constant import ConfigManager
-from crypt_handler import decrypt_file, Decryptor
 import subprocess
 import platform
 import time
 import shutil
 from portsss import RECEIVER_DATA_ANDROID, CHUNK_SIZE_ANDROID
+from chunk_tuner import ChunkSizer, tune_socket_buffers
+from transfer_io import RecvBuffer, recv_exact, recv_flag
+from manifest import Manifest
+from dest_planner import DestinationPlanner
 
 class ProgressBarDelegate(QStyledItemDelegate):
     def paint(self, painter, option, index):
@@ -47,30 +51,32 @@ class ProgressBarDelegate(QStyledItemDelegate):
         return None  # Disable editing
 
 class ReceiveWorkerJava(QThread):
-    progress_update = pyqtSignal(int)  # Overall progress
-    file_progress_update = pyqtSignal(str, int)  # Individual file progress (filename, progress)
     decrypt_signal = pyqtSignal(list)
     receiving_started = pyqtSignal()
     transfer_finished = pyqtSignal()
     password = None
     update_files_table_signal = pyqtSignal(list)  # Add signal for updating files table
     file_renamed_signal = pyqtSignal(str, str)  # old_name, new_name
-    transfer_stats_update = pyqtSignal(float, float, float)
-    file_count_update = pyqtSignal(int, int, int)
+    transfer_stats_update = pyqtSignal(float, float, float, int)  # speed, eta, elapsed, chunk_size
 
     def __init__(self, client_ip):
         super().__init__()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
         self.client_skt = None
         self.server_skt = None
         self.server_skt = None
         self.encrypted_files = []
         self.broadcasting = True
         self.metadata = None
+        self.manifest = None
+        # Directories created and names taken in the destination during a transfer
+        self.planner = DestinationPlanner()
         self.destination_folder = None
         self.store_client_ip = client_ip
         self.base_folder_name = ''
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         logger.debug(f"Client IP address stored: {self.store_client_ip}")
         self.total_files = 0
         self.files_received = 0
@@ -109,6 +115,9 @@ class ReceiveWorkerJava(QThread):
             # Configure timeout
             self.server_skt.settimeout(60)
             
+            # Accepted sockets inherit the buffer sizes, set them before the handshake
+            tune_socket_buffers(self.server_skt, CHUNK_SIZE_ANDROID * 4)
+
             # Bind and listen
             self.server_skt.bind(('', RECEIVER_DATA_ANDROID))
             self.server_skt.listen(1)
@@ -131,6 +140,8 @@ class ReceiveWorkerJava(QThread):
         try:
             # Accept a connection from a client
             self.client_skt, self.client_address = self.server_skt.accept()
+            self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_ANDROID)
+            self.recv_buffer = RecvBuffer()
             print(f"Connected to {self.client_address}")
         except Exception as e:
             error_message = f"Failed to accept connection: {str(e)}"
@@ -174,7 +185,7 @@ class ReceiveWorkerJava(QThread):
         while True:
             try:
                 # Receive and decode encryption flag
-                encryption_flag = self.client_skt.recv(8).decode()
+                encryption_flag = recv_flag(self.client_skt).decode()
                 logger.debug("Received encryption flag: %s", encryption_flag)
 
                 if not encryption_flag:
@@ -188,13 +199,14 @@ class ReceiveWorkerJava(QThread):
                         self.decrypt_signal.emit(self.encrypted_files)
                     self.encrypted_files = []
                     logger.debug("Received halt signal. Stopping file reception.")
+                    self.progress.flush()
                     self.transfer_finished.emit()
                     break
                 else:
                     encrypted_transfer = False
 
                 # Receive file name size
-                file_name_size_data = self.client_skt.recv(8)
+                file_name_size_data = self._receive_data(self.client_skt, 8)
                 file_name_size = struct.unpack('<Q', file_name_size_data)[0]
                 logger.debug("File name size received: %d", file_name_size)
                 
@@ -208,13 +220,14 @@ class ReceiveWorkerJava(QThread):
                 logger.debug("Original file name: %s", file_name)
 
                 # Receive file size
-                file_size_data = self.client_skt.recv(8)
+                file_size_data = self._receive_data(self.client_skt, 8)
                 file_size = struct.unpack('<Q', file_size_data)[0]
 
                 try:
                     # Handle metadata.json
                     if file_name == 'metadata.json':
                         logger.debug("Receiving metadata file.")
+                        self.planner.forget()
                         self.metadata = self.receive_metadata(file_size)
                         is_folder_transfer = any(file_info.get('path', '').endswith('/')
                                                  for file_info in self.metadata)
@@ -238,59 +251,54 @@ class ReceiveWorkerJava(QThread):
                         full_file_path = os.path.join(self.destination_folder, os.path.basename(file_name))
 
                     # Ensure directory exists and handle duplicates
-                    os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+                    self.planner.makedirs(os.path.dirname(full_file_path))
                     full_file_path = self._get_unique_file_name(full_file_path)
                     logger.debug(f"Saving file to: {full_file_path}")
 
-                    # Receive file data
+                    def on_chunk(n):
+                        nonlocal received_size, received_total
+                        current_time = time.time()
+                        received_size += n
+                        received_total += n
+                        self.total_bytes_received = received_total
+                        self.total_received_bytes += n
+                        self.bytes_since_last_update += n
+
+                        # Calculate transfer statistics every 0.5 seconds
+                        if current_time - self.last_speed_update_time >= 0.5:
+                            elapsed_since_last = current_time - self.last_speed_update_time
+                            if elapsed_since_last > 0:
+                                current_speed = (self.bytes_since_last_update / (1024 * 1024)) / elapsed_since_last
+
+                                # Calculate ETA
+                                if current_speed > 0:
+                                    eta = (self.total_folder_size - self.total_received_bytes) / (current_speed * 1024 * 1024)
+                                else:
+                                    eta = 0
+
+                                elapsed = current_time - self.start_time
+                                self.transfer_stats_update.emit(current_speed, eta, elapsed, self.chunk_sizer.size)
+
+                            self.last_speed_update_time = current_time
+                            self.bytes_since_last_update = 0
+
+                        # For folder transfers, only update the overall folder progress
+                        if is_folder_transfer:
+                            folder_progress = int((self.total_received_bytes * 100) / self.total_folder_size)
+                            folder_progress = min(folder_progress, 100)
+                            self.progress.report_overall(folder_progress)
+                            self.progress.report_file(self.base_folder_name, folder_progress)
+                        else:
+                            # For individual files, update file-specific progress
+                            file_progress = int((received_size * 100) / file_size) if file_size > 0 else 0
+                            file_progress = min(file_progress, 100)
+                            self.progress.report_overall(file_progress)
+                            self.progress.report_file(os.path.basename(file_name), file_progress)
+
+                    # Receive file data straight from the reusable buffer to disk
+                    received_size = 0
                     with open(full_file_path, "wb") as f:
-                        received_size = 0
-                        remaining = file_size
-                        while remaining > 0:
-                            current_time = time.time()
-                            chunk_size = min(CHUNK_SIZE_ANDROID, remaining)
-                            data = self.client_skt.recv(chunk_size)
-                            if not data:
-                                raise ConnectionError("Connection lost during file reception.")
-                            f.write(data)
-                            received_size += len(data)
-                            remaining -= len(data)
-                            received_total += len(data)
-                            self.total_bytes_received = received_total
-                            self.total_received_bytes += len(data)
-                            self.bytes_since_last_update += len(data)
-
-                            # Calculate transfer statistics every 0.5 seconds
-                            if current_time - self.last_speed_update_time >= 0.5:
-                                elapsed_since_last = current_time - self.last_speed_update_time
-                                if elapsed_since_last > 0:
-                                    current_speed = (self.bytes_since_last_update / (1024 * 1024)) / elapsed_since_last
-                                    
-                                    # Calculate overall progress and ETA
-                                    overall_progress = self.total_received_bytes / self.total_folder_size
-                                    if current_speed > 0:
-                                        eta = (self.total_folder_size - self.total_received_bytes) / (current_speed * 1024 * 1024)
-                                    else:
-                                        eta = 0
-                                    
-                                    elapsed = current_time - self.start_time
-                                    self.transfer_stats_update.emit(current_speed, eta, elapsed)
-                                
-                                self.last_speed_update_time = current_time
-                                self.bytes_since_last_update = 0
-
-                            # For folder transfers, only update the overall folder progress
-                            if is_folder_transfer:
-                                folder_progress = int((self.total_received_bytes * 100) / self.total_folder_size)
-                                folder_progress = min(folder_progress, 100)
-                                self.progress_update.emit(folder_progress)
-                                self.file_progress_update.emit(self.base_folder_name, folder_progress)
-                            else:
-                                # For individual files, update file-specific progress
-                                file_progress = int((received_size * 100) / file_size) if file_size > 0 else 0
-                                file_progress = min(file_progress, 100)
-                                self.progress_update.emit(file_progress)
-                                self.file_progress_update.emit(os.path.basename(file_name), file_progress)
+                        self.recv_buffer.recv_into_file(self.client_skt, f, file_size, on_chunk, self.chunk_sizer)
 
                     if encrypted_transfer:
                         self.encrypted_files.append(full_file_path)
@@ -302,7 +310,7 @@ class ReceiveWorkerJava(QThread):
                         self.files_received += 1
                         files_pending = max(0, self.total_files - self.files_received)  # Ensure pending never goes negative
                         logger.debug(f"File received: {file_name}, Total: {self.total_files}, Received: {self.files_received}, Pending: {files_pending}")
-                        self.file_count_update.emit(self.total_files, self.files_received, files_pending)
+                        self.progress.report_counts(self.total_files, self.files_received, files_pending)
 
                 except Exception as e:
                     logger.error(f"Error saving file {file_name}: {str(e)}")
@@ -316,13 +324,7 @@ class ReceiveWorkerJava(QThread):
 
     def _receive_data(self, socket, size):
         """Helper function to receive a specific amount of data."""
-        received_data = b""
-        while len(received_data) < size:
-            chunk = socket.recv(size - len(received_data))
-            if not chunk:
-                raise ConnectionError("Connection closed before data was completely received.")
-            received_data += chunk
-        return received_data
+        return recv_exact(socket, size)
 
     def receive_metadata(self, file_size):
         """Receive metadata from the sender."""
@@ -330,7 +332,8 @@ class ReceiveWorkerJava(QThread):
         try:
             metadata_json = received_data.decode('utf-8')
             metadata = json.loads(metadata_json)
-            
+            self.manifest = Manifest.from_metadata(metadata)
+
             # Filter out:
             # 1. Empty dictionary entries
             # 2. Directories (paths ending with /)
@@ -358,7 +361,7 @@ class ReceiveWorkerJava(QThread):
                 not info['path'].endswith('.DS_Store')
             )
             
-            self.file_count_update.emit(self.total_files, 0, self.total_files)
+            self.progress.report_counts(self.total_files, 0, self.total_files)
             return metadata
             
         except UnicodeDecodeError as e:
@@ -375,19 +378,18 @@ class ReceiveWorkerJava(QThread):
         if not default_dir:
             raise ValueError("No save_to_directory configured")
         
-        # Extract base folder name from paths
-        base_folder_name = None
-        for file_info in metadata:
-            path = file_info.get('path', '')
-            if path.endswith('/'):
-                base_folder_name = path.rstrip('/').split('/')[0]
-                logger.debug("Found base folder name: %s", base_folder_name)
-                break
+        # The last entry names the base folder, folder paths may be relative to it
+        base_folder_name = metadata[-1].get('base_folder_name', '')
+        logger.debug("Base folder name from last metadata entry: %s", base_folder_name)
 
-        # If base folder name not found, use the last entry
+        # Otherwise extract it from the paths
         if not base_folder_name:
-            base_folder_name = metadata[-1].get('base_folder_name', '')
-            logger.debug("Base folder name from last metadata entry: %s", base_folder_name)
+            for file_info in metadata:
+                path = file_info.get('path', '')
+                if path.endswith('/'):
+                    base_folder_name = path.rstrip('/').split('/')[0]
+                    logger.debug("Found base folder name: %s", base_folder_name)
+                    break
 
         if not base_folder_name:
             raise ValueError("Base folder name not found in metadata")
@@ -397,10 +399,9 @@ class ReceiveWorkerJava(QThread):
         destination_folder = self._get_unique_folder_name(destination_folder)
         logger.debug("Destination folder: %s", destination_folder)
         
-        # Create the root folder if it does not exist
-        if not os.path.exists(destination_folder):
-            os.makedirs(destination_folder)
-            logger.debug("Created root folder: %s", destination_folder)
+        # Create the root folder
+        self.planner.makedirs(destination_folder)
+        logger.debug("Created root folder: %s", destination_folder)
         
         # Store base folder name for use in receive_files
         self.base_folder_name = base_folder_name
@@ -409,31 +410,17 @@ class ReceiveWorkerJava(QThread):
 
     def _get_unique_folder_name(self, folder_path):
         """Append a unique (i) to folder name if it already exists."""
-        base_folder_path = folder_path
-        i = 1
-        while os.path.exists(folder_path):
-            folder_path = f"{base_folder_path} ({i})"
-            i += 1
-        return folder_path
+        return self.planner.unique_folder(folder_path)
 
     def _get_unique_file_name(self, file_path):
         """Append a unique (i) to file name if it already exists."""
-        base, extension = os.path.splitext(file_path)
-        i = 1
-        new_file_path = file_path
-        while os.path.exists(new_file_path):
-            new_file_path = f"{base} ({i}){extension}"
-            i += 1
-        return new_file_path
+        return self.planner.unique_file(file_path)
     #com.an.Datadash
 
 
     def get_relative_path_from_metadata(self, file_name):
         """Get the relative path of a file from the metadata."""
-        for file_info in self.metadata:
-            if os.path.basename(file_info['path']) == file_name:
-                return file_info['path']
-        return file_name
+        return self.manifest.relative_path(file_name)
 
     def get_file_path(self, file_name):
         """Get the file path for saving the received file."""
@@ -488,8 +475,8 @@ class ReceiveAppPJava(QWidget):
         self.progress_bar.setVisible(False)
         
         self.file_receiver = ReceiveWorkerJava(client_ip)
-        self.file_receiver.progress_update.connect(self.updateProgressBar)
-        self.file_receiver.file_progress_update.connect(self.update_file_progress)  # Connect file progress signal
+        self.file_receiver.progress.overall_progress.connect(self.updateProgressBar)
+        self.file_receiver.progress.files_progress.connect(self.update_files_progress)  # Connect file progress signal
         self.file_receiver.decrypt_signal.connect(self.decryptor_init)
         self.file_receiver.receiving_started.connect(self.show_progress_bar)
         self.file_receiver.transfer_finished.connect(self.onTransferFinished)
@@ -498,7 +485,7 @@ class ReceiveAppPJava(QWidget):
         # Connect the stats update signal
         self.file_receiver.transfer_stats_update.connect(self.update_transfer_stats)
         # Connect the file count update signal
-        self.file_receiver.file_count_update.connect(self.updateFileCounts)
+        self.file_receiver.progress.file_counts.connect(self.updateFileCounts)
         #com.an.Datadash
        
         self.typewriter_timer = QTimer(self)
@@ -506,7 +493,7 @@ class ReceiveAppPJava(QWidget):
         self.typewriter_timer.start(50)
 
         QMetaObject.invokeMethod(self.file_receiver, "start", Qt.ConnectionType.QueuedConnection)
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.main_window = None
 
     def initUI(self):
@@ -757,6 +744,10 @@ class ReceiveAppPJava(QWidget):
     def updateProgressBar(self, value):
         self.progress_bar.setValue(value)
 
+    def update_files_progress(self, progress):
+        for filename, value in progress.items():
+            self.update_file_progress(filename, value)
+
     def update_file_progress(self, filename, progress):
         """Update progress for a specific file in the table"""
         # For folder transfers, update the base folder progress
@@ -891,6 +882,7 @@ class ReceiveAppPJava(QWidget):
     def decryptor_init(self, value):
         logger.debug("Received decrypt signal with filelist %s", value)
         if value:
+            from crypt_handler import Decryptor
             self.decryptor = Decryptor(value)
             self.decryptor.show()
 
@@ -986,14 +978,14 @@ class ReceiveAppPJava(QWidget):
         self.change_gif_to_success()  # Change GIF to success animation
         self.close_button.setVisible(True)
 
-    def update_transfer_stats(self, speed, eta, elapsed):
+    def update_transfer_stats(self, speed, eta, elapsed, chunk_size):
         """Update the transfer statistics label"""
         if not self.transfer_stats_label.isVisible():
             self.transfer_stats_label.setVisible(True)
             
         eta_str = time.strftime("%H:%M:%S", time.gmtime(eta))
         elapsed_str = time.strftime("%H:%M:%S", time.gmtime(elapsed))
-        stats_text = f"Speed: {speed:.2f} MB/s | ETA: {eta_str} | Elapsed: {elapsed_str}"
+        stats_text = f"Speed: {speed:.2f} MB/s | ETA: {eta_str} | Elapsed: {elapsed_str} | Chunk: {chunk_size // 1024} KB"
         self.transfer_stats_label.setText(stats_text)
 
     def updateFileCounts(self, total_files, files_received, files_pending):
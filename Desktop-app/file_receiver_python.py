@@ -4,16 +4,28 @@ import struct
 import json
 import subprocess
 import platform
+import threading
 from PyQt6 import QtCore
 from PyQt6.QtCore import QThread, pyqtSignal, Qt, QMetaObject, QTimer
 from PyQt6.QtWidgets import QMessageBox, QWidget, QVBoxLayout, QLabel, QProgressBar,QSizePolicy, QApplication, QPushButton, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QStyledItemDelegate
 from PyQt6.QtGui import QScreen, QMovie, QFont, QKeyEvent, QKeySequence
 from constant import ConfigManager
 from loges import logger
-from crypt_handler import decrypt_file, Decryptor
+from progress_bus import ProgressBus
 import time
 import shutil
-from portsss import RECEIVER_DATA_DESKTOP, CHUNK_SIZE_DESKTOP
+from portsss import (RECEIVER_DATA_DESKTOP, CHUNK_SIZE_DESKTOP, PARALLEL_STREAMS_MAX, DELTA_MIN_FILE_SIZE,
+                     PASSWORD_TIMEOUT, RESUME_WAIT)
+from chunk_tuner import ChunkSizer, tune_socket_buffers
+from transfer_io import DiskWriter, recv_exact, recv_flag
+from parallel_transfer import ParallelReceiver, SenderReconnected, PARALLEL_TOKEN_SIZE
+from packed_batch import unpack_batch, MAX_BATCH_PAYLOAD
+from resume_journal import ResumeJournal
+from compression import receive_compressed
+from integrity import Checksum, verify_trailer
+from delta_sync import file_signature, encode_signatures, receive_delta
+from manifest import Manifest, TransferProgress, read_manifest, read_manifest_part
+from dest_planner import DestinationPlanner, join_inside
 
 class ProgressBarDelegate(QStyledItemDelegate):
     def paint(self, painter, option, index):
@@ -47,8 +59,6 @@ class ProgressBarDelegate(QStyledItemDelegate):
         return None  # Disable editing
 
 class ReceiveWorkerPython(QThread):
-    progress_update = pyqtSignal(int)  # Overall progress
-    file_progress_update = pyqtSignal(str, int)  # Individual file progress (filename, progress)
     decrypt_signal = pyqtSignal(list)
     close_connection_signal = pyqtSignal()
     receiving_started = pyqtSignal()
@@ -58,22 +68,31 @@ class ReceiveWorkerPython(QThread):
     # Add new signal for file rename events
     file_renamed_signal = pyqtSignal(str, str)  # old_name, new_name
     # Add new signal
-    transfer_stats_update = pyqtSignal(float, float, float)  # speed, eta, elapsed
-    file_count_update = pyqtSignal(int, int, int)  # total_files, files_received, files_pending
+    transfer_stats_update = pyqtSignal(float, float, float, int)  # speed, eta, elapsed, chunk_size
+    password_required = pyqtSignal(str, int)  # file_name, attempts_left
+    error_occurred = pyqtSignal(str, str, str)  # title, message, detailed_text
 
-    def __init__(self, client_ip):
+    def __init__(self, client_ip, save_directory=None, resume_wait=RESUME_WAIT):
         super().__init__()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
+        # Where transfers are saved, None follows the save_to_directory setting
+        self.save_directory = save_directory
         self.client_skt = None
         self.server_skt = None
         self.encrypted_files = []
         self.broadcasting = True
-        self.metadata = None
+        self.manifest = None
+        # Files of the manifest whose signatures were sent to the sender
+        self.signed_files = 0
         self.destination_folder = None
+        # Directories created and names taken in the destination during a transfer
+        self.planner = DestinationPlanner()
         self.store_client_ip = client_ip
         logger.debug(f"Client IP address stored: {self.store_client_ip}")
         self.close_connection_signal.connect(self.close_connection)
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         #com.an.Datadash
         self.start_time = None
         self.last_update_time = None
@@ -85,6 +104,24 @@ class ReceiveWorkerPython(QThread):
         self.last_speed_update_time = None
         self.total_received_bytes = 0
         self.total_folder_size = 0
+        # Password for AES-GCM streams, asked once and reused for the whole session
+        self.stream_password = None
+        self.password_event = threading.Event()
+        self.password_attempts = 3
+        # Checkpoints of this transfer, used once the sender asks to resume
+        self.journal = ResumeJournal(os.path.dirname(self.config_manager.config_file))
+        self.resume_active = False
+        # Seconds to wait for the sender to reconnect after a dropped connection
+        self.resume_wait = resume_wait
+        # Connection the sender resumed on, accepted while a parallel file was in flight
+        self.reconnected_skt = None
+        self.resumed_bytes = 0
+        self.resumed_files = 0
+        # Checksum announced by the sender and files that failed it, {relative_path: file_path}
+        self.checksum = None
+        self.failed_files = {}
+        # Earlier copy of the incoming folder that deltas are applied to
+        self.delta_basis = None
 
     def initialize_connection(self):
         """Initialize server socket with proper reuse settings"""
@@ -110,9 +147,13 @@ class ReceiveWorkerPython(QThread):
             # Configure timeout
             self.server_skt.settimeout(60)
 
+            # Accepted sockets inherit the buffer sizes, set them before the handshake
+            tune_socket_buffers(self.server_skt, CHUNK_SIZE_DESKTOP * 4)
+
             # Bind and listen
             self.server_skt.bind(('', RECEIVER_DATA_DESKTOP))
-            self.server_skt.listen(1)
+            # Room for the extra data connections of a parallel transfer
+            self.server_skt.listen(PARALLEL_STREAMS_MAX + 1)
             logger.debug("Server initialized on port %d", RECEIVER_DATA_DESKTOP)
 
         except OSError as e:
@@ -132,6 +173,9 @@ class ReceiveWorkerPython(QThread):
         try:
             # Accept a connection from a client
             self.client_skt, self.client_address = self.server_skt.accept()
+            self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_DESKTOP)
+            # Payloads are written to disk on a separate thread while the next data arrives
+            self.disk_writer = DiskWriter()
             print(f"Connected to {self.client_address}")
         except Exception as e:
             error_message = f"Failed to accept connection: {str(e)}"
@@ -144,26 +188,63 @@ class ReceiveWorkerPython(QThread):
         self.accept_connection()
         if self.client_skt:
             self.receiving_started.emit()
-            self.receive_files()
+            # A dropped connection of a resumable transfer waits for the sender to come back
+            while not self.receive_files() and self.resume_active and self.wait_for_resume():
+                logger.info("Sender reconnected, resuming transfer")
         else:
             logger.error("Failed to establish a connection.")
 
         if self.client_skt:
             self.client_skt.close()
+            self.disk_writer.close()
+        if self.reconnected_skt:
+            self.reconnected_skt.close()
         if self.server_skt:
             self.server_skt.close()
 
+    def wait_for_resume(self):
+        """Accept the sender's next connection after a drop, True if it came back in time."""
+        logger.info("Connection lost, waiting %s seconds for the sender to resume", self.resume_wait)
+        previous_timeout = self.server_skt.gettimeout()
+        try:
+            self.client_skt.close()
+            if self.reconnected_skt is not None:
+                self.client_skt, self.reconnected_skt = self.reconnected_skt, None
+                self.client_address = self.client_skt.getpeername()
+            else:
+                self.server_skt.settimeout(self.resume_wait)
+                self.client_skt, self.client_address = self.server_skt.accept()
+        except (OSError, AttributeError) as e:
+            logger.error("Sender did not resume the transfer: %s", e)
+            return False
+        finally:
+            self.server_skt.settimeout(previous_timeout)
+        self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_DESKTOP)
+        return True
+
+    def handle_resume_query(self):
+        """Answer the sender's resume query with the checkpoints of its transfer."""
+        query_size = struct.unpack('<Q', self._receive_data(self.client_skt, 8))[0]
+        query = json.loads(self._receive_data(self.client_skt, query_size).decode('utf-8'))
+        offsets = self.journal.begin(query['transfer_id'])
+        self.resume_active = True
+        self.resumed_bytes = sum(committed for committed, _ in offsets.values())
+        self.resumed_files = sum(1 for committed, size in offsets.values() if committed == size)
+        reply = json.dumps({'files': offsets}).encode('utf-8')
+        self.client_skt.sendall(struct.pack('<Q', len(reply)) + reply)
+
     def receive_files(self):
+        """Receive files until the sender halts, returns False if the connection was lost."""
         self.start_time = time.time()
         self.last_update_time = time.time()
         self.broadcasting = False
         self.folder_transfer = False
         logger.debug("File reception started.")
         
-        total_bytes = 0
-        received_total = 0
-        folder_received_bytes = 0
+        transfer = TransferProgress()
         encrypted_transfer = False
+        stream_encrypted = False
+        parallel_file = False
         file_name = None  # Initialize file_name
         original_filename = None  # Initialize original_filename
         self.last_speed_update_time = time.time()
@@ -172,27 +253,85 @@ class ReceiveWorkerPython(QThread):
         while True:
             try:
                 # Receive and decode encryption flag
-                encryption_flag = self.client_skt.recv(8).decode()
+                encryption_flag = recv_flag(self.client_skt).decode()
                 logger.debug("Received encryption flag: %s", encryption_flag)
 
                 if not encryption_flag:
                     logger.debug("Dropped redundant data: %s", encryption_flag)
-                    break
-
-                if encryption_flag[-1] == 't':
+                    return False
+
+                parallel_file = encryption_flag[-1] == 'p'
+                resumed_file = encryption_flag[-1] == 'c'
+                compressed_file = encryption_flag[-1] == 'z'
+                delta_file = encryption_flag[-1] == 'e'
+                if encryption_flag[-1] == 'r':
+                    self.handle_resume_query()
+                    continue
+                elif encryption_flag[-1] == 'k':
+                    self.checksum = Checksum.from_id(self._receive_data(self.client_skt, 1)[0])
+                    logger.debug("Verifying files with %s", self.checksum.name)
+                    continue
+                elif encryption_flag[-1] == 'v':
+                    self.handle_verify_request()
+                    continue
+                elif encryption_flag[-1] == 'd':
+                    self.handle_signature_request()
+                    continue
+                elif encryption_flag[-1] == 'm':
+                    # Binary manifest in place of metadata.json, parsed block by block as it arrives
+                    logger.debug("Receiving binary manifest.")
+                    self.planner.forget()
+                    self.set_manifest(read_manifest(self.client_skt))
+                    self.apply_manifest(transfer)
+                    continue
+                elif encryption_flag[-1] == 'n':
+                    # Next block of a streamed manifest, its files follow
+                    self.extend_manifest(transfer)
+                    continue
+                elif encryption_flag[-1] == 't':
                     encrypted_transfer = True
+                    stream_encrypted = False
+                elif encryption_flag[-1] == 's':
+                    # Decrypted while receiving, stored under its plain name
+                    encrypted_transfer = False
+                    stream_encrypted = True
+                elif encryption_flag[-1] == 'b':
+                    # Many small files packed into one frame
+                    batch_files, batch_bytes = self.receive_packed_batch()
+                    transfer.add(batch_bytes)
+                    self.total_bytes_received = transfer.received
+                    self.total_received_bytes += batch_bytes
+                    self.bytes_since_last_update += batch_bytes
+                    if self.folder_transfer:
+                        self.progress.report_file("folder_progress", transfer.folder())
+                    self.progress.report_overall(transfer.overall())
+                    self.files_received += batch_files
+                    self.progress.report_counts(self.total_files, self.files_received, self.total_files - self.files_received)
+                    continue
                 elif encryption_flag[-1] == 'h':
                     if self.encrypted_files:
                         self.decrypt_signal.emit(self.encrypted_files)
                     self.encrypted_files = []
+                    if self.manifest and not self.manifest.complete:
+                        logger.warning("Sender halted before its manifest was complete")
+                    if self.failed_files:
+                        logger.error("Files failed verification: %s", ", ".join(self.failed_files))
+                        self.error_occurred.emit("Transfer Error",
+                                                 f"{len(self.failed_files)} files were damaged in transfer.",
+                                                 "\n".join(self.failed_files.values()))
+                    elif self.resume_active:
+                        self.journal.finish()
+                    self.disk_writer.log_stats()
                     logger.debug("Received halt signal. Stopping file reception.")
+                    self.progress.flush()
                     self.transfer_finished.emit()
-                    break
+                    return True
                 else:
                     encrypted_transfer = False
+                    stream_encrypted = False
 
                 # Receive file name size
-                file_name_size_data = self.client_skt.recv(8)
+                file_name_size_data = self._receive_data(self.client_skt, 8)
                 file_name_size = struct.unpack('<Q', file_name_size_data)[0]
                 logger.debug("File name size received: %d", file_name_size)
 
@@ -213,195 +352,372 @@ class ReceiveWorkerPython(QThread):
                 logger.debug("Normalized file name: %s", file_name)
 
                 # Receive file size
-                file_size_data = self.client_skt.recv(8)
+                file_size_data = self._receive_data(self.client_skt, 8)
                 file_size = struct.unpack('<Q', file_size_data)[0]
                 logger.debug("Receiving file %s, size: %d bytes", file_name, file_size)
 
-                received_size = 0
+                # A resumed file continues at the offset the journal reported
+                resume_offset = 0
+                if resumed_file:
+                    resume_offset = struct.unpack('<Q', self._receive_data(self.client_skt, 8))[0]
+                received_size = resume_offset
 
                 # Check if it's metadata
                 if file_name == 'metadata.json':
                     logger.debug("Receiving metadata file.")
-                    self.metadata = self.receive_metadata(file_size)
-                    # Calculate total bytes from metadata
-                    total_bytes = sum(file_info['size'] for file_info in self.metadata 
-                                    if file_info.get('size', 0) > 0 and file_info.get('path') != '.delete')
-                    logger.debug(f"Total bytes to receive: {total_bytes}")
-                    
-                    if total_bytes == 0:
-                        total_bytes = 1  # Prevent division by zero
-                        
-                    ## Check if the 2nd last position of metadata is "base_folder_name" and it exists
-                    if self.metadata[-1].get('base_folder_name', '') and self.metadata[-1]['base_folder_name'] != '':
-                        self.folder_transfer = True
-                        self.destination_folder = self.create_folder_structure(self.metadata)
-                    else:
-                        ## If not, set the destination folder to the default directory
-                        self.destination_folder = self.config_manager.get_config()["save_to_directory"]
-                    logger.debug("Metadata processed. Destination folder set to: %s", self.destination_folder)
+                    self.planner.forget()
+                    self.set_manifest(self.receive_metadata(file_size))
+                    self.apply_manifest(transfer)
                 else:
-                    # Check if file exists in the receiving directory
-                    original_name = file_name
-                    original_name_base, extension = os.path.splitext(file_name)
-                    i = 1
-                    while os.path.exists(os.path.join(self.destination_folder, file_name)):
-                        if encrypted_transfer:
-                            file_name = f"{original_name_base[:-6]} ({i}).crypt"  # Remove .crypt before adding counter
-                        else:
-                            file_name = f"{original_name_base} ({i}){extension}"
-                        i += 1
-                    
-                    # Emit signal if file was renamed, use original filename for display
-                    if file_name != original_name:
-                        display_name = original_filename if encrypted_transfer else file_name
-                        self.file_renamed_signal.emit(original_filename, display_name)
-
-                    # Determine the correct path using metadata
-                    if self.metadata:
-                        relative_path = self.get_relative_path_from_metadata(file_name)
-                        file_path = os.path.join(self.destination_folder, relative_path)
-                        logger.debug("Constructed file path from metadata: %s", file_path)
+                    journaled_path = self.journal.file_path(original_filename) if self.resume_active else None
+                    if original_filename in self.failed_files:
+                        # Sent again after failing verification, overwrite the damaged copy
+                        file_path = self.failed_files[original_filename]
+                    elif journaled_path:
+                        # File of the interrupted transfer, reuse the path it was written to
+                        file_path = journaled_path
                     else:
-                        # Fallback if metadata is not available
-                        file_path = self.get_file_path(file_name)
-                        logger.debug("Constructed file path without metadata: %s", file_path)
-
-                    # Normalize the final file path
-                    file_path = os.path.normpath(file_path)
-
-                    # Ensure that the directory exists for the file
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                    logger.debug("Directory structure created or verified for: %s", os.path.dirname(file_path))
+                        file_name, file_path = self.resolve_file_path(file_name, original_filename, encrypted_transfer)
+                        if self.resume_active:
+                            # Keep the path, a resumed transfer writes this file there again
+                            self.journal.update(original_filename, file_path, file_size, 0)
 
                     # Check for encrypted transfer
                     if encrypted_transfer:
                         self.encrypted_files.append(file_path)
                         logger.debug("File marked for decryption: %s", file_path)
 
-                    # Receive file data in chunks
-                    with open(file_path, "wb") as f:
-                        while received_size < file_size:
-                            current_time = time.time()
-                            chunk_size = min(CHUNK_SIZE_DESKTOP, file_size - received_size)
-                            data = self._receive_data(self.client_skt, chunk_size)
-                            if not data:
-                                logger.error("Failed to receive data. Connection may have been closed.")
-                                break
-                            f.write(data)
-                            received_size += len(data)
-                            received_total += len(data)
-                            self.total_bytes_received = received_total
-                            self.total_received_bytes += len(data)
-                            self.bytes_since_last_update += len(data)
-                            
-                            # Calculate transfer statistics every 0.5 seconds
-                            if current_time - self.last_speed_update_time >= 0.5:
-                                elapsed_since_last = current_time - self.last_speed_update_time
-                                if elapsed_since_last > 0:
-                                    current_speed = (self.bytes_since_last_update / (1024 * 1024)) / elapsed_since_last
-                                    
-                                    # Calculate overall progress and ETA
-                                    if self.total_folder_size > 0:
-                                        overall_progress = self.total_received_bytes / self.total_folder_size
-                                        if current_speed > 0:
-                                            eta = (self.total_folder_size - self.total_received_bytes) / (current_speed * 1024 * 1024)
-                                        else:
-                                            eta = 0
-                                        
-                                        elapsed = current_time - self.start_time
-                                        self.transfer_stats_update.emit(current_speed, eta, elapsed)
-                                
-                                self.last_speed_update_time = current_time
-                                self.bytes_since_last_update = 0
-                            
-                            if self.folder_transfer:
-                                folder_received_bytes += len(data)
-                                folder_total = sum(file_info.get('size', 0) for file_info in self.metadata[:-1]
-                                                 if file_info.get('path') != '.delete')
-                                folder_progress = (folder_received_bytes * 100) // folder_total if folder_total > 0 else 0
-                                folder_progress = min(folder_progress, 100)
-                                self.file_progress_update.emit("folder_progress", folder_progress)
-                            
-                            # Safe progress calculation
-                            try:
-                                file_progress = (received_size * 100) // file_size if file_size > 0 else 0
-                                overall_progress = (received_total * 100) // total_bytes if total_bytes > 0 else 0
-                                
-                                # Ensure progress doesn't exceed 100%
-                                file_progress = min(file_progress, 100)
-                                overall_progress = min(overall_progress, 100)
-                                
-                                if not self.folder_transfer:
-                                    # Use original filename for progress updates if encrypted
-                                    progress_name = original_filename if encrypted_transfer else file_name
-                                    self.file_progress_update.emit(progress_name, file_progress)
-                                self.progress_update.emit(overall_progress)
-                            except Exception as e:
-                                logger.error(f"Error calculating progress: {str(e)}")
+                    def on_chunk(n):
+                        nonlocal received_size
+                        current_time = time.time()
+                        received_size += n
+                        transfer.add(n)
+                        self.total_bytes_received = transfer.received
+                        self.total_received_bytes += n
+                        self.bytes_since_last_update += n
+
+                        # Calculate transfer statistics every 0.5 seconds
+                        if current_time - self.last_speed_update_time >= 0.5:
+                            elapsed_since_last = current_time - self.last_speed_update_time
+                            if elapsed_since_last > 0:
+                                current_speed = (self.bytes_since_last_update / (1024 * 1024)) / elapsed_since_last
+
+                                # Calculate overall progress and ETA
+                                if self.total_folder_size > 0:
+                                    if current_speed > 0:
+                                        eta = (self.total_folder_size - self.total_received_bytes) / (current_speed * 1024 * 1024)
+                                    else:
+                                        eta = 0
+
+                                    elapsed = current_time - self.start_time
+                                    self.transfer_stats_update.emit(current_speed, eta, elapsed, self.chunk_sizer.size)
+
+                            self.last_speed_update_time = current_time
+                            self.bytes_since_last_update = 0
+
+                        if self.folder_transfer:
+                            self.progress.report_file("folder_progress", transfer.folder())
+                        else:
+                            # Use original filename for progress updates if encrypted
+                            file_progress = min((received_size * 100) // file_size, 100) if file_size > 0 else 0
+                            progress_name = original_filename if encrypted_transfer else file_name
+                            self.progress.report_file(progress_name, file_progress)
+                        self.progress.report_overall(transfer.overall())
+
+                    hasher = None
+                    if self.checksum and not (stream_encrypted or encrypted_transfer or parallel_file):
+                        hasher = self.checksum.new()
+                    verified = True
+                    if parallel_file:
+                        # Payload arrives on extra data connections, written at its offsets
+                        token = self._receive_data(self.client_skt, PARALLEL_TOKEN_SIZE)
+                        # A resumable transfer gives up on a stalled file as soon as the sender would reconnect
+                        receiver = ParallelReceiver(self.server_skt, token, on_chunk, self.checksum,
+                                                    self.resume_wait if self.resume_active else None)
+                        receiver.receive(self.client_skt, file_path, file_size)
+                        verified = not receiver.failed
+                    elif stream_encrypted:
+                        self.receive_stream_encrypted(file_path, original_filename, file_size, on_chunk)
+                    elif compressed_file:
+                        codec_id = self._receive_data(self.client_skt, 1)[0]
+                        with open(file_path, "wb") as f:
+                            receive_compressed(self.client_skt, f, codec_id, file_size, on_chunk, hasher)
+                    elif delta_file:
+                        basis_path = os.path.join(self.delta_basis, original_filename)
+                        with open(file_path, "wb") as f:
+                            receive_delta(self.client_skt, f, basis_path, file_size, self.disk_writer, on_chunk, hasher)
+                    else:
+                        self.receive_plain_file(file_path, original_filename, file_size, resume_offset, on_chunk, hasher)
+                    if hasher:
+                        verified = verify_trailer(self.client_skt, hasher)
+
+                    if not verified:
+                        self.mark_failed(original_filename, file_path, file_size)
+                        continue
+                    self.failed_files.pop(original_filename, None)
+
+                    if self.resume_active and (parallel_file or stream_encrypted or encrypted_transfer or compressed_file
+                                               or delta_file):
+                        # Only plain files are checkpointed while they arrive, the rest once complete
+                        self.journal.complete(original_filename, file_path, file_size)
 
                     self.files_received += 1
                     files_pending = self.total_files - self.files_received
-                    self.file_count_update.emit(self.total_files, self.files_received, files_pending)
+                    self.progress.report_counts(self.total_files, self.files_received, files_pending)
 
             except ZeroDivisionError as zde:
                 logger.error(f"Division by zero error: {str(zde)}")
                 continue
             except Exception as e:
                 logger.error("Error during file reception: %s", str(e))
-                break
+                if isinstance(e, SenderReconnected):
+                    self.reconnected_skt = e.conn
+                self.disk_writer.log_stats()
+                if self.resume_active:
+                    self.journal.save()
+                return False
 
         logger.debug("File reception completed.")
+        return True
+
+    def apply_manifest(self, transfer):
+        """Prepare the destination for the files of the manifest that just arrived."""
+        # Totals are worked out once here, the receive loop only counts up
+        transfer.expect(self.manifest)
+        logger.debug(f"Total bytes to receive: {self.manifest.total_bytes}")
+
+        ## Check if the manifest names a base folder
+        if self.manifest.is_folder:
+            self.folder_transfer = True
+            if self.resume_active and self.journal.destination:
+                # Continue in the folder of the interrupted transfer
+                self.destination_folder = self.journal.destination
+            else:
+                self.destination_folder = self.create_folder_structure(self.manifest)
+                if self.resume_active:
+                    self.journal.destination = self.destination_folder
+            self.delta_basis = self.find_delta_basis(self.manifest.base_folder_name)
+        else:
+            ## If not, set the destination folder to the default directory
+            self.destination_folder = self.save_to_directory()
+        logger.debug("Metadata processed. Destination folder set to: %s", self.destination_folder)
+
+        if self.resume_active:
+            # Count what is already on disk from the interrupted transfer
+            transfer.received = transfer.folder_received = self.resumed_bytes
+            self.files_received = self.resumed_files
+            self.progress.report_counts(self.total_files, self.files_received,
+                                        self.total_files - self.files_received)
+
+    def extend_manifest(self, transfer):
+        """Add the next block of a streamed manifest and create the folders it brings."""
+        manifest = self.manifest
+        first_file, first_folder = manifest.total_files, len(manifest.folders)
+        read_manifest_part(self.client_skt, manifest)
+        if manifest.is_folder:
+            folders = set(manifest.folders[first_folder:])
+            folders.update(os.path.dirname(manifest.files[i]) for i in range(first_file, manifest.total_files))
+            self.planner.create_tree(self.destination_folder, folders)
+        # The totals grow with every block and are final once the manifest is complete
+        transfer.expect(manifest)
+        self.total_files = manifest.total_files
+        self.total_folder_size = manifest.payload_bytes
+        self.progress.report_counts(self.total_files, self.files_received, self.total_files - self.files_received)
+
+    def receive_packed_batch(self):
+        """Receive one packed batch of small files and return (files, bytes) written."""
+        index_size = struct.unpack('<Q', self._receive_data(self.client_skt, 8))[0]
+        index = self._receive_data(self.client_skt, index_size)
+        payload_size = struct.unpack('<Q', self._receive_data(self.client_skt, 8))[0]
+        if payload_size > MAX_BATCH_PAYLOAD:
+            raise ValueError(f"Packed batch of {payload_size} bytes exceeds the limit")
+        payload = self._receive_data(self.client_skt, payload_size)
+        self.chunk_sizer.record(payload_size)
+        verified = True
+        if self.checksum:
+            hasher = self.checksum.new()
+            hasher.update(payload)
+            verified = verify_trailer(self.client_skt, hasher)
+        destination = self.destination_folder or self.save_to_directory()
+        written = unpack_batch(index, payload, destination, self.planner)
+        if not verified:
+            for relative_path, file_path, size in written:
+                self.mark_failed(relative_path, file_path, size)
+            return 0, payload_size
+        for relative_path, file_path, size in written:
+            if os.path.basename(file_path) != os.path.basename(relative_path):
+                self.file_renamed_signal.emit(relative_path, os.path.join(os.path.dirname(relative_path),
+                                                                          os.path.basename(file_path)))
+            self.failed_files.pop(relative_path, None)
+            if self.resume_active:
+                self.journal.complete(relative_path, file_path, size)
+        return len(written), payload_size
+
+    def mark_failed(self, relative_path, file_path, file_size):
+        """Remember a file whose checksum did not match, so the sender can send it again."""
+        logger.warning("Checksum mismatch for %s", relative_path)
+        self.failed_files[relative_path] = file_path
+        if self.resume_active:
+            # Nothing of it may be trusted when the transfer is resumed
+            self.journal.update(relative_path, file_path, file_size, 0)
+
+    def find_delta_basis(self, base_folder_name):
+        """Return the newest earlier copy of base_folder_name other than the destination, or None."""
+        folder_path = os.path.join(self.save_to_directory(), base_folder_name)
+        basis = None
+        candidate = folder_path
+        i = 1
+        # Copies are named like _get_unique_folder_name creates them
+        while self.planner.exists(candidate):
+            if os.path.normpath(candidate) != os.path.normpath(self.destination_folder):
+                basis = candidate
+            candidate = f"{folder_path} ({i})"
+            i += 1
+        return basis
+
+    def handle_signature_request(self):
+        """Send the chunk signatures of the files the earlier copy of the folder holds."""
+        signatures = {}
+        if self.delta_basis and self.manifest:
+            # A streamed manifest is asked for once per block, only its new files are looked at
+            manifest = self.manifest
+            for i in range(self.signed_files, manifest.total_files):
+                if manifest.sizes[i] < DELTA_MIN_FILE_SIZE:
+                    continue
+                basis_path = os.path.join(self.delta_basis, manifest.files[i])
+                if os.path.isfile(basis_path):
+                    signatures[manifest.files[i]] = file_signature(basis_path)
+            self.signed_files = manifest.total_files
+            logger.debug("Sending signatures of %d files from %s", len(signatures), self.delta_basis)
+        reply = encode_signatures(signatures)
+        self.client_skt.sendall(struct.pack('<Q', len(reply)) + reply)
+
+    def handle_verify_request(self):
+        """Tell the sender which files failed verification so far."""
+        reply = json.dumps(list(self.failed_files)).encode('utf-8')
+        self.client_skt.sendall(struct.pack('<Q', len(reply)) + reply)
+
+    def receive_plain_file(self, file_path, relative_path, file_size, resume_offset, on_chunk, hasher=None):
+        """Receive an unencrypted payload to disk, continuing at resume_offset if it is set."""
+        if resume_offset:
+            committed = self.journal.committed(relative_path)
+            if committed != resume_offset:
+                raise ValueError(f"Sender resumed {relative_path} at {resume_offset}, journal has {committed}")
+
+        with open(file_path, "r+b" if resume_offset else "wb") as f:
+            if resume_offset:
+                f.truncate(resume_offset)
+                f.seek(resume_offset)
+            try:
+                # Written by the disk writer thread while the next buffers arrive
+                self.disk_writer.recv_into_file(self.client_skt, f, file_size - resume_offset, on_chunk,
+                                                self.chunk_sizer, hasher)
+            finally:
+                if self.resume_active:
+                    # Everything written so far is checkpointed, complete or not
+                    f.flush()
+                    self.journal.update(relative_path, file_path, file_size, f.tell())
+
+    def receive_stream_encrypted(self, file_path, display_name, file_size, on_chunk):
+        """Receive an AES-GCM stream and write the decrypted file to file_path."""
+        from crypt_handler import GCM_HEADER_SIZE
+        header = self._receive_data(self.client_skt, GCM_HEADER_SIZE)
+        on_chunk(GCM_HEADER_SIZE)
+        remaining = file_size - GCM_HEADER_SIZE
+        try:
+            with open(file_path, "wb") as f:
+                writer = self._open_decrypt_writer(f, header, display_name, file_size)
+                if writer is not None:
+                    self.disk_writer.recv_into_file(self.client_skt, writer, remaining, on_chunk, self.chunk_sizer)
+                    writer.finish()
+                    return
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        # No valid password, keep the connection in sync and drop the file
+        logger.warning("Skipping %s, no valid password was entered", display_name)
+        os.remove(file_path)
+        self.disk_writer.skip(self.client_skt, remaining, on_chunk)
+
+    def _open_decrypt_writer(self, f, header, display_name, file_size):
+        """Return a GCMDecryptWriter for the stream, asking for the password if needed."""
+        from crypt_handler import GCMDecryptWriter
+        if self.stream_password is not None:
+            try:
+                return GCMDecryptWriter(f, header, self.stream_password, file_size)
+            except ValueError:
+                self.stream_password = None
+
+        while self.password_attempts > 0:
+            self.password_event.clear()
+            self.password_required.emit(display_name, self.password_attempts)
+            if not self.password_event.wait(PASSWORD_TIMEOUT):
+                # Nobody answered, the transfer is given up for good instead of waited on
+                self.resume_active = False
+                self.error_occurred.emit("Password Required",
+                                         f"No password was entered for {display_name} within {PASSWORD_TIMEOUT} "
+                                         "seconds, the transfer was aborted.", "")
+                raise TimeoutError(f"No password entered for {display_name}")
+            password = self.password
+            if password is None:
+                return None
+            try:
+                writer = GCMDecryptWriter(f, header, password, file_size)
+            except ValueError as e:
+                self.password_attempts -= 1
+                logger.error("Failed to decrypt %s: %s", display_name, e)
+                continue
+            self.stream_password = password
+            return writer
+        return None
+
+    def set_password(self, password):
+        """Hand the password entered in the UI to the receiving thread, None cancels."""
+        self.password = password
+        self.password_event.set()
+
+    def resolve_file_path(self, file_name, original_filename, encrypted_transfer):
+        """Pick a free name for an incoming file and return (file_name, file_path)."""
+        # Determine the correct path using metadata
+        if self.manifest:
+            relative_path = self.get_relative_path_from_metadata(file_name)
+            file_path = join_inside(self.destination_folder, relative_path)
+            logger.debug("Constructed file path from metadata: %s", file_path)
+        else:
+            # Fallback if metadata is not available
+            file_path = self.get_file_path(file_name)
+            logger.debug("Constructed file path without metadata: %s", file_path)
+
+        # Normalize the final file path
+        file_path = os.path.normpath(file_path)
+
+        # Ensure that the directory exists for the file
+        self.planner.makedirs(os.path.dirname(file_path))
+        logger.debug("Directory structure created or verified for: %s", os.path.dirname(file_path))
+
+        # Existing files are kept, the new one gets the first free name (i) like on the other receivers
+        unique_path = self.planner.unique_file(file_path)
+        if unique_path != file_path:
+            file_path = unique_path
+            file_name = os.path.join(os.path.dirname(file_name), os.path.basename(file_path))
+            # Emit signal if file was renamed, use original filename for display
+            display_name = original_filename if encrypted_transfer else file_name
+            self.file_renamed_signal.emit(original_filename, display_name)
+        return file_name, file_path
 
     def _receive_data(self, socket, size):
         """Helper function to receive a specific amount of data."""
-        received_data = b""
-        while len(received_data) < size:
-            chunk = socket.recv(size - len(received_data))
-            if not chunk:
-                raise ConnectionError("Connection closed before data was completely received.")
-            received_data += chunk
-        return received_data
+        return recv_exact(socket, size)
     #com.an.Datadash
 
     def receive_metadata(self, file_size):
-        """Receive metadata from the sender."""
+        """Receive metadata.json from the sender and return its Manifest."""
         received_data = self._receive_data(self.client_skt, file_size)
         try:
             metadata_json = received_data.decode('utf-8')
-            metadata = json.loads(metadata_json)
-            
-            # Only emit the folder information if it's a folder transfer
-            if metadata and metadata[-1].get('base_folder_name', ''):
-                # Send only the folder metadata entry
-                self.update_files_table_signal.emit([metadata[-1]])
-            else:
-                # Send full metadata for individual files
-                self.update_files_table_signal.emit(metadata)
-                
-            # Count total files from metadata
-            if metadata and metadata[-1].get('base_folder_name', ''):
-                # For folder transfers, count all files (excluding folders and .delete)
-                self.total_files = sum(1 for item in metadata[:-1] 
-                                     if not item['path'].endswith('/') and item['path'] != '.delete')
-            else:
-                # For individual files
-                self.total_files = len(metadata)
-                
-            self.file_count_update.emit(self.total_files, 0, self.total_files)
-            
-            # Calculate total folder size from metadata
-            self.total_folder_size = sum(
-                info.get('size', 0) 
-                for info in metadata 
-                if isinstance(info, dict) and 
-                'path' in info and 
-                'size' in info and
-                info.get('size', 0) > 0 and
-                not info['path'].endswith('/') and
-                not info['path'].endswith('.DS_Store')
-            )
-            
-            return metadata
+            return Manifest.from_metadata(json.loads(metadata_json))
         except UnicodeDecodeError as e:
             logger.error("Unicode decode error: %s", e)
             raise
@@ -409,17 +725,25 @@ class ReceiveWorkerPython(QThread):
             logger.error("JSON decode error: %s", e)
             raise
 
-    def create_folder_structure(self, metadata):
-        """Create folder structure based on metadata."""
-        # Get the default directory from configuration
-        config = self.config_manager.get_config()
-        default_dir = config["save_to_directory"]
+    def set_manifest(self, manifest):
+        """Take over the manifest of a new transfer and show its files."""
+        self.manifest = manifest
+        self.signed_files = 0
+        # Folder transfers only show the folder, file transfers every file
+        self.update_files_table_signal.emit(manifest.entries())
+        self.total_files = manifest.total_files
+        self.progress.report_counts(self.total_files, 0, self.total_files)
+        self.total_folder_size = manifest.payload_bytes
+
+    def create_folder_structure(self, manifest):
+        """Create folder structure based on the manifest."""
+        default_dir = self.save_to_directory()
 
         if not default_dir:
             raise ValueError("No save_to_directory configured")
 
-        # Extract the base folder name from the last metadata entry
-        top_level_folder = metadata[-1].get('base_folder_name', '')
+        # Extract the base folder name
+        top_level_folder = manifest.base_folder_name
         if not top_level_folder:
             raise ValueError("Base folder name not found in metadata")
 
@@ -428,68 +752,32 @@ class ReceiveWorkerPython(QThread):
         destination_folder = self._get_unique_folder_name(destination_folder)
         logger.debug("Destination folder: %s", destination_folder)
 
-        # Create the destination folder if it does not exist
-        if not os.path.exists(destination_folder):
-            os.makedirs(destination_folder)
-            logger.debug("Created base folder: %s", destination_folder)
-
-        # Track created folders to avoid duplicates
-        created_folders = set()
-        created_folders.add(destination_folder)
-
-        # Process each file info in metadata (excluding the last entry)
-        for file_info in metadata[:-1]:  # Exclude the last entry (base folder info)
-            # Skip any paths marked for deletion
-            if file_info['path'] == '.delete':
-                continue
-
-            # Get the folder path from the file info
-            folder_path = os.path.dirname(file_info['path'])
-            if folder_path:
-                # Create the full folder path
-                full_folder_path = os.path.join(destination_folder, folder_path)
-
-                # Ensure the folder is unique and not a duplicate
-                if full_folder_path not in created_folders:
-                    full_folder_path = self._get_unique_folder_name(full_folder_path)
-
-                    # Create the directory if it does not exist
-                    if not os.path.exists(full_folder_path):
-                        os.makedirs(full_folder_path)
-                        logger.debug("Created folder: %s", full_folder_path)
-
-                    # Add the folder to the set of created folders
-                    created_folders.add(full_folder_path)
-                else:
-                    logger.debug("Folder already exists: %s", full_folder_path)
+        # The destination is new, so the whole skeleton is created up front without collisions
+        folders = set(manifest.folders)
+        folders.update(os.path.dirname(relative_path) for relative_path in manifest.files)
+        self.planner.create_tree(destination_folder, folders)
+        logger.debug("Created %d folders below %s", len(folders), destination_folder)
 
         return destination_folder
     #com.an.Datadash
 
     def _get_unique_folder_name(self, folder_path):
         """Append a unique (i) to folder name if it already exists."""
-        base_folder_path = folder_path
-        i = 1
-        # Check for existence and modify name with incrementing (i)
-        while os.path.exists(folder_path):
-            folder_path = f"{base_folder_path} ({i})"
-            i += 1
-        return folder_path
+        return self.planner.unique_folder(folder_path)
 
     def get_relative_path_from_metadata(self, file_name):
         """Get the relative path of a file from the metadata."""
-        for file_info in self.metadata:
-            if os.path.basename(file_info['path']) == file_name:
-                return file_info['path']
-        return file_name
+        return self.manifest.relative_path(file_name)
+
+    def save_to_directory(self):
+        return self.save_directory or self.config_manager.get_config().get("save_to_directory")
 
     def get_file_path(self, file_name):
         """Get the file path for saving the received file."""
-        config = self.config_manager.get_config()
-        default_dir = config.get("save_to_directory")
+        default_dir = self.save_to_directory()
         if not default_dir:
             raise NotImplementedError("Unsupported OS")
-        return os.path.join(default_dir, file_name)
+        return join_inside(default_dir, file_name)
 
     def close_connection(self):
         """Safely close all network connections"""
@@ -513,6 +801,8 @@ class ReceiveWorkerPython(QThread):
         """Stop all operations and cleanup resources"""
         try:
             self.broadcasting = False
+            # Release a pending password prompt so the thread can exit
+            self.set_password(None)
             self.close_connection()
             self.quit()
             self.wait(2000)  # Wait up to 2 seconds for thread to finish
@@ -536,12 +826,13 @@ class ReceiveAppP(QWidget):
         self.displayed_text = ""  # Text that will appear with typewriter effect
         self.char_index = 0  # Keeps track of the character index for typewriter effect
         self.progress_bar.setVisible(False)  # Initially hidden
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
 
         self.file_receiver = ReceiveWorkerPython(client_ip)
-        self.file_receiver.progress_update.connect(self.updateProgressBar)
-        self.file_receiver.file_progress_update.connect(self.update_file_progress)
+        self.file_receiver.progress.overall_progress.connect(self.updateProgressBar)
+        self.file_receiver.progress.files_progress.connect(self.update_files_progress)
         self.file_receiver.decrypt_signal.connect(self.decryptor_init)
+        self.file_receiver.password_required.connect(self.prompt_stream_password)
         self.file_receiver.receiving_started.connect(self.show_progress_bar)
         self.file_receiver.transfer_finished.connect(self.onTransferFinished)
         self.file_receiver.update_files_table_signal.connect(self.update_files_table)
@@ -550,7 +841,8 @@ class ReceiveAppP(QWidget):
         # Connect the stats update signal
         self.file_receiver.transfer_stats_update.connect(self.update_transfer_stats)
         # Connect the file count update signal
-        self.file_receiver.file_count_update.connect(self.updateFileCounts)
+        self.file_receiver.progress.file_counts.connect(self.updateFileCounts)
+        self.file_receiver.error_occurred.connect(self.show_error_message)
 
         # Start the typewriter effect
         self.typewriter_timer = QTimer(self)
@@ -853,8 +1145,7 @@ class ReceiveAppP(QWidget):
                     self.files_table.setItem(0, 1, name_item)
                     
                     # Total size calculation from the original metadata in file_receiver
-                    total_size = sum(file_info.get('size', 0) for file_info in self.file_receiver.metadata[:-1]
-                                   if file_info.get('path') != '.delete')
+                    total_size = self.file_receiver.manifest.folder_bytes
                     
                     # Size formatting
                     if total_size >= 1024 * 1024:  # MB
@@ -935,6 +1226,10 @@ class ReceiveAppP(QWidget):
                 self.files_table.item(row, 1).setToolTip(new_name)
                 break
 
+    def update_files_progress(self, progress):
+        for file_name, value in progress.items():
+            self.update_file_progress(file_name, value)
+
     def update_file_progress(self, file_name, progress):
         """Update progress for a specific file or folder."""
         if self.file_receiver.folder_transfer:
@@ -958,14 +1253,14 @@ class ReceiveAppP(QWidget):
                     self.files_table.setItem(row, 3, progress_item)
                     break
 
-    def update_transfer_stats(self, speed, eta, elapsed):
+    def update_transfer_stats(self, speed, eta, elapsed, chunk_size):
         """Update the transfer statistics label"""
         if not self.transfer_stats_label.isVisible():
             self.transfer_stats_label.setVisible(True)
             
         eta_str = time.strftime("%H:%M:%S", time.gmtime(eta))
         elapsed_str = time.strftime("%H:%M:%S", time.gmtime(elapsed))
-        stats_text = f"Speed: {speed:.2f} MB/s | ETA: {eta_str} | Elapsed: {elapsed_str}"
+        stats_text = f"Speed: {speed:.2f} MB/s | ETA: {eta_str} | Elapsed: {elapsed_str} | Chunk: {chunk_size // 1024} KB"
         self.transfer_stats_label.setText(stats_text)
 
     def updateFileCounts(self, total_files, files_received, files_pending):
@@ -988,9 +1283,21 @@ class ReceiveAppP(QWidget):
     def decryptor_init(self, value):
         logger.debug("Received decrypt signal with filelist %s", value)
         if value:
+            from crypt_handler import Decryptor
             self.decryptor = Decryptor(value)
             self.decryptor.show()
 
+    def prompt_stream_password(self, file_name, attempts_left):
+        """Ask for the password of a stream-encrypted transfer and pass it to the worker."""
+        from crypt_handler import PasswordDialog
+        dialog = PasswordDialog(file_name, attempts_left, self)
+        # The worker stops waiting after PASSWORD_TIMEOUT, the dialog goes with it
+        QTimer.singleShot(PASSWORD_TIMEOUT * 1000, dialog.reject)
+        if dialog.exec():
+            self.file_receiver.set_password(dialog.getPassword())
+        else:
+            self.file_receiver.set_password(None)
+
     def open_receiving_directory(self):
         config = self.file_receiver.config_manager.get_config()
         receiving_dir = config.get("save_to_directory", "")
@@ -8,31 +8,39 @@ from PyQt6.QtWidgets import QMessageBox, QWidget, QVBoxLayout, QLabel, QProgress
 from PyQt6.QtGui import QScreen,QMovie,QFont,QKeySequence,QKeyEvent
 from constant import ConfigManager
 from loges import logger
-from crypt_handler import decrypt_file, Decryptor
+from progress_bus import ProgressBus
 import subprocess
 import platform
 import time
 import shutil
-from portsss import RECEIVER_DATA_SWIFT
+from portsss import RECEIVER_DATA_SWIFT, CHUNK_SIZE_SWIFT
+from chunk_tuner import ChunkSizer, tune_socket_buffers
+from transfer_io import RecvBuffer, recv_exact, recv_flag
+from manifest import Manifest
+from dest_planner import DestinationPlanner
 
 class ReceiveWorkerSwift(QThread):
-    progress_update = pyqtSignal(int)
     decrypt_signal = pyqtSignal(list)
     receiving_started = pyqtSignal()
     password = None
 
     def __init__(self, client_ip):
         super().__init__()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
         self.client_skt = None
         self.server_skt = None
         self.encrypted_files = []
         self.broadcasting = True
         self.metadata = None
+        self.manifest = None
+        # Directories created and names taken in the destination during a transfer
+        self.planner = DestinationPlanner()
         self.destination_folder = None
         self.store_client_ip = client_ip
         self.base_folder_name = ''
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         logger.debug(f"Client IP address stored: {self.store_client_ip}")
 
     def initialize_connection(self):
@@ -59,6 +67,9 @@ class ReceiveWorkerSwift(QThread):
             # Configure timeout
             self.server_skt.settimeout(60)
             
+            # Accepted sockets inherit the buffer sizes, set them before the handshake
+            tune_socket_buffers(self.server_skt, CHUNK_SIZE_SWIFT * 4)
+
             # Bind and listen
             self.server_skt.bind(('', RECEIVER_DATA_SWIFT))
             self.server_skt.listen(1)
@@ -81,6 +92,8 @@ class ReceiveWorkerSwift(QThread):
         try:
             # Accept a connection from a client
             self.client_skt, self.client_address = self.server_skt.accept()
+            self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_SWIFT)
+            self.recv_buffer = RecvBuffer()
             print(f"Connected to {self.client_address}")
         except Exception as e:
             error_message = f"Failed to accept connection: {str(e)}"
@@ -113,7 +126,7 @@ class ReceiveWorkerSwift(QThread):
         while True:
             try:
                 # Receive and decode encryption flag
-                encryption_flag = self.client_skt.recv(8).decode()
+                encryption_flag = recv_flag(self.client_skt).decode()
                 logger.debug("Received encryption flag: %s", encryption_flag)
 
                 if not encryption_flag:
@@ -132,7 +145,7 @@ class ReceiveWorkerSwift(QThread):
                     encrypted_transfer = False
 
                 # Receive file name size
-                file_name_size_data = self.client_skt.recv(8)
+                file_name_size_data = self._receive_data(self.client_skt, 8)
                 file_name_size = struct.unpack('<Q', file_name_size_data)[0]
                 logger.debug("File name size received: %d", file_name_size)
                 
@@ -146,13 +159,14 @@ class ReceiveWorkerSwift(QThread):
                 logger.debug("Original file name: %s", file_name)
 
                 # Receive file size
-                file_size_data = self.client_skt.recv(8)
+                file_size_data = self._receive_data(self.client_skt, 8)
                 file_size = struct.unpack('<Q', file_size_data)[0]
 
                 try:
                     # Handle metadata.json
                     if file_name == 'metadata.json':
                         logger.debug("Receiving metadata file.")
+                        self.planner.forget()
                         self.metadata = self.receive_metadata(file_size)
                         
                         # Check if this is a folder transfer
@@ -178,24 +192,21 @@ class ReceiveWorkerSwift(QThread):
                         full_file_path = os.path.join(self.destination_folder, os.path.basename(file_name))
 
                     # Ensure directory exists and handle duplicates
-                    os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+                    self.planner.makedirs(os.path.dirname(full_file_path))
                     full_file_path = self._get_unique_file_name(full_file_path)
                     logger.debug(f"Saving file to: {full_file_path}")
 
-                    # Receive file data
+                    # Receive file data straight from the reusable buffer to disk
+                    received_size = 0
+
+                    def on_chunk(n):
+                        nonlocal received_size
+                        received_size += n
+                        progress = int(received_size * 100 / file_size)
+                        self.progress.report_overall(progress)
+
                     with open(full_file_path, "wb") as f:
-                        received_size = 0
-                        remaining = file_size
-                        while remaining > 0:
-                            chunk_size = min(4096, remaining)
-                            data = self.client_skt.recv(chunk_size)
-                            if not data:
-                                raise ConnectionError("Connection lost during file reception.")
-                            f.write(data)
-                            received_size += len(data)
-                            remaining -= len(data)
-                            progress = int(received_size * 100 / file_size)
-                            self.progress_update.emit(progress)
+                        self.recv_buffer.recv_into_file(self.client_skt, f, file_size, on_chunk, self.chunk_sizer)
 
                     if encrypted_transfer:
                         self.encrypted_files.append(full_file_path)
@@ -212,20 +223,16 @@ class ReceiveWorkerSwift(QThread):
 
     def _receive_data(self, socket, size):
         """Helper function to receive a specific amount of data."""
-        received_data = b""
-        while len(received_data) < size:
-            chunk = socket.recv(size - len(received_data))
-            if not chunk:
-                raise ConnectionError("Connection closed before data was completely received.")
-            received_data += chunk
-        return received_data
+        return recv_exact(socket, size)
 
     def receive_metadata(self, file_size):
         """Receive metadata from the sender."""
         received_data = self._receive_data(self.client_skt, file_size)
         try:
             metadata_json = received_data.decode('utf-8')
-            return json.loads(metadata_json)
+            metadata = json.loads(metadata_json)
+            self.manifest = Manifest.from_metadata(metadata)
+            return metadata
         except UnicodeDecodeError as e:
             logger.error("Unicode decode error: %s", e)
             raise
@@ -240,19 +247,18 @@ class ReceiveWorkerSwift(QThread):
         if not default_dir:
             raise ValueError("No save_to_directory configured")
         
-        # Extract base folder name from paths
-        base_folder_name = None
-        for file_info in metadata:
-            path = file_info.get('path', '')
-            if path.endswith('/'):
-                base_folder_name = path.rstrip('/').split('/')[0]
-                logger.debug("Found base folder name: %s", base_folder_name)
-                break
+        # The last entry names the base folder, folder paths may be relative to it
+        base_folder_name = metadata[-1].get('base_folder_name', '')
+        logger.debug("Base folder name from last metadata entry: %s", base_folder_name)
 
-        # If base folder name not found, use the last entry
+        # Otherwise extract it from the paths
         if not base_folder_name:
-            base_folder_name = metadata[-1].get('base_folder_name', '')
-            logger.debug("Base folder name from last metadata entry: %s", base_folder_name)
+            for file_info in metadata:
+                path = file_info.get('path', '')
+                if path.endswith('/'):
+                    base_folder_name = path.rstrip('/').split('/')[0]
+                    logger.debug("Found base folder name: %s", base_folder_name)
+                    break
 
         if not base_folder_name:
             raise ValueError("Base folder name not found in metadata")
@@ -262,10 +268,9 @@ class ReceiveWorkerSwift(QThread):
         destination_folder = self._get_unique_folder_name(destination_folder)
         logger.debug("Destination folder: %s", destination_folder)
         
-        # Create the root folder if it does not exist
-        if not os.path.exists(destination_folder):
-            os.makedirs(destination_folder)
-            logger.debug("Created root folder: %s", destination_folder)
+        # Create the root folder
+        self.planner.makedirs(destination_folder)
+        logger.debug("Created root folder: %s", destination_folder)
         
         # Store base folder name for use in receive_files
         self.base_folder_name = base_folder_name
@@ -274,31 +279,17 @@ class ReceiveWorkerSwift(QThread):
 
     def _get_unique_folder_name(self, folder_path):
         """Append a unique (i) to folder name if it already exists."""
-        base_folder_path = folder_path
-        i = 1
-        while os.path.exists(folder_path):
-            folder_path = f"{base_folder_path} ({i})"
-            i += 1
-        return folder_path
+        return self.planner.unique_folder(folder_path)
 
     def _get_unique_file_name(self, file_path):
         """Append a unique (i) to file name if it already exists."""
-        base, extension = os.path.splitext(file_path)
-        i = 1
-        new_file_path = file_path
-        while os.path.exists(new_file_path):
-            new_file_path = f"{base} ({i}){extension}"
-            i += 1
-        return new_file_path
+        return self.planner.unique_file(file_path)
     #com.an.Datadash
 
 
     def get_relative_path_from_metadata(self, file_name):
         """Get the relative path of a file from the metadata."""
-        for file_info in self.metadata:
-            if os.path.basename(file_info['path']) == file_name:
-                return file_info['path']
-        return file_name
+        return self.manifest.relative_path(file_name)
 
     def get_file_path(self, file_name):
         """Get the file path for saving the received file."""
@@ -352,7 +343,7 @@ class ReceiveAppPSwift(QWidget):
         self.progress_bar.setVisible(False)  # Initially hidden
         
         self.file_receiver = ReceiveWorkerSwift(client_ip)
-        self.file_receiver.progress_update.connect(self.updateProgressBar)
+        self.file_receiver.progress.overall_progress.connect(self.updateProgressBar)
         self.file_receiver.decrypt_signal.connect(self.decryptor_init)
         self.file_receiver.receiving_started.connect(self.show_progress_bar)  # Connect new signal
         #com.an.Datadash
@@ -535,6 +526,7 @@ class ReceiveAppPSwift(QWidget):
     def decryptor_init(self, value):
         logger.debug("Received decrypt signal with filelist %s", value)
         if value:
+            from crypt_handler import Decryptor
             self.decryptor = Decryptor(value)
             self.decryptor.show()
 
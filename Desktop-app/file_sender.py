@@ -1,3 +1,4 @@
+import hashlib
 import json
 import platform
 import tempfile
@@ -11,12 +12,24 @@ from PyQt6.QtGui import QScreen, QFont, QColor, QKeyEvent, QKeySequence, QIcon
 from PyQt6.QtCore import QThread, pyqtSignal, Qt, QElapsedTimer, QTimer, QSize
 import os
 import socket
+import stat
 import struct
 from constant import ConfigManager  # Updated import
 from loges import logger
-from crypt_handler import encrypt_file
+from progress_bus import ProgressBus
 from time import sleep
-from portsss import RECEIVER_DATA_DESKTOP, CHUNK_SIZE_DESKTOP
+from portsss import (RECEIVER_DATA_DESKTOP, CHUNK_SIZE_DESKTOP, PARALLEL_MIN_FILE_SIZE, RESUME_ATTEMPTS, RESUME_DELAY,
+                     PACK_FILE_MAX)
+from transfer_io import send_file_range, recv_exact
+from parallel_transfer import ParallelSender
+from packed_batch import BatchPacker
+from compression import CompressionPolicy, FrameCompressor, negotiate_codec
+from chunk_tuner import ChunkSizer
+from integrity import Checksum, CHECKSUM_RETRIES, trailer
+from delta_sync import decode_signatures, send_delta
+from read_ahead import open_for_sending, FilePrefetcher
+from manifest import ManifestWriter
+from folder_scanner import ScanCache, scan_folder, iter_scan
 import time
 
 class ProgressBarDelegate(QStyledItemDelegate):
@@ -54,21 +67,42 @@ class FileSender(QThread):
     progress_update = pyqtSignal(int)
     file_send_completed = pyqtSignal(str)
     transfer_finished = pyqtSignal()
-    file_count_update = pyqtSignal(int, int, int)  # total_files, files_sent, files_pending
-    file_progress_update = pyqtSignal(str, int)  # file_path, progress
-    overall_progress_update = pyqtSignal(int)  # overall progress
-    transfer_stats_update = pyqtSignal(float, float, float)  # speed, eta, elapsed
+    transfer_stats_update = pyqtSignal(float, float, float, int)  # speed, eta, elapsed, chunk_size
 
     password = None
 
-    def __init__(self, ip_address, file_paths, password=None, receiver_data=None):
+    def __init__(self, ip_address, file_paths, password=None, receiver_data=None, encrypt=None):
         super().__init__()
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         self.ip_address = ip_address
         self.file_paths = file_paths
         self.password = password
+        # Encrypt the transfer, None follows the encryption setting
+        self.encrypt = encrypt
         self.receiver_data = receiver_data
+        self.peer_features = set((receiver_data or {}).get('features', []))
+        # Receivers that understand the framed AES-GCM stream decrypt on the fly,
+        # one salt per session keeps the PBKDF2 cost to a single derivation.
+        self.stream_encryption = 'gcm_stream' in self.peer_features
+        self.session_salt = os.urandom(16)
+        self.parallel_sender = None
+        # Codec both sides support, None if the receiver does not decompress
+        self.compression = CompressionPolicy(negotiate_codec((receiver_data or {}).get('compression')))
+        # Checksum both sides support, None for receivers that do not verify files
+        self.checksum = Checksum.negotiate((receiver_data or {}).get('checksums'))
+        # Files sent with a checksum, {relative_path: file_path}, for re-sending failures
+        self.sent_paths = {}
+        # Receiver's checkpoints of this selection, {relative_path: [committed, size]}
+        self.resume_offsets = {}
+        self.transfer_id = self.compute_transfer_id()
+        # Folders streamed to the receiver are counted while they are walked, not up front
+        self.stream_folders = 'streaming_manifest' in self.peer_features
+        self.scanning = False
+        # Folders scanned once and reused for counting, sizing, the manifest and sending, {path: FileList}
+        self.scans = {}
         self.total_files = self.count_total_files()
         self.files_sent = 0
         self.total_size = self.calculate_total_size()
@@ -77,12 +111,23 @@ class FileSender(QThread):
         self.last_update_time = None
         self.last_bytes_sent = 0
 
+    def scan(self, folder_path):
+        """Return the FileList of folder_path, scanning it on first use."""
+        file_list = self.scans.get(folder_path)
+        if file_list is None:
+            file_list = self.scans[folder_path] = scan_folder(folder_path, cache=self.scan_cache(folder_path))
+        return file_list
+
+    def scan_cache(self, folder_path):
+        return ScanCache(self.get_temp_dir(), folder_path)
+
     def count_total_files(self):
         total = 0
         for path in self.file_paths:
             if os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    total += len(files)
+                if self.stream_folders:
+                    continue
+                total += self.scan(path).total_files
             else:
                 total += 1
         return total
@@ -91,9 +136,9 @@ class FileSender(QThread):
         total_size = 0
         for path in self.file_paths:
             if os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    for file in files:
-                        total_size += os.path.getsize(os.path.join(root, file))
+                if self.stream_folders:
+                    continue
+                total_size += self.scan(path).total_size
             else:
                 total_size += os.path.getsize(path)
         return total_size
@@ -111,6 +156,7 @@ class FileSender(QThread):
         # Create a new TCP socket
         self.client_skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client_skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_DESKTOP)
         #com.an.Datadash
 
         # Use dynamic port assignment to avoid WinError 10048
@@ -145,30 +191,134 @@ class FileSender(QThread):
         except:
             pass
 
-        metadata_file_path = None
-        self.metadata_created = False
         if not self.initialize_connection():
             return
         
-        self.encryption_flag = self.config_manager.get_config()["encryption"]
+        config = self.config_manager.get_config()
+        self.encryption_flag = config["encryption"] if self.encrypt is None else self.encrypt
+        # Large plain files go over several connections when the receiver supports it,
+        # 0 streams means the count is tuned from measured throughput
+        parallel_streams = config.get("parallel_streams", 0)
+        if 'parallel_streams' in self.peer_features and parallel_streams != 1:
+            self.parallel_sender = ParallelSender(self.ip_address, RECEIVER_DATA_DESKTOP, parallel_streams)
+
+        attempts = 0
+        while True:
+            try:
+                self.send_selection()
+                break
+            except OSError as e:
+                # Receivers with a resume journal keep what arrived, reconnect and continue
+                attempts += 1
+                if 'resume' not in self.peer_features or attempts > RESUME_ATTEMPTS:
+                    raise
+                logger.warning("Connection lost (%s), resuming transfer, attempt %d", e, attempts)
+                sleep(RESUME_DELAY)
+                if not self.initialize_connection():
+                    return
+
+        logger.debug("Sent halt signal")
+        self.client_skt.send('encyp: h'.encode())
+        self.client_skt.close()
+        self.progress.flush()
+        self.transfer_finished.emit()
+        #com.an.Datadash
+
+    def send_selection(self):
+        """Send all selected files and folders, skipping what the receiver already holds."""
+        metadata_file_path = None
+        self.metadata_created = False
+        self.sent_size = 0
+        self.files_sent = 0
+        if self.stream_folders:
+            # Counted again while the folders are walked
+            self.total_files = self.count_total_files()
+            self.total_size = self.calculate_total_size()
+        if 'resume' in self.peer_features:
+            self.resume_offsets = self.query_resume()
+        if self.checksum:
+            logger.debug("Verifying files with %s", self.checksum.name)
+            self.client_skt.sendall(b'encyp: k' + struct.pack('<B', self.checksum.id))
 
         for file_path in self.file_paths:
             if os.path.isdir(file_path):
                 self.send_folder(file_path)
             else:
                 if not self.metadata_created:
-                    metadata_file_path = self.create_metadata(file_paths=self.file_paths)
-                    self.send_file(metadata_file_path, count=False)
+                    if 'binary_manifest' in self.peer_features:
+                        self.send_manifest(file_paths=self.file_paths)
+                    else:
+                        metadata_file_path = self.create_metadata(file_paths=self.file_paths)
+                        self.send_file(metadata_file_path, count=False)
                 self.send_file(file_path, encrypted_transfer=self.encryption_flag)
         
         if self.metadata_created and metadata_file_path:
             os.remove(metadata_file_path)
-            
-        logger.debug("Sent halt signal")
-        self.client_skt.send('encyp: h'.encode())
-        self.client_skt.close()
-        self.transfer_finished.emit()
-        #com.an.Datadash
+
+        if self.checksum:
+            self.resend_failed()
+
+    def compute_transfer_id(self):
+        """Identify this selection, so a reconnect or a repeated send can resume it."""
+        digest = hashlib.sha256(platform.node().encode())
+        for path in self.file_paths:
+            file_stat = os.stat(path)
+            size = 0 if os.path.isdir(path) else file_stat.st_size
+            digest.update(f"{os.path.abspath(path)}|{size}|{file_stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()[:32]
+
+    def query_resume(self):
+        """Ask the receiver which bytes of this transfer it already has."""
+        query = json.dumps({'transfer_id': self.transfer_id}).encode('utf-8')
+        self.client_skt.sendall(b'encyp: r' + struct.pack('<Q', len(query)) + query)
+        reply_size = struct.unpack('<Q', recv_exact(self.client_skt, 8))[0]
+        reply = json.loads(recv_exact(self.client_skt, reply_size).decode('utf-8'))
+        logger.debug("Receiver holds %d files of this transfer", len(reply['files']))
+        return reply['files']
+
+    def resend_failed(self):
+        """Ask the receiver which files failed verification and send them again."""
+        for attempt in range(CHECKSUM_RETRIES + 1):
+            self.client_skt.sendall(b'encyp: v')
+            reply_size = struct.unpack('<Q', recv_exact(self.client_skt, 8))[0]
+            failed = json.loads(recv_exact(self.client_skt, reply_size).decode('utf-8'))
+            if not failed:
+                return
+            if attempt == CHECKSUM_RETRIES:
+                logger.error("%d files still fail verification, giving up", len(failed))
+                return
+            logger.warning("%d files failed verification, sending them again", len(failed))
+            for relative_path in failed:
+                file_path = self.sent_paths.get(relative_path)
+                if file_path is None:
+                    logger.error("Receiver reported unknown file %s", relative_path)
+                    continue
+                # The receiver discarded its copy, so it is sent whole and not counted twice
+                self.resume_offsets.pop(relative_path, None)
+                self.sent_size -= os.path.getsize(file_path)
+                self.send_file(file_path, relative_file_path=relative_path, count=False)
+
+    def query_signatures(self):
+        """Ask the receiver for the chunk signatures of its earlier copy of the folder."""
+        self.client_skt.sendall(b'encyp: d')
+        reply_size = struct.unpack('<Q', recv_exact(self.client_skt, 8))[0]
+        signatures = decode_signatures(recv_exact(self.client_skt, reply_size))
+        logger.debug("Receiver has an earlier copy of %d files", len(signatures))
+        return signatures
+
+    def already_received(self, relative_path, size):
+        committed, expected = self.resume_offsets.get(relative_path, (0, None))
+        return expected == size and committed == size
+
+    def skip_file(self, file_path, file_size):
+        """Account a file the receiver kept from an interrupted attempt as sent."""
+        logger.debug("Receiver already has %s, skipping", file_path)
+        self.sent_size += file_size
+        self.files_sent += 1
+        self.progress.report_file(file_path, 100)
+        self.progress.report_counts(self.total_files, self.files_sent, self.total_files - self.files_sent)
+        if self.total_size:
+            self.progress.report_overall(min(self.sent_size * 100 // self.total_size, 100))
 
     def get_temp_dir(self):
         system = platform.system()
@@ -196,23 +346,9 @@ class FileSender(QThread):
     def create_metadata(self, folder_path=None, file_paths=None):
         temp_dir = self.get_temp_dir()
         if folder_path:
-            metadata = []
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, folder_path).replace('\\', '/')
-                    file_size = os.path.getsize(file_path)
-                    metadata.append({
-                        'path': relative_path,
-                        'size': file_size
-                    })
-                for dir in dirs:
-                    dir_path = os.path.join(root, dir)
-                    relative_path = os.path.relpath(dir_path, folder_path).replace('\\', '/')
-                    metadata.append({
-                        'path': relative_path + '/',
-                        'size': 0
-                    })
+            file_list = self.scan(folder_path)
+            metadata = [{'path': relative_path, 'size': size} for relative_path, size in file_list.items()]
+            metadata.extend({'path': relative_path + '/', 'size': 0} for relative_path in file_list.folders)
             metadata.append({'base_folder_name': os.path.basename(folder_path), 'path': '.delete', 'size': 0})
             metadata_json = json.dumps(metadata)
             metadata_file_path = os.path.join(temp_dir, 'metadata.json')
@@ -235,140 +371,357 @@ class FileSender(QThread):
             self.metadata_created = True
             return metadata_file_path
             
+    def send_manifest(self, folder_path=None, file_paths=None):
+        """Stream the binary manifest of a folder or of file_paths while walking it.
+
+        Returns the (relative_path, size) of every file in the manifest.
+        """
+        writer = ManifestWriter(self.client_skt, os.path.basename(folder_path) if folder_path else '')
+        if folder_path:
+            file_list = self.scan(folder_path)
+            for folder in file_list.folders:
+                writer.add_folder(folder)
+            for i, relative_path in enumerate(file_list.paths):
+                writer.add_file(relative_path, file_list.sizes[i], file_list.mtimes[i], file_list.modes[i])
+            files = file_list.items()
+        else:
+            files = []
+            for file_path in file_paths:
+                file_stat = os.stat(file_path)
+                writer.add_file(os.path.basename(file_path), file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_mode)
+                files.append((os.path.basename(file_path), file_stat.st_size))
+        writer.close()
+        self.metadata_created = True
+        logger.debug("Sent manifest of %d files", writer.total_files)
+        return files
+
+    def stream_manifest(self, folder_path):
+        """Walk folder_path and stream its manifest a block at a time.
+
+        Yields the (relative_path, size) of the files of every block once the
+        receiver has it, so they can be sent while the walk goes on. The
+        transfer totals grow with every block.
+        """
+        writer = ManifestWriter(self.client_skt, os.path.basename(folder_path), streamed=True)
+        self.metadata_created = True
+        self.scanning = True
+        files = []
+        try:
+            for relative_folder, folder_names, entries in iter_scan(folder_path, cache=self.scan_cache(folder_path)):
+                prefix = relative_folder + '/' if relative_folder else ''
+                for name in folder_names:
+                    writer.add_folder(prefix + name)
+                for name, size, mtime_ns, mode in entries:
+                    files.append((prefix + name, size))
+                    if writer.add_file(prefix + name, size, mtime_ns, mode):
+                        self.count_streamed(files)
+                        yield files
+                        files = []
+            writer.close()
+            self.scanning = False
+            self.count_streamed(files)
+            logger.debug("Streamed manifest of %d files", writer.total_files)
+            yield files
+        finally:
+            self.scanning = False
+
+    def count_streamed(self, files):
+        """Add the files of a streamed manifest block to the transfer totals."""
+        self.total_files += len(files)
+        self.total_size += sum(size for _, size in files)
+        self.progress.report_counts(self.total_files, self.files_sent, self.total_files - self.files_sent)
+
+    def send_metadata_file(self, folder_path):
+        """Send the metadata.json of a folder to receivers without binary manifests.
+
+        Returns the (relative_path, size) of every entry in it.
+        """
+        metadata_file_path = self.create_metadata(folder_path=folder_path)
+        with open(metadata_file_path, 'rb') as f:
+            metadata_content = f.read()
+        os.remove(metadata_file_path)
+
+        # Send metadata file with proper headers
+        encryption_flag = 'encyp: f'
+        file_name = 'metadata.json'
+        file_name_size = len(file_name.encode())
+        file_size = len(metadata_content)
+
+        # Send headers
+        self.client_skt.send(encryption_flag.encode())
+        self.client_skt.send(struct.pack('<Q', file_name_size))
+        self.client_skt.send(file_name.encode('utf-8'))
+        self.client_skt.send(struct.pack('<Q', file_size))
+
+        # Send metadata content
+        self.client_skt.sendall(metadata_content)
+        return [(file_info['path'], file_info['size']) for file_info in json.loads(metadata_content)]
+
     def send_folder(self, folder_path):
         print("Sending folder")
         try:
             if not self.metadata_created:
-                # Create and send metadata first
-                metadata_file_path = self.create_metadata(folder_path=folder_path)
-                with open(metadata_file_path, 'rb') as f:
-                    metadata_content = f.read()
-                
-                # Send metadata file with proper headers
-                encryption_flag = 'encyp: f'
-                file_name = 'metadata.json'
-                file_name_size = len(file_name.encode())
-                file_size = len(metadata_content)
-
-                # Send headers
-                self.client_skt.send(encryption_flag.encode())
-                self.client_skt.send(struct.pack('<Q', file_name_size))
-                self.client_skt.send(file_name.encode('utf-8'))
-                self.client_skt.send(struct.pack('<Q', file_size))
-
-                # Send metadata content in chunks
-                sent = 0
-                while sent < file_size:
-                    chunk = metadata_content[sent:sent + CHUNK_SIZE_DESKTOP]
-                    self.client_skt.send(chunk)
-                    sent += len(chunk)
-
-                # Read metadata for processing
-                metadata = json.loads(open(metadata_file_path).read())
-
-                # Calculate total folder size and prepare files
-                folder_total_size = sum(file_info['size'] for file_info in metadata 
-                                     if not file_info['path'].endswith('.delete') and file_info['size'] > 0)
+                # Send the manifest first, streamed receivers get it in blocks followed by their files
+                if self.stream_folders:
+                    blocks = self.stream_manifest(folder_path)
+                elif 'binary_manifest' in self.peer_features:
+                    blocks = [self.send_manifest(folder_path=folder_path)]
+                else:
+                    blocks = [self.send_metadata_file(folder_path)]
+
+                folder_total_size = 0
                 folder_sent_size = 0
 
-                # Send each file
-                for file_info in metadata:
-                    if not file_info['path'].endswith('.delete') and file_info['size'] > 0:
-                        relative_file_path = file_info['path']
-                        file_path = os.path.join(folder_path, relative_file_path)
-                        if self.encryption_flag:
-                            relative_file_path += ".crypt"
-                        
-                        # Send the actual file
-                        if os.path.exists(file_path):
-                            self.send_file(file_path, relative_file_path=relative_file_path, 
-                                         encrypted_transfer=self.encryption_flag)
-                            folder_sent_size += file_info['size']
-                            folder_progress = folder_sent_size * 100 // folder_total_size
-                            self.file_progress_update.emit(folder_path, folder_progress)
-
-                os.remove(metadata_file_path)
+                # Small plain files are packed into batches when the receiver supports it
+                packer = None
+                if not self.encryption_flag and 'packed_batches' in self.peer_features:
+                    packer = BatchPacker(self.checksum)
+
+                for files in blocks:
+                    # Folders and the base folder entry have nothing to send. Empty files are
+                    # left out once they are sent, the listed size may come from the scan cache
+                    files = [(relative_path, size) for relative_path, size in files
+                             if not relative_path.endswith(('.delete', '/'))]
+                    folder_total_size += sum(size for _, size in files)
+
+                    # Files the receiver holds an earlier copy of are sent as deltas
+                    signatures = {}
+                    if not self.encryption_flag and 'delta_sync' in self.peer_features:
+                        signatures = self.query_signatures()
+
+                    folder_sent_size, folder_total_size = self.send_folder_files(
+                        folder_path, files, packer, signatures, folder_sent_size, folder_total_size)
+
+                if packer:
+                    self.send_batch(packer)
 
             # Ensure 100% progress is emitted for folder
-            self.file_progress_update.emit(folder_path, 100)
-            if self.files_sent == self.total_files:
-                self.overall_progress_update.emit(100)
+            self.progress.report_file(folder_path, 100)
+            if self.files_sent == self.total_files and not self.scanning:
+                self.progress.report_overall(100)
 
         except Exception as e:
             logger.error(f"Error in send_folder: {str(e)}")
             raise
 
-    def send_file(self, file_path, relative_file_path=None, encrypted_transfer=False, count=True):
+    def send_folder_files(self, folder_path, files, packer, signatures, folder_sent_size, folder_total_size):
+        """Send files of folder_path, returns the folder bytes sent and to send so far.
+
+        Listed sizes may come from the scan cache, which does not notice files
+        edited in place. Every file is stat'ed again before it is sent, that size
+        decides whether it is sent and corrects the progress totals.
+        """
+        # Upcoming files are read ahead while earlier ones are sent
+        with FilePrefetcher(
+            [(os.path.join(folder_path, relative_path), size) for relative_path, size in files],
+            PACK_FILE_MAX if packer is not None else 0) as prefetcher:
+            # Send each file
+            for relative_file_path, listed_size in files:
+                file_path = os.path.join(folder_path, relative_file_path)
+                prefetched = prefetcher.take(file_path)
+                if self.encryption_flag and not self.stream_encryption:
+                    relative_file_path += ".crypt"
+
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                file_size = file_stat.st_size
+                if file_size != listed_size:
+                    folder_total_size += file_size - listed_size
+                    self.total_size += file_size - listed_size
+                if file_size == 0 or not stat.S_ISREG(file_stat.st_mode):
+                    continue
+
+                # Send the actual file
+                if self.already_received(relative_file_path, file_size):
+                    self.skip_file(file_path, file_size)
+                elif relative_file_path in signatures:
+                    self.send_file(file_path, relative_file_path=relative_file_path,
+                                   signature=signatures[relative_file_path])
+                elif packer is not None and packer.accepts(file_size):
+                    packer.add(file_path, relative_file_path, prefetched)
+                    self.sent_paths[relative_file_path] = file_path
+                    if packer.full():
+                        self.send_batch(packer)
+                else:
+                    self.send_file(file_path, relative_file_path=relative_file_path, 
+                                 encrypted_transfer=self.encryption_flag)
+                folder_sent_size += file_size
+                folder_progress = min(folder_sent_size * 100 // folder_total_size, 100)
+                self.progress.report_file(folder_path, folder_progress)
+        return folder_sent_size, folder_total_size
+
+    def send_file(self, file_path, relative_file_path=None, encrypted_transfer=False, count=True, signature=None):
         logger.debug("Sending file: %s", file_path)
 
-        if encrypted_transfer:
-            logger.debug("Encrypted transfer with password: %s", self.password)
-            file_path = encrypt_file(file_path, self.password)
-
-        sent_size = 0
-        file_size = os.path.getsize(file_path)
         if relative_file_path is None:
             relative_file_path = os.path.basename(file_path)
+
+        # Encrypted payloads are produced while sending, no temporary copy is written
+        if encrypted_transfer and self.stream_encryption:
+            logger.debug("Streaming AES-GCM encrypted transfer")
+            from crypt_handler import GCMEncryptReader
+            source = GCMEncryptReader(file_path, self.password, self.session_salt)
+            file_size = source.size
+            encryption_flag = 'encyp: s'
+        elif encrypted_transfer:
+            logger.debug("Streaming AES-CBC encrypted transfer")
+            from crypt_handler import CBCEncryptReader
+            source = CBCEncryptReader(file_path, self.password)
+            file_size = source.size
+            encryption_flag = 'encyp: t'
+            if not relative_file_path.endswith('.crypt'):
+                relative_file_path += '.crypt'
+        else:
+            file_size = os.path.getsize(file_path)
+            if signature is not None:
+                source = None
+                encryption_flag = 'encyp: e'
+            elif count and self.compression.should_compress(file_path, file_size):
+                source = None
+                encryption_flag = 'encyp: z'
+            elif self.parallel_sender and file_size >= PARALLEL_MIN_FILE_SIZE:
+                source = None
+                encryption_flag = 'encyp: p'
+            else:
+                source = None
+                encryption_flag = 'encyp: f'
+
+        if count and self.already_received(relative_file_path, file_size):
+            if source is not None:
+                source.close()
+            self.skip_file(file_path, file_size)
+            return True
+
+        # Plain files interrupted mid-way continue at the receiver's last checkpoint
+        resume_offset = 0
+        committed, expected = self.resume_offsets.get(relative_file_path, (0, None))
+        if encryption_flag in ('encyp: f', 'encyp: p', 'encyp: z', 'encyp: e') and expected == file_size and 0 < committed < file_size:
+            resume_offset = committed
+            encryption_flag = 'encyp: c'
+            logger.debug("Resuming %s at byte %d", relative_file_path, resume_offset)
+
+        sent_size = resume_offset
+        self.sent_size += resume_offset
         file_name_size = len(relative_file_path.encode())
         logger.debug("Sending %s, %s", relative_file_path, file_size)
 
-        encryption_flag = 'encyp: t' if encrypted_transfer else 'encyp: f'
-
-        self.client_skt.send(encryption_flag.encode())
+        # Flag, name and size go out in a single send
+        header = (encryption_flag.encode() + struct.pack('<Q', file_name_size) +
+                  relative_file_path.encode('utf-8') + struct.pack('<Q', file_size))
+        if resume_offset:
+            header += struct.pack('<Q', resume_offset)
+        # Unencrypted payloads are hashed while they are sent, except the metadata
+        hasher = None
+        if self.checksum and encryption_flag in ('encyp: f', 'encyp: c', 'encyp: z', 'encyp: e') and relative_file_path != 'metadata.json':
+            hasher = self.checksum.new()
+        if hasher or (self.checksum and encryption_flag == 'encyp: p'):
+            self.sent_paths[relative_file_path] = file_path
+        if encryption_flag in ('encyp: f', 'encyp: c'):
+            source = open_for_sending(file_path, resume_offset)
+        if encryption_flag == 'encyp: z':
+            # Frames are compressed in a worker thread while earlier ones are sent
+            compressor = FrameCompressor(file_path, self.compression.codec, hasher)
+            header += struct.pack('<B', compressor.codec_id)
+        self.client_skt.sendall(header)
         logger.debug("Sent encryption flag: %s", encryption_flag)
-
-        self.client_skt.send(struct.pack('<Q', file_name_size))
-        self.client_skt.send(relative_file_path.encode('utf-8'))
-        self.client_skt.send(struct.pack('<Q', file_size))
         #com.an.Datadash
 
         if not self.start_time:
             self.start_time = time.time()
         self.last_update_time = time.time()
 
-        with open(file_path, 'rb') as f:
-            while sent_size < file_size:
-                current_time = time.time()
-                data = f.read(CHUNK_SIZE_DESKTOP)
-                self.client_skt.sendall(data)
-                sent_size += len(data)
-                self.sent_size += len(data)
-
-                # Calculate transfer statistics every 0.5 seconds
-                if current_time - self.last_update_time >= 0.5:
-                    elapsed = current_time - self.start_time
-                    if elapsed > 0:
-                        speed = (self.sent_size / (1024 * 1024)) / elapsed  # MB/s
-                        eta = (file_size - sent_size) / (self.sent_size / elapsed) if self.sent_size > 0 else 0
-                    else:
-                        speed = 0
-                        eta = 0
-                    self.transfer_stats_update.emit(speed, eta, elapsed)
-                    self.last_update_time = current_time
-
-                self.file_progress_update.emit(file_path, sent_size * 100 // file_size)
-                overall_progress = self.sent_size * 100 // self.total_size
-                self.overall_progress_update.emit(overall_progress)
+        def on_progress(n):
+            nonlocal sent_size
+            current_time = time.time()
+            sent_size += n
+            self.sent_size += n
+
+            # Calculate transfer statistics every 0.5 seconds
+            if current_time - self.last_update_time >= 0.5:
+                elapsed = current_time - self.start_time
+                if elapsed > 0:
+                    speed = (self.sent_size / (1024 * 1024)) / elapsed  # MB/s
+                    eta = (file_size - sent_size) / (self.sent_size / elapsed) if self.sent_size > 0 else 0
+                else:
+                    speed = 0
+                    eta = 0
+                chunk_size = self.chunk_sizer.size
+                if encryption_flag == 'encyp: p' and self.parallel_sender.throughput:
+                    # Roll the per-stream measurements up into one figure
+                    speed = self.parallel_sender.throughput / (1024 * 1024)
+                    eta = (file_size - sent_size) / self.parallel_sender.throughput
+                    chunk_size = self.parallel_sender.chunk_size
+                self.transfer_stats_update.emit(speed, eta, elapsed, chunk_size)
+                self.last_update_time = current_time
+
+            self.progress.report_file(file_path, sent_size * 100 // file_size)
+            overall_progress = self.sent_size * 100 // self.total_size
+            self.progress.report_overall(overall_progress)
+
+        if encryption_flag == 'encyp: p':
+            self.parallel_sender.send(self.client_skt, file_path, file_size, on_progress, self.checksum)
+        elif encryption_flag == 'encyp: z':
+            try:
+                for frame, raw_size in compressor:
+                    self.client_skt.sendall(frame)
+                    self.chunk_sizer.record(len(frame))
+                    on_progress(raw_size)
+            finally:
+                compressor.close()
+            self.compression.record(file_path, compressor.raw_size, compressor.stored_size)
+        elif encryption_flag == 'encyp: e':
+            send_delta(self.client_skt, file_path, signature, on_progress, hasher)
+        else:
+            with source:
+                send_file_range(self.client_skt, source, resume_offset, file_size - resume_offset,
+                                CHUNK_SIZE_DESKTOP, on_progress, self.chunk_sizer, hasher)
+        if hasher:
+            self.client_skt.sendall(trailer(hasher))
 
         # Ensure 100% progress is emitted for both file and overall progress
-        self.file_progress_update.emit(file_path, 100)
+        self.progress.report_file(file_path, 100)
         overall_progress = self.sent_size * 100 // self.total_size
-        self.overall_progress_update.emit(overall_progress)
+        self.progress.report_overall(overall_progress)
 
         if count:
             self.files_sent += 1
             files_pending = self.total_files - self.files_sent
-            self.file_count_update.emit(self.total_files, self.files_sent, files_pending)
+            self.progress.report_counts(self.total_files, self.files_sent, files_pending)
 
         # Final progress update after file completion
-        if self.files_sent == self.total_files:
-            self.overall_progress_update.emit(100)
-
-        if encrypted_transfer:
-            os.remove(file_path)
+        if self.files_sent == self.total_files and not self.scanning:
+            self.progress.report_overall(100)
 
         return True
 
+    def send_batch(self, packer):
+        """Send the files collected in packer as one packed frame."""
+        files = len(packer)
+        if not files:
+            return
+        payload_size = len(packer.payload)
+        logger.debug("Sending packed batch of %d files, %d bytes", files, payload_size)
+        if not self.start_time:
+            self.start_time = time.time()
+        self.client_skt.sendall(packer.frame())
+        self.chunk_sizer.record(payload_size)
+
+        self.sent_size += payload_size
+        self.files_sent += files
+        self.progress.report_counts(self.total_files, self.files_sent, self.total_files - self.files_sent)
+        overall_progress = self.sent_size * 100 // self.total_size if self.total_size else 100
+        self.progress.report_overall(overall_progress)
+
+        current_time = time.time()
+        if current_time - (self.last_update_time or 0) >= 0.5:
+            elapsed = current_time - self.start_time
+            speed = (self.sent_size / (1024 * 1024)) / elapsed if elapsed > 0 else 0
+            eta = (self.total_size - self.sent_size) / (self.sent_size / elapsed) if elapsed > 0 and self.sent_size else 0
+            self.transfer_stats_update.emit(speed, eta, elapsed, self.chunk_sizer.size)
+            self.last_update_time = current_time
+
     def closeEvent(self, event):
         #close all sockets and unbind the sockets
         self.client_skt.close()
@@ -377,6 +730,8 @@ class FileSender(QThread):
     def stop(self):
         """Sets the stop signal to True and closes the socket if it's open."""
         self.stop_signal = True
+        if self.parallel_sender:
+            self.parallel_sender.stop()
         if self.client_skt:
             try:
                 self.client_skt.close()
@@ -387,10 +742,9 @@ class SendApp(QWidget):
 
     def __init__(self, ip_address, device_name, receiver_data):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.ip_address = ip_address
         self.device_name = device_name
         self.receiver_data = receiver_data
@@ -480,9 +834,8 @@ class SendApp(QWidget):
         name_item.setToolTip(file_path)
         self.file_table.setItem(row_position, 2, name_item)
 
-        total_size = self.get_folder_size(file_path)
-        file_count = sum([len(files) for _, _, files in os.walk(file_path)])
-        size_str = self.format_size(total_size, file_count)
+        file_list = scan_folder(file_path)
+        size_str = self.format_size(file_list.total_size, file_list.total_files)
      else:
         name_item = QTableWidgetItem(os.path.basename(file_path))
         name_item.setFlags(name_item.flags() ^ Qt.ItemFlag.ItemIsEditable)
@@ -861,16 +1214,6 @@ class SendApp(QWidget):
             self.send_button.setVisible(True)
             #com.an.Datadash
 
-    def get_folder_size(self, folder_path):
-        """Calculate total size of a folder"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-                if os.path.exists(file_path):
-                    total_size += os.path.getsize(file_path)
-        return total_size
-    
     def format_size(self, total_size, file_count=None):
         """Format size string with file count"""
         if total_size >= 1024 * 1024 * 1024:  # GB
@@ -951,9 +1294,9 @@ class SendApp(QWidget):
         self.progress_bar.setVisible(True)
         self.file_sender.file_send_completed.connect(self.fileSent)
         self.file_sender.transfer_finished.connect(self.onTransferFinished)
-        self.file_sender.file_count_update.connect(self.updateFileCounts)
-        self.file_sender.file_progress_update.connect(self.updateFileProgressBar)
-        self.file_sender.overall_progress_update.connect(self.updateOverallProgressBar)
+        self.file_sender.progress.file_counts.connect(self.updateFileCounts)
+        self.file_sender.progress.files_progress.connect(self.updateFilesProgress)
+        self.file_sender.progress.overall_progress.connect(self.updateOverallProgressBar)
         self.file_sender.transfer_stats_update.connect(self.updateTransferStats)
         self.file_sender.start()
         #com.an.Datadash
@@ -967,6 +1310,10 @@ class SendApp(QWidget):
     def updateFileCounts(self, total_files, files_sent, files_pending):
         self.file_counts_label.setText(f"Total files: {total_files} | Completed: {files_sent} | Pending: {files_pending}")
 
+    def updateFilesProgress(self, progress):
+        for file_path, value in progress.items():
+            self.updateFileProgressBar(file_path, value)
+
     def updateFileProgressBar(self, file_path, value):
         if self.encryption_enabled and not file_path.endswith('metadata.json'):
             # Map the encrypted file path back to original file path
@@ -996,8 +1343,8 @@ class SendApp(QWidget):
     def updateOverallProgressBar(self, value):
         self.progress_bar.setValue(value)
 
-    def updateTransferStats(self, speed, eta, elapsed):
-        self.transfer_stats_label.setText(f"Speed: {speed:.2f} MB/s | ETA: {eta:.2f} s | Elapsed: {elapsed:.2f} s")
+    def updateTransferStats(self, speed, eta, elapsed, chunk_size):
+        self.transfer_stats_label.setText(f"Speed: {speed:.2f} MB/s | ETA: {eta:.2f} s | Elapsed: {elapsed:.2f} s | Chunk: {chunk_size // 1024} KB")
         self.transfer_stats_label.setVisible(True)
 
     def onTransferFinished(self):
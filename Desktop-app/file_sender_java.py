@@ -14,10 +14,13 @@ import socket
 import struct
 from constant import ConfigManager
 from loges import logger
-from crypt_handler import encrypt_file
+from progress_bus import ProgressBus
 from time import sleep
 import time
 from portsss import RECEIVER_DATA_ANDROID,CHUNK_SIZE_ANDROID
+from transfer_io import send_file_range
+from chunk_tuner import ChunkSizer
+from folder_scanner import scan_folder
 
 class ProgressBarDelegate(QStyledItemDelegate):
     def paint(self, painter, option, index):
@@ -51,19 +54,17 @@ class ProgressBarDelegate(QStyledItemDelegate):
         return None  # Disable editing
 
 class FileSenderJava(QThread):
-    progress_update = pyqtSignal(int)
     file_send_completed = pyqtSignal(str)
     transfer_finished = pyqtSignal()
-    file_count_update = pyqtSignal(int, int, int)  # total_files, files_sent, files_pending
-    file_progress_update = pyqtSignal(str, int)  # file_path, progress
-    overall_progress_update = pyqtSignal(int)  # overall progress
-    transfer_stats_update = pyqtSignal(float, float, float)
+    transfer_stats_update = pyqtSignal(float, float, float, int)  # speed, eta, elapsed, chunk_size
     password = None
 
     def __init__(self, ip_address, file_paths, password=None, receiver_data=None):
         super().__init__()
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         self.ip_address = ip_address
         self.file_paths = file_paths
         self.password = password
@@ -109,6 +110,7 @@ class FileSenderJava(QThread):
             self.client_skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.client_skt.settimeout(30)  # 30 second timeout
+            self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_ANDROID)
             
             self.client_skt.connect((self.ip_address, RECEIVER_DATA_ANDROID))
             logger.debug(f"Successfully connected to {self.ip_address} on port 57341")
@@ -149,6 +151,7 @@ class FileSenderJava(QThread):
             # Send halt signal after all transfers complete
             logger.debug("Sent halt signal")
             self.client_skt.send('encyp: h'.encode())
+            self.progress.flush()
             self.transfer_finished.emit()
         finally:
             if self.metadata_created and metadata_file_path:
@@ -246,26 +249,32 @@ class FileSenderJava(QThread):
                 # Update the folder's overall progress
                 sent_size_in_folder += os.path.getsize(file_path)
                 folder_progress = int((sent_size_in_folder / total_folder_size) * 100)
-                self.file_progress_update.emit(folder_path, folder_progress)
+                self.progress.report_file(folder_path, folder_progress)
 
         # Ensure 100% progress is emitted for folder
-        self.file_progress_update.emit(folder_path, 100)
+        self.progress.report_file(folder_path, 100)
         if self.files_sent == self.total_files:
-            self.overall_progress_update.emit(100)
+            self.progress.report_overall(100)
 
     def send_file(self, file_path, relative_file_path=None, encrypted_transfer=False):
         logger.debug("Sending file: %s", file_path)
 
-        # Handle file encryption if needed
-        if encrypted_transfer:
-            logger.debug("Encrypted transfer with password: %s", self.password)
-            file_path = encrypt_file(file_path, self.password)
-
         try:
-            file_size = os.path.getsize(file_path)
             if relative_file_path is None:
                 relative_file_path = os.path.basename(file_path)
-            
+
+            # Encrypted payloads are produced while sending, no temporary copy is written
+            if encrypted_transfer:
+                logger.debug("Streaming AES-CBC encrypted transfer")
+                from crypt_handler import CBCEncryptReader
+                source = CBCEncryptReader(file_path, self.password)
+                file_size = source.size
+                if not relative_file_path.endswith('.crypt'):
+                    relative_file_path += '.crypt'
+            else:
+                source = open(file_path, 'rb')
+                file_size = os.path.getsize(file_path)
+
             # Send encryption flag
             encryption_flag = 'encyp: t' if encrypted_transfer else 'encyp: f'
             self.client_skt.send(encryption_flag.encode())
@@ -282,47 +291,46 @@ class FileSenderJava(QThread):
             # Send file data with progress updates
             sent_size = 0
             last_progress_update = 0
-            with open(file_path, 'rb') as f:
-                while sent_size < file_size:
-                    chunk = f.read(CHUNK_SIZE_ANDROID)
-                    if not chunk:
-                        break
-                    self.client_skt.sendall(chunk)
-                    sent_size += len(chunk)
-                    
-                    # Update individual file progress
-                    progress = int(sent_size * 100 / file_size)
-                    if progress != last_progress_update:  # Only emit if progress changed
-                        self.file_progress_update.emit(file_path, progress)
-                        last_progress_update = progress
-                    
-                    # Update overall progress
-                    self.sent_size += len(chunk)
-                    overall_progress = int(self.sent_size * 100 / self.total_size)
-                    self.overall_progress_update.emit(overall_progress)
-                    
-                    # Update transfer statistics
-                    self.update_transfer_stats()
+
+            def on_progress(n):
+                nonlocal sent_size, last_progress_update
+                sent_size += n
+
+                # Update individual file progress
+                progress = int(sent_size * 100 / file_size)
+                if progress != last_progress_update:  # Only emit if progress changed
+                    self.progress.report_file(file_path, progress)
+                    last_progress_update = progress
+
+                # Update overall progress
+                self.sent_size += n
+                overall_progress = int(self.sent_size * 100 / self.total_size)
+                self.progress.report_overall(overall_progress)
+
+                # Update transfer statistics
+                self.update_transfer_stats()
+
+            with source:
+                send_file_range(self.client_skt, source, 0, file_size, CHUNK_SIZE_ANDROID, on_progress, self.chunk_sizer)
 
             # Ensure 100% progress is shown for the individual file
-            self.file_progress_update.emit(file_path, 100)
+            self.progress.report_file(file_path, 100)
             
             # Update file count only for actual files, not metadata
             if not file_path.endswith('metadata.json'):
                 self.files_sent += 1
                 pending = self.total_files - self.files_sent
-                self.file_count_update.emit(self.total_files, self.files_sent, pending)
+                self.progress.report_counts(self.total_files, self.files_sent, pending)
                 
                 # Force overall progress to 100% when all files are sent
                 if self.files_sent == self.total_files:
-                    self.overall_progress_update.emit(100)
-
-            # Clean up encrypted file if it was created
-            if encrypted_transfer and os.path.exists(file_path + ".crypt"):
-                os.remove(file_path + ".crypt")
+                    self.progress.report_overall(100)
 
             return True
 
+        except ConnectionError:
+            # The receiver can no longer tell where the next file starts
+            raise
         except Exception as e:
             logger.error("Error sending file: %s", str(e))
             return False
@@ -348,7 +356,7 @@ class FileSenderJava(QThread):
             else:
                 eta = 0
                 
-            self.transfer_stats_update.emit(speed, eta, elapsed)
+            self.transfer_stats_update.emit(speed, eta, elapsed, self.chunk_sizer.size)
             
             self.last_update_time = current_time
             self.last_bytes_sent = self.sent_size
@@ -383,10 +391,9 @@ class Receiver(QListWidgetItem):
 class SendAppJava(QWidget):
     def __init__(self, ip_address, device_name, receiver_data):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.ip_address = ip_address
         self.device_name = device_name
         self.receiver_data = receiver_data
@@ -761,15 +768,6 @@ class SendAppJava(QWidget):
         if self.file_paths:
             self.send_button.setVisible(True)
 
-    def get_folder_size(self, folder_path):
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-                if os.path.exists(file_path):
-                    total_size += os.path.getsize(file_path)
-        return total_size
-
     def format_size(self, total_size, file_count=None):
         if total_size >= 1024 * 1024 * 1024:  # GB
             size_str = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
@@ -840,9 +838,8 @@ class SendAppJava(QWidget):
         name_item.setToolTip(file_path)
         self.file_table.setItem(row_position, 2, name_item)
 
-        total_size = self.get_folder_size(file_path)
-        file_count = sum([len(files) for _, _, files in os.walk(file_path)])
-        size_str = self.format_size(total_size, file_count)
+        file_list = scan_folder(file_path)
+        size_str = self.format_size(file_list.total_size, file_list.total_files)
      else:
         name_item = QTableWidgetItem(os.path.basename(file_path))
         name_item.setFlags(name_item.flags() ^ Qt.ItemFlag.ItemIsEditable)
@@ -883,6 +880,10 @@ class SendAppJava(QWidget):
         self.send_button.setVisible(False)
      self.checkReadyToSend()
 
+    def updateFilesProgress(self, progress):
+        for file_path, value in progress.items():
+            self.updateFileProgressBar(file_path, value)
+
     def updateFileProgressBar(self, file_path, value):
         if file_path not in self.file_progress_bars:
             if os.path.isdir(file_path) or file_path in self.file_paths:
@@ -890,8 +891,8 @@ class SendAppJava(QWidget):
         if file_path in self.file_progress_bars:
             self.file_progress_bars[file_path].setData(Qt.ItemDataRole.UserRole, value)
 
-    def updateTransferStats(self, speed, eta, elapsed):
-        self.transfer_stats_label.setText(f"Speed: {speed:.2f} MB/s | ETA: {eta:.2f} s | Elapsed: {elapsed:.2f} s")
+    def updateTransferStats(self, speed, eta, elapsed, chunk_size):
+        self.transfer_stats_label.setText(f"Speed: {speed:.2f} MB/s | ETA: {eta:.2f} s | Elapsed: {elapsed:.2f} s | Chunk: {chunk_size // 1024} KB")
         self.transfer_stats_label.setVisible(True)
 
     def sendSelectedFiles(self):
@@ -913,12 +914,11 @@ class SendAppJava(QWidget):
         self.send_button.setVisible(False)
         self.file_sender_java = FileSenderJava(ip_address, self.file_paths, password, self.receiver_data)
         self.progress_bar.setVisible(True)
-        self.file_sender_java.progress_update.connect(self.updateProgressBar)
         self.file_sender_java.file_send_completed.connect(self.fileSent)
         self.file_sender_java.transfer_finished.connect(self.onTransferFinished)
-        self.file_sender_java.file_progress_update.connect(self.updateFileProgressBar)
-        self.file_sender_java.overall_progress_update.connect(self.updateProgressBar)
-        self.file_sender_java.file_count_update.connect(self.updateFileCounts)
+        self.file_sender_java.progress.files_progress.connect(self.updateFilesProgress)
+        self.file_sender_java.progress.overall_progress.connect(self.updateProgressBar)
+        self.file_sender_java.progress.file_counts.connect(self.updateFileCounts)
         self.file_sender_java.transfer_stats_update.connect(self.updateTransferStats)  # Add this line
         self.file_sender_java.start()
         #com.an.Datadash
@@ -13,19 +13,22 @@ import struct
 from PyQt6.QtCore import QThread, pyqtSignal, Qt
 from constant import ConfigManager
 from loges import logger
-from crypt_handler import encrypt_file
+from progress_bus import ProgressBus
 from time import sleep
-from portsss import RECEIVER_DATA_SWIFT
+from portsss import RECEIVER_DATA_SWIFT, CHUNK_SIZE_SWIFT
+from transfer_io import send_file_range
+from chunk_tuner import ChunkSizer
 
 class FileSenderSwift(QThread):
-    progress_update = pyqtSignal(int)
     file_send_completed = pyqtSignal(str)
     password = None
 
     def __init__(self, ip_address, file_paths, password=None, receiver_data=None):
         super().__init__()
-        self.config_manager = ConfigManager()
-        self.config_manager.start()
+        # Progress is reported to the bus, which updates the UI at a fixed rate
+        self.progress = ProgressBus()
+        self.config_manager = ConfigManager.shared()
+        self.config_manager.ensure_checked()
         self.ip_address = ip_address
         self.file_paths = file_paths
         self.password = password
@@ -42,6 +45,7 @@ class FileSenderSwift(QThread):
             self.client_skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.client_skt.settimeout(30)  # 30 second timeout
+            self.chunk_sizer = ChunkSizer(self.client_skt, CHUNK_SIZE_SWIFT)
             
             self.client_skt.connect((self.ip_address, RECEIVER_DATA_SWIFT))
             logger.debug(f"Successfully connected to {self.ip_address} on port 57341")
@@ -178,16 +182,21 @@ class FileSenderSwift(QThread):
         # if self.metadata_created:
         #     self.createmetadata(file_path=file_path)
 
-        # Encrypt the file if encrypted_transfer argument is present
-        if encrypted_transfer:
-            logger.debug("Encrypted transfer with password: %s", self.password)
-
-            file_path = encrypt_file(file_path, self.password)
-
         sent_size = 0
-        file_size = os.path.getsize(file_path)
         if relative_file_path is None:
             relative_file_path = os.path.basename(file_path)  # Default to the base name if relative path isn't provided
+
+        # Encrypted payloads are produced while sending, no temporary copy is written
+        if encrypted_transfer:
+            logger.debug("Streaming AES-CBC encrypted transfer")
+            from crypt_handler import CBCEncryptReader
+            source = CBCEncryptReader(file_path, self.password)
+            file_size = source.size
+            if not relative_file_path.endswith('.crypt'):
+                relative_file_path += '.crypt'
+        else:
+            source = open(file_path, 'rb')
+            file_size = os.path.getsize(file_path)
         file_name_size = len(relative_file_path.encode())
         logger.debug("Sending %s, %s", relative_file_path, file_size)
 
@@ -201,15 +210,13 @@ class FileSenderSwift(QThread):
         self.client_skt.send(relative_file_path.encode('utf-8'))
         self.client_skt.send(struct.pack('<Q', file_size))
 
-        with open(file_path, 'rb') as f:
-            while sent_size < file_size:
-                data = f.read(4096)
-                self.client_skt.sendall(data)
-                sent_size += len(data)
-                self.progress_update.emit(sent_size * 100 // file_size)
+        def on_progress(n):
+            nonlocal sent_size
+            sent_size += n
+            self.progress.report_overall(sent_size * 100 // file_size)
 
-        if encrypted_transfer:
-            os.remove(file_path)
+        with source:
+            send_file_range(self.client_skt, source, 0, file_size, CHUNK_SIZE_SWIFT, on_progress, self.chunk_sizer)
 
         return True
 
@@ -243,10 +250,9 @@ class Receiver(QListWidgetItem):
 class SendAppSwift(QWidget):
     def __init__(self,ip_address,device_name,receiver_data):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.ip_address = ip_address
         self.device_name = device_name
         self.receiver_data = receiver_data
@@ -503,7 +509,7 @@ class SendAppSwift(QWidget):
         self.send_button.setVisible(False)
         self.file_sender_swift = FileSenderSwift(ip_address, self.file_paths, password, self.receiver_data)
         self.progress_bar.setVisible(True)
-        self.file_sender_swift.progress_update.connect(self.updateProgressBar)
+        self.file_sender_swift.progress.overall_progress.connect(self.updateProgressBar)
         self.file_sender_swift.file_send_completed.connect(self.fileSent)
         self.file_sender_swift.start()
         #com.an.Datadash
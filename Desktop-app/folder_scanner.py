@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from loges import logger
+from portsss import SCAN_WORKERS, SCAN_CACHE_MAX_AGE
+
+SCAN_CACHE_DIR_NAME = "scan_cache"
+# A folder changed this shortly before it was listed may change again within the
+# same mtime tick, its listing is not reused
+_RACY_NS = 2 * 10 ** 9
+
+
+class FileList:
+    """Files below a folder with the stat results taken while scanning it.
+
+    Relative paths use '/' and keep the order of os.walk, sizes, mtimes and
+    modes are kept in arrays next to them. folders holds every folder below
+    the root.
+    """
+    __slots__ = ('root', 'paths', 'sizes', 'mtimes', 'modes', 'folders')
+
+    def __init__(self, root):
+        self.root = root
+        self.paths = []
+        self.sizes = array('Q')
+        self.mtimes = array('q')
+        self.modes = array('I')
+        self.folders = []
+
+    def add(self, relative_folder, folder_names, files):
+        """Add one scanned folder, as produced by iter_scan()."""
+        prefix = relative_folder + '/' if relative_folder else ''
+        self.folders.extend(prefix + name for name in folder_names)
+        for name, size, mtime_ns, mode in files:
+            self.paths.append(prefix + name)
+            self.sizes.append(size)
+            self.mtimes.append(mtime_ns)
+            self.modes.append(mode)
+
+    @property
+    def total_files(self):
+        return len(self.paths)
+
+    @property
+    def total_size(self):
+        return sum(self.sizes)
+
+    def items(self):
+        """Return (relative_path, size) of every file."""
+        return zip(self.paths, self.sizes)
+
+
+def _scan_dir(path, cached=None):
+    """List one folder, returns (folder names, names of folders to descend into, files, listing).
+
+    cached is the listing of an earlier scan, it is returned as it is if the
+    folder's mtime shows nothing was added, removed or renamed since. listing
+    is what the scan cache keeps for the folder, None if it cannot be kept.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError as e:
+        logger.debug("Cannot list %s: %s", path, e)
+        return [], [], [], None
+    if cached is not None and cached[0] == mtime_ns and cached[1] - mtime_ns > _RACY_NS:
+        return cached[2], cached[3], cached[4], cached
+    listed_ns = time.time_ns()
+    folder_names = []
+    descend = []
+    files = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        folder_names.append(entry.name)
+                        # Like os.walk, symlinked folders are listed but not followed
+                        if not entry.is_symlink():
+                            descend.append(entry.name)
+                    else:
+                        stat = entry.stat()
+                        files.append((entry.name, stat.st_size, stat.st_mtime_ns, stat.st_mode))
+                except OSError as e:
+                    logger.debug("Skipping %s: %s", entry.path, e)
+    except OSError as e:
+        logger.debug("Cannot list %s: %s", path, e)
+        return folder_names, descend, files, None
+    return folder_names, descend, files, [mtime_ns, listed_ns, folder_names, descend, files]
+
+
+class ScanCache:
+    """Folder listings of an earlier scan of root, kept in the DataDash cache directory.
+
+    Every folder is stored with its mtime, its entries and the stat results of
+    its files. A folder only changes its mtime when entries are added, removed
+    or renamed, so a folder whose mtime is unchanged is not listed again. Files
+    edited in place keep their cached size here, senders take the size of
+    every file again when it is sent. One JSON file per root, replaced
+    atomically once a scan completes.
+    """
+
+    def __init__(self, cache_dir, root):
+        root = os.path.abspath(root)
+        self.dir = os.path.join(cache_dir, SCAN_CACHE_DIR_NAME)
+        key = hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()
+        self.path = os.path.join(self.dir, key + '.json')
+        self.root = root
+
+    def load(self):
+        """Return {relative_folder: listing} of the last scan, empty if there is none."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.debug("Ignoring scan cache %s: %s", self.path, e)
+            return {}
+        if cached.get('root') != self.root:
+            return {}
+        return cached.get('folders', {})
+
+    def save(self, listings):
+        """Write listings atomically and drop caches of roots not scanned for SCAN_CACHE_MAX_AGE."""
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'root': self.root, 'folders': listings}, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            now = time.time()
+            with os.scandir(self.dir) as entries:
+                for entry in entries:
+                    if now - entry.stat().st_mtime > SCAN_CACHE_MAX_AGE:
+                        os.remove(entry.path)
+        except (OSError, ValueError) as e:
+            logger.error("Could not save scan cache: %s", e)
+
+
+def iter_scan(root, workers=SCAN_WORKERS, cache=None):
+    """Yield (relative_folder, folder_names, files) for every folder below root in os.walk order.
+
+    files holds (name, size, mtime_ns, mode) for each file. Folders are listed by
+    a pool of threads ahead of the consumer, so deep trees and network drives
+    do not wait on one directory at a time. With a ScanCache, unchanged folders
+    come from the cache and the cache is updated once the walk is complete.
+    """
+    cached = cache.load() if cache else {}
+    listings = {}
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    try:
+        stack = [('', pool.submit(_scan_dir, root, cached.get('')))]
+        while stack:
+            relative_folder, future = stack.pop()
+            folder_names, descend, files, listing = future.result()
+            if listing is not None:
+                listings[relative_folder] = listing
+            prefix = relative_folder + '/' if relative_folder else ''
+            # Children are listed in the background while this folder is consumed
+            children = [(prefix + name, pool.submit(_scan_dir, os.path.join(root, prefix + name),
+                                                    cached.get(prefix + name)))
+                        for name in descend]
+            yield relative_folder, folder_names, files
+            stack.extend(reversed(children))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if cache:
+        reused = sum(1 for folder, listing in listings.items() if cached.get(folder) is listing)
+        logger.debug("Scan of %s reused %d of %d folder listings", root, reused, len(listings))
+        cache.save(listings)
+
+
+def scan_folder(root, workers=SCAN_WORKERS, cache=None):
+    """Scan root once and return its FileList."""
+    file_list = FileList(root)
+    for relative_folder, folder_names, files in iter_scan(root, workers, cache):
+        file_list.add(relative_folder, folder_names, files)
+    logger.debug("Scanned %s: %d files in %d folders", root, file_list.total_files, len(file_list.folders))
+    return file_list
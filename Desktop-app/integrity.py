@@ -0,0 +1,70 @@
+import hashlib
+from transfer_io import recv_exact
+
+# xxHash and BLAKE3 are optional, BLAKE2b from hashlib is always there
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# The sender announces the checksum of a session with 'encyp: k' and the id <B.
+# From then on every plain, resumed or compressed file (but not metadata.json),
+# packed batch and parallel segment is followed by a trailer of
+# digest_size <B | digest, computed over the bytes of that payload as they are
+# read and written. Encrypted payloads are authenticated by their cipher mode.
+# Before halting the sender asks with 'encyp: v' which files failed, the
+# receiver answers with size <Q | JSON list of relative paths and the sender
+# sends those again.
+_ALGORITHMS = {}
+if xxhash is not None:
+    _ALGORITHMS['xxh3_128'] = (1, xxhash.xxh3_128)
+if blake3 is not None:
+    _ALGORITHMS['blake3'] = (2, blake3.blake3)
+_ALGORITHMS['blake2b'] = (3, lambda: hashlib.blake2b(digest_size=16))
+_BY_ID = {algorithm_id: name for name, (algorithm_id, _) in _ALGORITHMS.items()}
+
+# Verify rounds before files that keep failing are given up
+CHECKSUM_RETRIES = 3
+
+
+def available_checksums():
+    """Checksums this installation supports, fastest first."""
+    return list(_ALGORITHMS)
+
+
+class Checksum:
+    """A negotiated checksum algorithm, new() returns a fresh incremental hasher."""
+
+    def __init__(self, name):
+        self.name = name
+        self.id, self.new = _ALGORITHMS[name]
+
+    @classmethod
+    def negotiate(cls, remote_checksums):
+        """Pick the first local algorithm the peer supports too, or None."""
+        for name in _ALGORITHMS:
+            if name in (remote_checksums or []):
+                return cls(name)
+        return None
+
+    @classmethod
+    def from_id(cls, algorithm_id):
+        if algorithm_id not in _BY_ID:
+            raise ValueError(f"Unsupported checksum algorithm {algorithm_id}")
+        return cls(_BY_ID[algorithm_id])
+
+
+def trailer(hasher):
+    """Wire trailer carrying the digest of hasher."""
+    digest = hasher.digest()
+    return bytes([len(digest)]) + digest
+
+
+def verify_trailer(sock, hasher):
+    """Read the digest trailer from sock and return True if it matches hasher."""
+    digest_size = recv_exact(sock, 1)[0]
+    return bytes(recv_exact(sock, digest_size)) == hasher.digest()
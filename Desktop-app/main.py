@@ -1,3 +1,6 @@
+import time
+# Time to the first window is counted from here
+_STARTED = time.perf_counter()
 from constant import ConfigManager
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QApplication,
                              QLabel, QFrame, QGraphicsDropShadowEffect, QMessageBox)
@@ -5,11 +8,7 @@ from PyQt6.QtGui import QScreen, QFont, QColor, QIcon, QMovie
 from PyQt6.QtCore import Qt, QTimer, QSize, QThread, pyqtSignal
 import sys
 import os
-from file_receiver import ReceiveApp
-from broadcast import Broadcast
-from preferences import PreferencesApp
 import platform
-import requests
 import ctypes
 from loges import logger
 import subprocess
@@ -21,7 +20,7 @@ class VersionCheck(QThread):
     def __init__(self):
         super().__init__()
         self.uga_version = None
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
 
     def run(self):
         self.currentversion()
@@ -33,6 +32,9 @@ class VersionCheck(QThread):
     def fetch_platform_value(self):
         url = self.get_platform_link()
         logger.info(f"Fetching platform value from: {url}")
+        # requests and the send, receive and settings windows are imported when
+        # they are first used, so they do not hold up the first window
+        import requests
         
         try:
             response = requests.get(url)
@@ -152,11 +154,14 @@ class NetworkCheck(QThread):
 class MainApp(QWidget):
     def __init__(self, skip_version_check=False):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.config_ready.connect(self.on_config_ready)
-        self.config_manager.start()
+        if self.config_manager.checked:
+            # A later window of this process, the config file is already in place
+            QTimer.singleShot(0, self.on_config_ready)
+        else:
+            self.config_manager.config_ready.connect(self.on_config_ready)
+            self.config_manager.start()
         self.skip_version_check = skip_version_check
         self.network_thread = NetworkCheck()
         self.network_thread.start() #comment out after testing is over, lot of overhead on windows
@@ -415,12 +420,14 @@ class MainApp(QWidget):
             if send_dialog.clickedButton() == proceed_button:
                 logger.info("Started Send File App")
                 self.hide()
+                from broadcast import Broadcast
                 self.broadcast_app = Broadcast()
                 self.broadcast_app.show()
                 #com.an.Datadash
         else:
             logger.info("Started Send File App without warning")
             self.hide()
+            from broadcast import Broadcast
             self.broadcast_app = Broadcast()
             self.broadcast_app.show()
 
@@ -481,16 +488,19 @@ class MainApp(QWidget):
             if receive_dialog.clickedButton() == proceed_button:
                 logger.info("Started Receive File App")
                 self.hide()
+                from file_receiver import ReceiveApp
                 self.receive_app = ReceiveApp()
                 self.receive_app.show()
         else:
             logger.info("Started Receive File App without warning")
             self.hide()
+            from file_receiver import ReceiveApp
             self.receive_app = ReceiveApp()
             self.receive_app.show()
 
 
     def preferences_handler(self):
+        from preferences import PreferencesApp
         logger.info("Started Preferences handler menu")
         self.hide()
         self.preferences_app = PreferencesApp()
@@ -568,9 +578,15 @@ class MainApp(QWidget):
             self.openSettings()
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('send', 'receive'):
+        # Headless transfers, see cli.py
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(True)
     main = MainApp()
     main.show()
+    QTimer.singleShot(0, lambda: logger.info("First window shown %.0f ms after start",
+                                             (time.perf_counter() - _STARTED) * 1000))
     sys.exit(app.exec())
     #com.an.Datadash
\ No newline at end of file
@@ -0,0 +1,309 @@
+import os
+import struct
+import sys
+from array import array
+from loges import logger
+from portsss import MANIFEST_BLOCK_ENTRIES
+from transfer_io import recv_exact
+
+# Binary manifest, sent to receivers with the 'binary_manifest' feature in
+# place of metadata.json. Flag 'encyp: m' is followed by
+#   magic b'DDM' | version <B | base_folder_size <H | base_folder_name
+# and blocks written while the sender walks the folder
+#   folder_count <I | file_count <I | strings_size <I | strings
+#   | folder_ids <I * file_count | sizes <Q * file_count
+#   | mtimes_ns <q * file_count | modes <I * file_count
+# strings holds the new folders (relative paths) and then the file names, each
+# followed by a NUL byte. Folders are numbered in the order they appear, 0 is
+# the base folder itself, and a file names the folder it is in by number. A
+# block with all counts 0 ends the manifest. The base folder name is empty for
+# a selection of files.
+#
+# Receivers with the 'streaming_manifest' feature get folders as version 2,
+# where the header is followed by the first files instead of the blocks. Every
+# block is sent as its own 'encyp: n' message once the walk produced it, and
+# the files it lists follow it, so sending starts before the walk is done. The
+# ending block is followed by the totals
+#   total_files <Q | total_bytes <Q
+MANIFEST_MAGIC = b'DDM'
+MANIFEST_VERSION = 1
+MANIFEST_VERSION_STREAMED = 2
+_HEADER = struct.Struct('<BH')
+_BLOCK = struct.Struct('<III')
+_TOTALS = struct.Struct('<QQ')
+# Bytes per file in the packed arrays of a block
+_FILE_ARRAYS_SIZE = 4 + 8 + 8 + 4
+# Sanity limit for the strings of one block, folders and names of up to 4 KiB each
+_MAX_STRINGS_SIZE = 2 * MANIFEST_BLOCK_ENTRIES * 4 * 1024
+
+# Marks a file name that more than one manifest entry ends in
+_AMBIGUOUS = object()
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class Manifest:
+    """Entries of an incoming transfer, indexed and with their totals counted as they arrive.
+
+    Files are kept as relative paths with their sizes, mtimes and modes in
+    packed arrays. Built from metadata.json with from_metadata() or from a
+    binary manifest with read_manifest(). A streamed manifest grows with
+    read_manifest_part() until it is complete.
+    """
+    __slots__ = ('base_folder_name', 'files', 'sizes', 'mtimes', 'modes', 'folders', 'index', 'names',
+                 'total_bytes', 'folder_bytes', 'payload_bytes', 'complete')
+
+    def __init__(self, base_folder_name=''):
+        self.base_folder_name = base_folder_name
+        self.files = []
+        self.sizes = array('Q')
+        self.mtimes = array('q')
+        self.modes = array('I')
+        self.folders = []
+        # {relative path: position} and {file name: relative path} for looking files up
+        self.index = {}
+        self.names = {}
+        # Bytes the overall progress counts against
+        self.total_bytes = 0
+        # Bytes the folder progress counts against
+        self.folder_bytes = 0
+        # Bytes of real file contents, used for the ETA
+        self.payload_bytes = 0
+        # False while more entries of a streamed manifest are to come
+        self.complete = True
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Build the manifest of a metadata.json list, for folders its last entry names the base folder."""
+        base_folder_name = metadata[-1].get('base_folder_name', '') if metadata else ''
+        manifest = cls(base_folder_name)
+        for info in metadata[:-1] if base_folder_name else metadata:
+            path = info.get('path', '')
+            if path == '.delete':
+                continue
+            if path.endswith('/'):
+                manifest.add_folder(path[:-1])
+            else:
+                manifest.add_file(path, info.get('size', 0))
+        return manifest
+
+    def add_folder(self, relative_path):
+        self.folders.append(relative_path)
+
+    def add_file(self, relative_path, size, mtime_ns=0, mode=0):
+        self.index[relative_path] = len(self.files)
+        self.files.append(relative_path)
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        self.modes.append(mode)
+        name = os.path.basename(relative_path)
+        self.names[name] = _AMBIGUOUS if name in self.names else relative_path
+        self.folder_bytes += size
+        if size > 0:
+            self.total_bytes += size
+            if not relative_path.endswith('.DS_Store'):
+                self.payload_bytes += size
+
+    @property
+    def is_folder(self):
+        return bool(self.base_folder_name)
+
+    @property
+    def total_files(self):
+        return len(self.files)
+
+    def entries(self):
+        """Return the files in the metadata.json form the files table shows."""
+        if self.is_folder:
+            return [{'base_folder_name': self.base_folder_name, 'path': '.delete', 'size': 0}]
+        return [{'path': path, 'size': size} for path, size in zip(self.files, self.sizes)]
+
+    def relative_path(self, file_name):
+        """Return the relative path of the entry file_name refers to, or file_name if there is none.
+
+        file_name may be a relative path or a bare file name. A bare name that
+        several entries end in cannot be placed and is kept as it is.
+        """
+        if file_name in self.index:
+            return file_name
+        path = self.names.get(file_name)
+        if path is None:
+            return file_name
+        if path is _AMBIGUOUS:
+            logger.warning("%s matches several files of the transfer, keeping it as it is", file_name)
+            return file_name
+        return path
+
+
+class ManifestWriter:
+    """Streams a binary manifest to sock while the entries are produced.
+
+    Entries are sent in blocks of MANIFEST_BLOCK_ENTRIES files, close() sends
+    what is left and ends the manifest. A streamed manifest sends every block
+    as its own message, add_file() returns True once the files added so far
+    have been sent and their payloads may follow.
+    """
+
+    def __init__(self, sock, base_folder_name='', streamed=False):
+        self.sock = sock
+        self.streamed = streamed
+        self.folder_ids = {'': 0}
+        self.new_folders = []
+        self.total_files = 0
+        self.total_bytes = 0
+        self._reset_block()
+        base = base_folder_name.encode('utf-8')
+        version = MANIFEST_VERSION_STREAMED if streamed else MANIFEST_VERSION
+        sock.sendall(b'encyp: m' + MANIFEST_MAGIC + _HEADER.pack(version, len(base)) + base)
+
+    def _reset_block(self):
+        self.names = []
+        self.file_folders = array('I')
+        self.sizes = array('Q')
+        self.mtimes = array('q')
+        self.modes = array('I')
+
+    def add_folder(self, relative_path):
+        """Announce a folder, returns its number."""
+        folder_id = self.folder_ids.get(relative_path)
+        if folder_id is None:
+            folder_id = self.folder_ids[relative_path] = len(self.folder_ids)
+            self.new_folders.append(relative_path)
+            if len(self.new_folders) >= MANIFEST_BLOCK_ENTRIES:
+                self.flush()
+        return folder_id
+
+    def add_file(self, relative_path, size, mtime_ns=0, mode=0):
+        folder, _, name = relative_path.rpartition('/')
+        folder_id = self.add_folder(folder)
+        self.file_folders.append(folder_id)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        self.modes.append(mode)
+        self.total_files += 1
+        self.total_bytes += size
+        if len(self.names) >= MANIFEST_BLOCK_ENTRIES:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.names and not self.new_folders:
+            return
+        strings = self.new_folders + self.names
+        blob = ('\0'.join(strings) + '\0').encode('utf-8')
+        self.sock.sendall(b''.join([
+            b'encyp: n' if self.streamed else b'',
+            _BLOCK.pack(len(self.new_folders), len(self.names), len(blob)), blob,
+            _little_endian(self.file_folders).tobytes(), _little_endian(self.sizes).tobytes(),
+            _little_endian(self.mtimes).tobytes(), _little_endian(self.modes).tobytes()]))
+        self.new_folders = []
+        self._reset_block()
+
+    def close(self):
+        self.flush()
+        if self.streamed:
+            self.sock.sendall(b'encyp: n' + _BLOCK.pack(0, 0, 0) + _TOTALS.pack(self.total_files, self.total_bytes))
+        else:
+            self.sock.sendall(_BLOCK.pack(0, 0, 0))
+
+
+def _unpack_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    return _little_endian(values)
+
+
+def _read_block(sock, manifest):
+    """Receive one block into manifest, returns False for the block that ends the manifest."""
+    folder_count, file_count, strings_size = _BLOCK.unpack(recv_exact(sock, _BLOCK.size))
+    if not folder_count and not file_count:
+        return False
+    if max(folder_count, file_count) > MANIFEST_BLOCK_ENTRIES or strings_size > _MAX_STRINGS_SIZE:
+        raise ValueError(f"Manifest block of {file_count} files and {strings_size} bytes exceeds the limit")
+    strings = recv_exact(sock, strings_size).decode('utf-8').split('\0')
+    if len(strings) != folder_count + file_count + 1:
+        raise ValueError("Manifest block strings do not match its counts")
+    arrays = recv_exact(sock, file_count * _FILE_ARRAYS_SIZE)
+    offset = 0
+    unpacked = []
+    for typecode, itemsize in (('I', 4), ('Q', 8), ('q', 8), ('I', 4)):
+        unpacked.append(_unpack_array(typecode, arrays[offset:offset + file_count * itemsize]))
+        offset += file_count * itemsize
+    file_folders, sizes, mtimes, modes = unpacked
+    for folder in strings[:folder_count]:
+        manifest.add_folder(folder)
+    # Folder 0 is the base folder, folder n the n-th one announced
+    folders = manifest.folders
+    if file_count and max(file_folders) > len(folders):
+        raise ValueError(f"Manifest block names folder {max(file_folders)} of {len(folders)}")
+    for i, name in enumerate(strings[folder_count:folder_count + file_count]):
+        folder = folders[file_folders[i] - 1] if file_folders[i] else ''
+        manifest.add_file(f"{folder}/{name}" if folder else name, sizes[i], mtimes[i], modes[i])
+    return True
+
+
+def read_manifest(sock):
+    """Receive a binary manifest after its flag, one block at a time, and return its Manifest.
+
+    A streamed manifest is returned empty and incomplete, its blocks follow
+    as 'encyp: n' messages for read_manifest_part().
+    """
+    magic = recv_exact(sock, len(MANIFEST_MAGIC))
+    version, base_size = _HEADER.unpack(recv_exact(sock, _HEADER.size))
+    if magic != MANIFEST_MAGIC or version not in (MANIFEST_VERSION, MANIFEST_VERSION_STREAMED):
+        raise ValueError(f"Unsupported manifest {magic!r} version {version}")
+    manifest = Manifest(recv_exact(sock, base_size).decode('utf-8'))
+    if version == MANIFEST_VERSION_STREAMED:
+        manifest.complete = False
+        return manifest
+    while _read_block(sock, manifest):
+        pass
+    logger.debug("Received manifest of %d files in %d folders", manifest.total_files, len(manifest.folders))
+    return manifest
+
+
+def read_manifest_part(sock, manifest):
+    """Receive the next block of a streamed manifest after its flag, returns False once it is complete."""
+    if _read_block(sock, manifest):
+        return True
+    total_files, total_bytes = _TOTALS.unpack(recv_exact(sock, _TOTALS.size))
+    if total_files != manifest.total_files or total_bytes != manifest.folder_bytes:
+        raise ValueError(f"Streamed manifest lists {manifest.total_files} files of {manifest.folder_bytes} bytes, "
+                         f"sender counted {total_files} of {total_bytes}")
+    manifest.complete = True
+    logger.debug("Streamed manifest complete with %d files in %d folders", total_files, len(manifest.folders))
+    return False
+
+
+class TransferProgress:
+    """Received byte counters of a transfer, the receive loop only adds to them."""
+    __slots__ = ('total', 'received', 'folder_total', 'folder_received')
+
+    def __init__(self):
+        self.total = 0
+        self.folder_total = 0
+        self.received = 0
+        self.folder_received = 0
+
+    def expect(self, manifest):
+        """Count against the totals of manifest from now on."""
+        # Never 0, so the overall progress can always be worked out
+        self.total = manifest.total_bytes or 1
+        self.folder_total = manifest.folder_bytes
+
+    def add(self, n):
+        self.received += n
+        self.folder_received += n
+
+    def overall(self):
+        return min(self.received * 100 // self.total, 100) if self.total > 0 else 0
+
+    def folder(self):
+        return min(self.folder_received * 100 // self.folder_total, 100) if self.folder_total > 0 else 0
@@ -0,0 +1,122 @@
+import os
+import struct
+from loges import logger
+from integrity import trailer
+from dest_planner import DestinationPlanner, join_inside
+from portsss import PACK_FILE_MAX, PACK_BATCH_BYTES, PACK_BATCH_FILES
+
+# A packed batch carries many small files in one frame:
+#   'encyp: b' | index_size <Q | index | payload_size <Q | payload [| checksum trailer]
+# The index is a file count <I followed by, per file, path_size <H | size <Q |
+# path (utf-8). The payload is the file contents back to back in index order.
+BATCH_FLAG = b'encyp: b'
+_COUNT = struct.Struct('<I')
+_ENTRY = struct.Struct('<HQ')
+_SIZE = struct.Struct('<Q')
+# Largest payload a sender puts into one batch, a batch is flushed once it is full
+MAX_BATCH_PAYLOAD = PACK_BATCH_BYTES + PACK_FILE_MAX
+
+
+def encode_index(entries):
+    """Encode (relative_path, size) pairs into the compact batch index."""
+    parts = [_COUNT.pack(len(entries))]
+    for relative_path, size in entries:
+        path_bytes = relative_path.encode('utf-8')
+        parts.append(_ENTRY.pack(len(path_bytes), size))
+        parts.append(path_bytes)
+    return b''.join(parts)
+
+
+def decode_index(data):
+    """Decode a batch index into a list of (relative_path, size) pairs."""
+    view = memoryview(data)
+    count = _COUNT.unpack_from(view, 0)[0]
+    offset = _COUNT.size
+    entries = []
+    for _ in range(count):
+        path_size, size = _ENTRY.unpack_from(view, offset)
+        offset += _ENTRY.size
+        entries.append((bytes(view[offset:offset + path_size]).decode('utf-8'), size))
+        offset += path_size
+    return entries
+
+
+class BatchPacker:
+    """Collects small files of a folder and turns them into one packed frame.
+
+    Files are read straight into a single growing buffer, so a full batch goes
+    out with one sendall() instead of four header sends and a payload per file.
+    With a negotiated checksum the payload is hashed as the files are read.
+    """
+
+    def __init__(self, checksum=None):
+        self.checksum = checksum
+        self.entries = []
+        self.payload = bytearray()
+        self.hasher = checksum.new() if checksum else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def accepts(size):
+        """Return True if a file of size bytes should be packed rather than sent alone."""
+        return size <= PACK_FILE_MAX
+
+    def full(self):
+        return len(self.payload) >= PACK_BATCH_BYTES or len(self.entries) >= PACK_BATCH_FILES
+
+    def add(self, file_path, relative_path, data=None):
+        """Append file_path, or its already read data, to the batch and return the number of bytes it added."""
+        if data is None:
+            with open(file_path, 'rb') as f:
+                data = f.read(PACK_FILE_MAX + 1)
+        if len(data) > PACK_FILE_MAX:
+            raise ValueError(f"{file_path} grew beyond the packed file limit")
+        self.payload += data
+        if self.hasher:
+            self.hasher.update(data)
+        self.entries.append((relative_path, len(data)))
+        return len(data)
+
+    def frame(self):
+        """Return the wire frame for the collected files and reset the packer."""
+        index = encode_index(self.entries)
+        parts = [BATCH_FLAG, _SIZE.pack(len(index)), index, _SIZE.pack(len(self.payload)), self.payload]
+        if self.hasher:
+            parts.append(trailer(self.hasher))
+            self.hasher = self.checksum.new()
+        self.entries = []
+        self.payload = bytearray()
+        return b''.join(parts)
+
+
+def unpack_batch(index, payload, destination_folder, planner=None):
+    """Write the files of a received batch below destination_folder.
+
+    Returns the list of (relative_path, file_path, size) written. Paths are
+    checked before anything is written, a batch with a path leaving
+    destination_folder raises ValueError. Names already taken get the first free
+    (i) from planner.unique_file, like single files, and directories are created
+    once per session. Every file is written with a single write() from a slice
+    of the payload buffer.
+    """
+    entries = decode_index(index)
+    if sum(size for _, size in entries) != len(payload):
+        raise ValueError("Packed batch index does not match its payload")
+    paths = [join_inside(destination_folder, relative_path) for relative_path, _ in entries]
+    if planner is None:
+        planner = DestinationPlanner()
+
+    view = memoryview(payload)
+    written = []
+    offset = 0
+    for (relative_path, size), file_path in zip(entries, paths):
+        planner.makedirs(os.path.dirname(file_path))
+        file_path = planner.unique_file(file_path)
+        with open(file_path, 'wb') as f:
+            f.write(view[offset:offset + size])
+        offset += size
+        written.append((relative_path, file_path, size))
+    logger.debug("Unpacked %d files (%d bytes) from batch", len(written), offset)
+    return written
@@ -0,0 +1,359 @@
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from loges import logger
+from portsss import (CHUNK_SIZE_DESKTOP, PARALLEL_SEGMENT_SIZE, PARALLEL_STREAMS_DEFAULT,
+                     PARALLEL_STREAMS_MAX)
+from chunk_tuner import ChunkSizer
+from transfer_io import send_file_range, recv_exact, RecvBuffer
+from integrity import trailer, verify_trailer
+from read_ahead import advise
+
+# A parallel file is announced on the control connection with flag 'encyp: p',
+# the usual name and size fields and a random token. Every data connection then
+# starts with the same token, followed by segments of
+#   offset <Q | length <Q | length bytes
+# and a segment with length 0 once the stream has nothing left to send. With a
+# negotiated checksum every segment is followed by its digest trailer. The
+# receiver confirms the complete file with PARALLEL_ACK on the control
+# connection, only then may the data connections of the next file be opened.
+PARALLEL_TOKEN_SIZE = 16
+PARALLEL_ACK = b'\x01'
+_SEGMENT_HEADER = struct.Struct('<QQ')
+
+# Sample window used to decide whether another stream helps
+_TUNE_WINDOW = 1.0
+_TUNE_GAIN = 1.10
+_IDLE_TIMEOUT = 60
+
+
+class SenderReconnected(ConnectionError):
+    """The sender opened a new control connection while a parallel file was in flight.
+
+    conn is that connection, already accepted, for the receiver to resume on.
+    """
+
+    def __init__(self, conn):
+        super().__init__("Sender reconnected during a parallel transfer")
+        self.conn = conn
+
+
+def _peek_exact(conn, n):
+    """Return the first n bytes waiting on conn without consuming them, fewer at EOF."""
+    while True:
+        data = conn.recv(n, socket.MSG_PEEK)
+        if len(data) == n or not data:
+            return data
+        time.sleep(0.01)
+
+
+def _pwrite_all(fd, data, offset, lock=None):
+    """Write all of data to fd at offset without moving a shared file position."""
+    view = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        while view:
+            n = os.pwrite(fd, view, offset)
+            view = view[n:]
+            offset += n
+        return
+    # Windows has no pwrite, serialise seek + write instead
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while view:
+            n = os.write(fd, view)
+            view = view[n:]
+
+
+class _PositionalWriter:
+    """File-like writer that places consecutive writes at increasing offsets of fd."""
+
+    def __init__(self, fd, offset, lock):
+        self.fd = fd
+        self.offset = offset
+        self.lock = lock
+
+    def write(self, data):
+        _pwrite_all(self.fd, data, self.offset, self.lock)
+        self.offset += len(data)
+        return len(data)
+
+
+class ParallelSender:
+    """Sends large files over several TCP connections at once.
+
+    Files are cut into PARALLEL_SEGMENT_SIZE byte ranges that each stream pulls
+    from a shared cursor, so faster connections simply carry more segments. With
+    streams=0 the stream count is tuned from measured throughput: a stream is
+    added while doing so still raises the aggregate rate and the count that paid
+    off is used as the starting point for the next file.
+    """
+
+    def __init__(self, ip_address, port, streams=0):
+        self.ip_address = ip_address
+        self.port = port
+        self.auto = streams <= 0
+        self.streams = PARALLEL_STREAMS_DEFAULT if self.auto else min(streams, PARALLEL_STREAMS_MAX)
+        self.lock = threading.Lock()
+        self.sizers = []
+        self.sockets = []
+        self.stopped = False
+
+    @property
+    def throughput(self):
+        """Aggregate throughput of all streams of the current file in bytes per second."""
+        return sum(sizer.throughput for sizer in self.sizers)
+
+    @property
+    def chunk_size(self):
+        """Mean chunk size currently used by the streams."""
+        if not self.sizers:
+            return CHUNK_SIZE_DESKTOP
+        return sum(sizer.size for sizer in self.sizers) // len(self.sizers)
+
+    def send(self, control_skt, file_path, file_size, on_progress=None, checksum=None):
+        """Send file_path over parallel data streams, the header is already on control_skt."""
+        token = os.urandom(PARALLEL_TOKEN_SIZE)
+        control_skt.sendall(token)
+
+        self.file_path = file_path
+        self.file_size = file_size
+        self.cursor = 0
+        self.sent = 0
+        self.errors = []
+        self.sizers = []
+        self.sockets = []
+        self.stopped = False
+        self.on_progress = on_progress
+        self.checksum = checksum
+        threads = []
+
+        def start_stream():
+            thread = threading.Thread(target=self._run_stream, args=(token,), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for _ in range(self.streams):
+            start_stream()
+
+        growing = self.auto
+        baseline = 0.0
+        last_sent = 0
+        last_sample = time.monotonic()
+        while True:
+            alive = [thread for thread in threads if thread.is_alive()]
+            if not alive:
+                break
+            alive[0].join(_TUNE_WINDOW)
+            if not growing:
+                continue
+            now = time.monotonic()
+            rate = (self.sent - last_sent) / (now - last_sample)
+            last_sent, last_sample = self.sent, now
+            if len(threads) >= PARALLEL_STREAMS_MAX or not self._has_segments():
+                growing = False
+            elif rate > baseline * _TUNE_GAIN:
+                baseline = rate
+                self.streams = len(threads) + 1
+                logger.debug("Parallel transfer at %.2f MB/s, adding stream %d", rate / (1024 * 1024), self.streams)
+                start_stream()
+            else:
+                # The last stream did not pay off, start the next file without it
+                growing = False
+                self.streams = max(1, len(threads) - 1)
+
+        if self.errors:
+            raise self.errors[0]
+        if self.sent != file_size:
+            raise ConnectionError(f"Parallel transfer sent {self.sent} of {file_size} bytes")
+        if bytes(recv_exact(control_skt, len(PARALLEL_ACK))) != PARALLEL_ACK:
+            raise ConnectionError("Receiver did not confirm the parallel transfer")
+        return self.sent
+
+    def _has_segments(self):
+        with self.lock:
+            return self.cursor < self.file_size
+
+    def _next_segment(self):
+        with self.lock:
+            if self.stopped or self.cursor >= self.file_size:
+                return None
+            offset = self.cursor
+            length = min(PARALLEL_SEGMENT_SIZE, self.file_size - offset)
+            self.cursor += length
+            return offset, length
+
+    def _progress(self, n):
+        with self.lock:
+            self.sent += n
+            if self.on_progress:
+                self.on_progress(n)
+
+    def _run_stream(self, token):
+        try:
+            with socket.create_connection((self.ip_address, self.port)) as sock, open(self.file_path, 'rb') as f:
+                sizer = ChunkSizer(sock, CHUNK_SIZE_DESKTOP)
+                with self.lock:
+                    self.sizers.append(sizer)
+                    self.sockets.append(sock)
+                sock.sendall(token)
+                while True:
+                    segment = self._next_segment()
+                    if segment is None:
+                        sock.sendall(_SEGMENT_HEADER.pack(0, 0))
+                        break
+                    offset, length = segment
+                    advise(f, offset, length)
+                    sock.sendall(_SEGMENT_HEADER.pack(offset, length))
+                    hasher = self.checksum.new() if self.checksum else None
+                    send_file_range(sock, f, offset, length, CHUNK_SIZE_DESKTOP, self._progress, sizer, hasher)
+                    if hasher:
+                        sock.sendall(trailer(hasher))
+        except Exception as e:
+            logger.error("Parallel stream failed: %s", e)
+            with self.lock:
+                self.errors.append(e)
+                # Let the other streams stop instead of sending into a failed transfer
+                self.stopped = True
+
+    def stop(self):
+        """Abort the streams of the file currently being sent."""
+        with self.lock:
+            self.stopped = True
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class ParallelReceiver:
+    """Receives a file announced with 'encyp: p' from several data connections.
+
+    Data connections are accepted on the receiver's listening socket and every
+    segment is written at its offset into the preallocated file, so segments may
+    arrive in any order. on_chunk(n) is called under a lock, so callers can keep
+    their usual single-threaded progress bookkeeping. With a checksum every
+    segment is verified on its own and failed is set if any of them mismatched.
+
+    The transfer fails with ConnectionError once nothing arrived for
+    idle_timeout seconds, 60 by default, or the control connection closed. A
+    connection that does not start with the token is the sender coming back
+    after a drop, it is raised as SenderReconnected instead of being taken for
+    a data stream.
+    """
+
+    def __init__(self, server_skt, token, on_chunk=None, checksum=None, idle_timeout=None):
+        self.server_skt = server_skt
+        self.token = bytes(token)
+        self.on_chunk = on_chunk
+        self.checksum = checksum
+        self.idle_timeout = idle_timeout or _IDLE_TIMEOUT
+        self.failed = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.received = 0
+        self.errors = []
+
+    def receive(self, control_skt, file_path, file_size):
+        """Receive the file into file_path, confirm it on control_skt and return the bytes written."""
+        threads = []
+        streams = []
+        previous_timeout = self.server_skt.gettimeout()
+        self.server_skt.settimeout(0.2)
+        last_received = 0
+        last_progress = time.monotonic()
+        try:
+            with open(file_path, 'wb') as f:
+                f.truncate(file_size)
+                fd = f.fileno()
+                try:
+                    while True:
+                        with self.lock:
+                            received = self.received
+                            if self.errors:
+                                raise self.errors[0]
+                        if received >= file_size:
+                            break
+                        now = time.monotonic()
+                        if received != last_received:
+                            last_received, last_progress = received, now
+                        elif now - last_progress > self.idle_timeout:
+                            raise ConnectionError("Parallel transfer stalled")
+                        self._check_control(control_skt)
+                        try:
+                            conn, address = self.server_skt.accept()
+                        except socket.timeout:
+                            continue
+                        conn.settimeout(self.idle_timeout)
+                        try:
+                            is_stream = bytes(_peek_exact(conn, PARALLEL_TOKEN_SIZE)) == self.token
+                        except OSError as e:
+                            logger.warning("Dropping connection from %s: %s", address, e)
+                            conn.close()
+                            continue
+                        if not is_stream:
+                            conn.settimeout(None)
+                            raise SenderReconnected(conn)
+                        logger.debug("Parallel data stream from %s", address)
+                        streams.append(conn)
+                        thread = threading.Thread(target=self._run_stream, args=(conn, fd, file_size), daemon=True)
+                        thread.start()
+                        threads.append(thread)
+                except BaseException:
+                    # Unblock the streams, none of them may write once the file is closed
+                    for conn in streams:
+                        try:
+                            conn.shutdown(socket.SHUT_RDWR)
+                        except OSError:
+                            pass
+                    raise
+                finally:
+                    for thread in threads:
+                        thread.join(self.idle_timeout)
+        finally:
+            self.server_skt.settimeout(previous_timeout)
+        control_skt.sendall(PARALLEL_ACK)
+        return self.received
+
+    @staticmethod
+    def _check_control(control_skt):
+        """Raise ConnectionError if the sender closed the control connection."""
+        readable, _, _ = select.select([control_skt], [], [], 0)
+        if readable and not control_skt.recv(1, socket.MSG_PEEK):
+            raise ConnectionError("Control connection closed during a parallel transfer")
+
+    def _chunk(self, n):
+        with self.lock:
+            self.received += n
+            if self.on_chunk:
+                self.on_chunk(n)
+
+    def _run_stream(self, conn, fd, file_size):
+        buffer = RecvBuffer(PARALLEL_SEGMENT_SIZE // 8)
+        try:
+            with conn:
+                if bytes(recv_exact(conn, PARALLEL_TOKEN_SIZE)) != self.token:
+                    logger.warning("Dropping data stream with an unknown token")
+                    return
+                while True:
+                    offset, length = _SEGMENT_HEADER.unpack(recv_exact(conn, _SEGMENT_HEADER.size))
+                    if offset == 0 and length == 0:
+                        break
+                    # Segments are written where the peer says, never outside the announced file
+                    if length == 0 or offset + length > file_size:
+                        raise ValueError(f"Segment of {length} bytes at offset {offset} "
+                                         f"is outside the {file_size} byte file")
+                    writer = _PositionalWriter(fd, offset, self.write_lock)
+                    hasher = self.checksum.new() if self.checksum else None
+                    buffer.recv_into_file(conn, writer, length, self._chunk, hasher=hasher)
+                    if hasher and not verify_trailer(conn, hasher):
+                        logger.error("Checksum mismatch in segment at offset %d", offset)
+                        self.failed = True
+        except Exception as e:
+            logger.error("Parallel data stream failed: %s", e)
+            with self.lock:
+                self.errors.append(e)
@@ -4,6 +4,47 @@ RECEIVER_JSON = 54314
 RECEIVER_DATA_DESKTOP = 58000
 RECEIVER_DATA_ANDROID = 57341
 RECEIVER_DATA_SWIFT = 57341
-CHUNK_SIZE_DESKTOP = 4096
-CHUNK_SIZE_ANDROID = 4096
-CHUNK_SIZE_SWIFT = 4096
\ No newline at end of file
+# Starting read/send/recv sizes, ChunkSizer adapts them per connection
+CHUNK_SIZE_DESKTOP = 256 * 1024
+CHUNK_SIZE_ANDROID = 128 * 1024
+CHUNK_SIZE_SWIFT = 128 * 1024
+CHUNK_SIZE_MIN = 16 * 1024
+CHUNK_SIZE_MAX = 4 * 1024 * 1024
+SOCKET_BUFFER_MIN = 256 * 1024
+SOCKET_BUFFER_MAX = 8 * 1024 * 1024
+# Optional protocol features advertised by desktop peers during the JSON handshake
+DESKTOP_FEATURES = ["gcm_stream", "parallel_streams", "packed_batches", "resume", "delta_sync", "binary_manifest",
+                    "streaming_manifest"]
+# Parallel multi-stream mode for large files between desktop peers
+PARALLEL_MIN_FILE_SIZE = 64 * 1024 * 1024
+PARALLEL_SEGMENT_SIZE = 8 * 1024 * 1024
+PARALLEL_STREAMS_DEFAULT = 2
+PARALLEL_STREAMS_MAX = 8
+# Small files of a folder are packed into batches of up to PACK_BATCH_BYTES / PACK_BATCH_FILES
+PACK_FILE_MAX = 1024 * 1024
+PACK_BATCH_BYTES = 8 * 1024 * 1024
+PACK_BATCH_FILES = 4096
+# Reconnect attempts and delay (seconds) before an interrupted transfer is given up
+RESUME_ATTEMPTS = 5
+RESUME_DELAY = 2
+# Seconds the receiver waits for the sender to come back after the connection dropped
+RESUME_WAIT = 10
+# Files of a re-sent folder from this size on are sent as a delta against the receiver's earlier copy
+DELTA_MIN_FILE_SIZE = 1024 * 1024
+# Receive buffers queued between the network reader and the disk writer thread
+WRITE_QUEUE_DEPTH = 16
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Sender read-ahead: bytes kept in memory ahead of the socket, block size and upcoming files prefetched
+READ_AHEAD_BYTES = 16 * 1024 * 1024
+READ_AHEAD_BLOCK = 1024 * 1024
+READ_AHEAD_FILES = 256
+# UI refreshes per second for transfer progress, workers report far more often
+PROGRESS_UI_RATE = 20
+# Seconds the receiver waits for the password of an encrypted transfer before aborting it
+PASSWORD_TIMEOUT = 300
+# Files per block of a binary manifest
+MANIFEST_BLOCK_ENTRIES = 4096
+# Threads listing folders in parallel while a folder is scanned
+SCAN_WORKERS = 8
+# Scan caches of folders that were not sent for this long are deleted, in seconds
+SCAN_CACHE_MAX_AGE = 30 * 24 * 3600
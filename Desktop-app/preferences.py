@@ -9,7 +9,6 @@ from constant import ConfigManager
 from loges import logger
 from PyQt6.QtWidgets import QGraphicsDropShadowEffect
 from credits_dialog import CreditsDialog
-import requests
 import os
 import time
 from PyQt6.QtWidgets import QProgressDialog
@@ -22,7 +21,7 @@ class UpdateManager(QThread):
     
     def __init__(self):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.should_cancel = False
         self.uga_version = self.config_manager.get_config()["version"]
         self.action = None
@@ -45,6 +44,7 @@ class UpdateManager(QThread):
         self.start()
     
     def start_download(self):
+        import requests
         self.should_cancel = False
         download_info = self.prepare_download_info()
         if not download_info:
@@ -96,6 +96,7 @@ class UpdateManager(QThread):
         self.should_cancel = True
 
     def fetch_version_data(self, url):
+        import requests
         try:
             response = requests.get(url)
             response.raise_for_status()
@@ -282,6 +283,7 @@ class UpdateManager(QThread):
     def get_latest_version(self):
         url = self.get_platform_link()
         logger.info(f"Fetching latest version from: {url}")
+        import requests
         try:
             response = requests.get(url)
             response.raise_for_status()
@@ -299,12 +301,11 @@ class UpdateManager(QThread):
 class PreferencesApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager.shared()
         self.update_manager = UpdateManager()
         self.setup_update_manager_signals()
         self.config_manager.config_updated.connect(self.on_config_updated)
-        self.config_manager.log_message.connect(logger.info)
-        self.config_manager.start()
+        self.on_config_updated(self.config_manager.get_config())
         self.original_preferences = {}
         self.initUI()
         self.setFixedSize(525, 600)
@@ -0,0 +1,53 @@
+import threading
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from portsss import PROGRESS_UI_RATE
+
+
+class ProgressBus(QObject):
+    """Collects the progress of a transfer worker and hands it to the UI at a fixed rate.
+
+    Workers report as often as they like from their own threads, a report only
+    stores the latest value. A timer in the thread the bus was created in (the
+    GUI thread, as workers are created there) samples the values PROGRESS_UI_RATE
+    times a second and emits what changed: all per-file values as one dict,
+    the overall progress and the file counts once each. flush() emits right
+    away, workers call it before they signal the end of a transfer.
+    """
+    files_progress = pyqtSignal(dict)  # {name: progress} of the files that changed
+    overall_progress = pyqtSignal(int)
+    file_counts = pyqtSignal(int, int, int)  # total_files, files_done, files_pending
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.overall = None
+        self.counts = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000 // PROGRESS_UI_RATE)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def report_file(self, name, progress):
+        with self.lock:
+            self.files[name] = progress
+
+    def report_overall(self, progress):
+        with self.lock:
+            self.overall = progress
+
+    def report_counts(self, total_files, files_done, files_pending):
+        with self.lock:
+            self.counts = (total_files, files_done, files_pending)
+
+    def flush(self):
+        """Emit everything reported since the last sample."""
+        with self.lock:
+            files, overall, counts = self.files, self.overall, self.counts
+            self.files, self.overall, self.counts = {}, None, None
+        if files:
+            self.files_progress.emit(files)
+        if overall is not None:
+            self.overall_progress.emit(overall)
+        if counts is not None:
+            self.file_counts.emit(*counts)
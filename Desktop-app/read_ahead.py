@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+from loges import logger
+from portsss import READ_AHEAD_BYTES, READ_AHEAD_BLOCK, READ_AHEAD_FILES
+
+_HAS_FADVISE = hasattr(os, 'posix_fadvise')
+
+
+def advise(f, offset=0, length=READ_AHEAD_BYTES):
+    """Tell the kernel f is read sequentially and to start reading length bytes at offset."""
+    if not _HAS_FADVISE:
+        return
+    try:
+        fd = f.fileno()
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+    except (AttributeError, OSError) as e:
+        logger.debug("posix_fadvise not applied: %s", e)
+
+
+def open_for_sending(file_path, offset=0):
+    """Open file_path to be sent from offset.
+
+    Files the kernel can sendfile() are returned as plain file objects with read
+    hints set. Everything else goes through user space and gets a ReadAheadReader.
+    """
+    if hasattr(os, 'sendfile'):
+        f = open(file_path, 'rb')
+        advise(f, offset)
+        return f
+    return ReadAheadReader(file_path, offset)
+
+
+class ReadAheadReader:
+    """File-like reader that keeps the next READ_AHEAD_BYTES of a file in memory.
+
+    A worker thread reads READ_AHEAD_BLOCK sized blocks into a bounded queue, so
+    disk latency overlaps with sending instead of adding to it. read() returns
+    memoryview slices of those blocks.
+    """
+
+    def __init__(self, file_path, offset=0):
+        self.f = open(file_path, 'rb')
+        self.f.seek(offset)
+        advise(self.f, offset)
+        self.position = offset
+        self.blocks = queue.Queue(max(1, READ_AHEAD_BYTES // READ_AHEAD_BLOCK))
+        self.current = memoryview(b'')
+        self.eof = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                data = self.f.read(READ_AHEAD_BLOCK)
+                self.blocks.put(data)
+                if not data:
+                    break
+        except Exception as e:
+            self.blocks.put(e)
+
+    def seek(self, offset):
+        if offset != self.position:
+            raise OSError("ReadAheadReader only reads forward from its start offset")
+
+    def read(self, size=-1):
+        if not self.current and not self.eof:
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                self.eof = True
+            self.current = memoryview(block)
+        if size < 0:
+            size = len(self.current)
+        data = self.current[:size]
+        self.current = self.current[len(data):]
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.stopped = True
+        while self.thread.is_alive():
+            try:
+                self.blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FilePrefetcher:
+    """Reads the upcoming files of a folder ahead of the sender.
+
+    Files are consumed in the order they were given. Contents of files up to
+    max_size are read into memory, up to READ_AHEAD_BYTES and READ_AHEAD_FILES
+    ahead, larger files only get a read hint so the kernel has their first
+    blocks ready. Files the sender passed over are dropped.
+    """
+
+    def __init__(self, files, max_size):
+        self.files = list(files)
+        self.index = {path: i for i, (path, _) in enumerate(self.files)}
+        self.max_size = max_size
+        self.ready = OrderedDict()
+        self.buffered = 0
+        self.position = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for i, (path, size) in enumerate(self.files):
+            cost = size if size <= self.max_size else 0
+            with self.condition:
+                while not self.stopped and self.ready and (
+                        len(self.ready) >= READ_AHEAD_FILES or self.buffered + cost > READ_AHEAD_BYTES):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if i < self.position:
+                    continue
+            data = None
+            try:
+                with open(path, 'rb') as f:
+                    if cost:
+                        data = f.read(self.max_size + 1)
+                    else:
+                        advise(f)
+            except OSError:
+                pass
+            with self.condition:
+                self.ready[i] = data
+                self.buffered += len(data) if data else 0
+                self.condition.notify_all()
+
+    def take(self, path):
+        """Return the prefetched contents of path, or None if it has to be read directly."""
+        i = self.index.get(path)
+        if i is None:
+            return None
+        data = None
+        with self.condition:
+            self.position = max(self.position, i + 1)
+            while self.ready:
+                key = next(iter(self.ready))
+                if key > i:
+                    break
+                entry = self.ready.pop(key)
+                self.buffered -= len(entry) if entry else 0
+                if key == i:
+                    data = entry
+            self.condition.notify_all()
+        return data
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,154 @@
+import json
+import os
+import time
+import zlib
+from loges import logger
+
+JOURNAL_FILE_NAME = "resume_journal.json"
+# Transfers that were not resumed within this time are dropped from the journal
+JOURNAL_MAX_AGE = 7 * 24 * 3600
+# Bytes before the end of a partly received file whose CRC32 is kept to verify it on resume
+TAIL_CRC_BYTES = 64 * 1024
+
+
+def tail_crc(path, committed):
+    """Return the CRC32 of the TAIL_CRC_BYTES before byte committed of path, or None if it is shorter."""
+    start = max(committed - TAIL_CRC_BYTES, 0)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(committed - start)
+    if len(data) != committed - start:
+        return None
+    return zlib.crc32(data)
+
+
+class ResumeJournal:
+    """Per-file checkpoints of incoming transfers, kept to resume them after an interruption.
+
+    Every transfer is keyed by the id the sender derives from its selection and
+    records the destination folder plus, per relative path, the file written,
+    its expected size and the bytes committed so far. Checkpoints are kept in
+    memory while a transfer runs and only written to disk, a JSON file in the
+    DataDash cache directory replaced atomically, once it is interrupted.
+    Complete files are verified by their size on resume, partly received ones
+    also by the CRC32 of their last TAIL_CRC_BYTES.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, JOURNAL_FILE_NAME)
+        self.transfers = None
+        self.transfer_id = None
+        # Transfers in the journal file, only they need it rewritten once they finish
+        self.saved = set()
+
+    def _load(self):
+        if self.transfers is not None:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.transfers = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.transfers = {}
+        self.saved = set(self.transfers)
+        now = time.time()
+        for transfer_id in [t for t, entry in self.transfers.items() if now - entry.get('updated', 0) > JOURNAL_MAX_AGE]:
+            del self.transfers[transfer_id]
+
+    def save(self):
+        """Write the journal to disk atomically."""
+        if self.transfers is None:
+            return
+        if self.transfer_id in self.transfers:
+            self.transfers[self.transfer_id]['updated'] = time.time()
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.transfers, f)
+            os.replace(tmp_path, self.path)
+            self.saved = set(self.transfers)
+        except OSError as e:
+            logger.error("Could not save resume journal: %s", e)
+
+    @property
+    def entry(self):
+        return self.transfers.get(self.transfer_id) if self.transfers is not None else None
+
+    def begin(self, transfer_id):
+        """Start or resume transfer_id and return {relative_path: [committed, size]}.
+
+        Checkpoints are verified against the files on disk first, anything that
+        no longer matches is dropped and will be sent again from zero.
+        """
+        self._load()
+        self.transfer_id = transfer_id
+        entry = self.transfers.setdefault(transfer_id, {'destination': None, 'files': {}})
+        offsets = {}
+        for relative_path, record in list(entry['files'].items()):
+            committed, size = record['committed'], record['size']
+            try:
+                if committed == size:
+                    valid = os.path.getsize(record['path']) == size
+                elif committed == 0:
+                    # Started but nothing kept, the file is only reused as the one to overwrite
+                    valid = os.path.exists(record['path'])
+                else:
+                    valid = (record.get('tail_crc') is not None
+                             and tail_crc(record['path'], committed) == record['tail_crc'])
+            except OSError:
+                valid = False
+            if valid:
+                offsets[relative_path] = [committed, size]
+            else:
+                logger.debug("Discarding stale checkpoint for %s", relative_path)
+                del entry['files'][relative_path]
+        logger.info("Transfer %s has %d checkpointed files", transfer_id, len(offsets))
+        return offsets
+
+    @property
+    def destination(self):
+        """Destination folder recorded for the current transfer, if it still exists."""
+        entry = self.entry
+        if entry and entry.get('destination') and os.path.isdir(entry['destination']):
+            return entry['destination']
+        return None
+
+    @destination.setter
+    def destination(self, folder):
+        if self.entry is not None:
+            self.entry['destination'] = folder
+
+    def file_path(self, relative_path):
+        """Path a file of the current transfer was written to before, or None."""
+        entry = self.entry
+        record = entry['files'].get(relative_path) if entry else None
+        return record['path'] if record else None
+
+    def committed(self, relative_path):
+        """Return the bytes of relative_path recorded as on disk."""
+        return self.entry['files'][relative_path]['committed']
+
+    def update(self, relative_path, file_path, size, committed):
+        """Record that committed bytes of relative_path are on disk, a partly received file keeps its tail CRC."""
+        if self.entry is None:
+            return
+        crc = None
+        if 0 < committed < size:
+            try:
+                crc = tail_crc(file_path, committed)
+            except OSError as e:
+                logger.debug("Cannot checkpoint %s: %s", file_path, e)
+                committed = 0
+        self.entry['files'][relative_path] = {'path': file_path, 'size': size, 'committed': committed,
+                                              'tail_crc': crc}
+
+    def complete(self, relative_path, file_path, size):
+        """Mark relative_path as fully received."""
+        self.update(relative_path, file_path, size, size)
+
+    def finish(self):
+        """Forget the current transfer once it has completed."""
+        if self.entry is not None:
+            del self.transfers[self.transfer_id]
+            if self.transfer_id in self.saved:
+                self.save()
+        self.transfer_id = None
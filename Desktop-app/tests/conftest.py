@@ -0,0 +1,27 @@
+"""Tests import the app modules by name from Desktop-app, like the app itself.
+
+They run with the offscreen Qt platform and a throwaway home directory, so the
+config, logs and caches of the machine are neither used nor touched.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+_home = tempfile.mkdtemp(prefix='datadash-test-')
+os.environ['HOME'] = _home
+os.environ['USERPROFILE'] = _home
+os.environ['APPDATA'] = os.path.join(_home, 'AppData', 'Roaming')
+os.environ['LOCALAPPDATA'] = os.path.join(_home, 'AppData', 'Local')
+os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+
+
+@pytest.fixture(scope='session')
+def app():
+    """One application for the whole run, as in the app, the shared ConfigManager outlives each test module."""
+    from PyQt6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
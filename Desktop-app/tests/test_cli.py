@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conftest import APP_DIR
+
+MAIN = os.path.join(APP_DIR, 'main.py')
+
+
+def run_cli(*args, cwd, home):
+    env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+    return subprocess.Popen([sys.executable, MAIN, *args, '--json'], cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+
+def summary(process):
+    stdout, _ = process.communicate(timeout=60)
+    events = [json.loads(line) for line in stdout.splitlines()]
+    return process.returncode, events[-1]
+
+
+def test_receive_without_dest_saves_to_the_current_directory_on_a_fresh_machine(tmp_path):
+    home = tmp_path / 'home'
+    home.mkdir()
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    payload = os.urandom(300 * 1024)
+    (tmp_path / 'report.bin').write_bytes(payload)
+
+    receiver = run_cli('receive', '--no-discovery', '--timeout', '60', cwd=inbox, home=home)
+    try:
+        # Until the receiver listens, the sender cannot reach it and fails at once
+        deadline = time.time() + 30
+        while True:
+            code, sent = summary(run_cli('send', '127.0.0.1', str(tmp_path / 'report.bin'),
+                                         cwd=tmp_path, home=home))
+            if code == 0 or 'Could not reach' not in (sent['error'] or '') or time.time() > deadline:
+                break
+            time.sleep(0.2)
+        code_received, received = summary(receiver)
+    finally:
+        receiver.kill()
+
+    assert (code, sent['ok'], sent['files']) == (0, True, 1)
+    assert (code_received, received['ok'], received['files']) == (0, True, 1)
+    assert (inbox / 'report.bin').read_bytes() == payload
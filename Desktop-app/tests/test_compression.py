@@ -0,0 +1,108 @@
+import io
+import os
+import socket
+import struct
+import threading
+
+import pytest
+
+import compression
+from compression import FrameCompressor, available_codecs, receive_compressed, _CODECS
+
+FRAME_SIZE = 4096
+
+
+@pytest.fixture(autouse=True)
+def small_frames(monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESS_FRAME_SIZE', FRAME_SIZE)
+
+
+def compressible(size):
+    line = b'DataDash compresses this line over and over\n'
+    return (line * (size // len(line) + 1))[:size]
+
+
+def frames_of(path, codec):
+    compressor = FrameCompressor(str(path), codec)
+    try:
+        frames = list(compressor)
+    finally:
+        compressor.close()
+    return compressor, frames
+
+
+def headers(frames):
+    return [struct.unpack('<II', frame[:8]) for frame, _ in frames]
+
+
+def round_trip(path, codec):
+    """Send path compressed over a socketpair and return what the receiver wrote."""
+    compressor, frames = frames_of(path, codec)
+    sender, receiver = socket.socketpair()
+    out = io.BytesIO()
+    with sender, receiver:
+        sending = threading.Thread(target=lambda: [sender.sendall(frame) for frame, _ in frames])
+        sending.start()
+        received = receive_compressed(receiver, out, _CODECS[codec][0], os.path.getsize(path))
+        sending.join()
+    assert received == os.path.getsize(path)
+    return compressor, out.getvalue()
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_compressible_data_round_trips_smaller(tmp_path, codec):
+    data = compressible(10 * FRAME_SIZE + 123)
+    (tmp_path / 'text.txt').write_bytes(data)
+    compressor, received = round_trip(tmp_path / 'text.txt', codec)
+    assert received == data
+    assert compressor.stored_size < compressor.raw_size * compression.COMPRESS_MAX_RATIO
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_incompressible_frames_are_stored(tmp_path, codec):
+    data = os.urandom(3 * FRAME_SIZE + 7)
+    (tmp_path / 'random.bin').write_bytes(data)
+    compressor, received = round_trip(tmp_path / 'random.bin', codec)
+    assert received == data
+    _, frames = frames_of(tmp_path / 'random.bin', codec)
+    assert all(stored_size == raw_size for stored_size, raw_size in headers(frames))
+    assert compressor.stored_size == compressor.raw_size == len(data)
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_files_failing_the_probe_frames_are_stored_from_then_on(tmp_path, codec):
+    probe = compression._PROBE_FRAMES * FRAME_SIZE
+    data = os.urandom(probe) + compressible(5 * FRAME_SIZE)
+    (tmp_path / 'mixed.bin').write_bytes(data)
+    _, frames = frames_of(tmp_path / 'mixed.bin', codec)
+    # The compressible rest is stored too, compressing it is no longer tried
+    assert all(stored_size == raw_size for stored_size, raw_size in headers(frames))
+    assert round_trip(tmp_path / 'mixed.bin', codec)[1] == data
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_decompression_stops_just_past_the_raw_size(codec):
+    compress, decompress = _CODECS[codec][1]()
+    stored = compress(b'\0' * (16 * 1024 * 1024))
+    assert len(decompress(stored, 1000)) == 1001
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_frames_inflating_beyond_their_raw_size_are_rejected(codec):
+    codec_id, factory = _CODECS[codec]
+    stored = factory()[0](b'\0' * (256 * 1024))
+    raw_size = len(stored) + 1
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(struct.pack('<II', len(stored), raw_size) + stored)
+        with pytest.raises(ValueError, match="wrong size"):
+            receive_compressed(receiver, io.BytesIO(), codec_id, raw_size)
+
+
+def test_malformed_frame_headers_are_rejected():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        # Stored bigger than raw
+        sender.sendall(struct.pack('<II', 20, 10))
+        with pytest.raises(ValueError, match="Malformed"):
+            receive_compressed(receiver, io.BytesIO(), _CODECS['zlib'][0], 10)
@@ -0,0 +1,32 @@
+from PyQt6.QtCore import Qt
+
+from constant import ConfigManager
+from file_sender import FileSender
+from file_receiver_python import ReceiveWorkerPython
+
+
+def test_workers_share_one_config_manager_without_starting_it(app, tmp_path):
+    receiver = ReceiveWorkerPython('127.0.0.1', save_directory=str(tmp_path))
+    sender = FileSender('127.0.0.1', [], None, {}, encrypt=False)
+
+    manager = ConfigManager.shared()
+    assert receiver.config_manager is manager
+    assert sender.config_manager is manager
+    assert not manager.isRunning()
+    assert manager.checked
+    assert manager.get_config()['version'] == manager.current_version
+
+
+def test_a_written_config_is_emitted_once(app):
+    manager = ConfigManager.shared()
+    manager.ensure_checked()
+    updates = []
+    manager.config_updated.connect(updates.append, Qt.ConnectionType.DirectConnection)
+    try:
+        config = manager.get_config()
+        config['show_warning'] = False
+        manager.write_config(config)
+    finally:
+        manager.config_updated.disconnect(updates.append)
+    assert [update['show_warning'] for update in updates] == [False]
+    assert manager.get_config()['show_warning'] is False
@@ -0,0 +1,69 @@
+import io
+import os
+
+import pytest
+
+from crypt_handler import GCM_HEADER_SIZE, GCMDecryptWriter, GCMEncryptReader, gcm_stream_size
+
+FRAME_SIZE = 64
+SALT = b's' * 16
+
+
+def encrypt(path, password='secret'):
+    with GCMEncryptReader(str(path), password, SALT, frame_size=FRAME_SIZE) as reader:
+        stream = b''
+        while True:
+            data = reader.read(50)
+            if not data:
+                break
+            stream += data
+        assert len(stream) == reader.size
+    return stream
+
+
+def decrypt(stream, password='secret', stream_size=None):
+    out = io.BytesIO()
+    writer = GCMDecryptWriter(out, stream[:GCM_HEADER_SIZE], password, stream_size or len(stream))
+    writer.write(stream[GCM_HEADER_SIZE:])
+    writer.finish()
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('size', [0, 1, FRAME_SIZE, 3 * FRAME_SIZE + 5])
+def test_round_trip(tmp_path, size):
+    data = os.urandom(size)
+    (tmp_path / 'plain').write_bytes(data)
+    stream = encrypt(tmp_path / 'plain')
+    assert len(stream) == gcm_stream_size(size, FRAME_SIZE)
+    assert decrypt(stream) == data
+
+
+def test_wrong_password_is_rejected_by_the_header(tmp_path):
+    (tmp_path / 'plain').write_bytes(b'data')
+    stream = encrypt(tmp_path / 'plain')
+    with pytest.raises(ValueError, match="Incorrect password"):
+        GCMDecryptWriter(io.BytesIO(), stream[:GCM_HEADER_SIZE], 'wrong', len(stream))
+
+
+def test_stream_cut_at_a_frame_boundary_fails_the_final_frame(tmp_path):
+    (tmp_path / 'plain').write_bytes(os.urandom(3 * FRAME_SIZE))
+    stream = encrypt(tmp_path / 'plain')
+    # Drop the last frame and announce the shorter size, its predecessor was not marked final
+    truncated = stream[:-(FRAME_SIZE + 16)]
+    with pytest.raises(ValueError, match="frame 1 failed authentication"):
+        decrypt(truncated)
+
+
+def test_stream_shorter_than_announced_does_not_finish(tmp_path):
+    (tmp_path / 'plain').write_bytes(os.urandom(3 * FRAME_SIZE))
+    stream = encrypt(tmp_path / 'plain')
+    with pytest.raises(ValueError, match="ended early"):
+        decrypt(stream[:-10], stream_size=len(stream))
+
+
+def test_tampered_frame_fails_authentication(tmp_path):
+    (tmp_path / 'plain').write_bytes(os.urandom(3 * FRAME_SIZE))
+    stream = bytearray(encrypt(tmp_path / 'plain'))
+    stream[GCM_HEADER_SIZE + FRAME_SIZE + 16 + 3] ^= 1
+    with pytest.raises(ValueError, match="frame 1 failed authentication"):
+        decrypt(bytes(stream))
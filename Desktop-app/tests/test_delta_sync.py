@@ -0,0 +1,125 @@
+import io
+import os
+import random
+import socket
+import threading
+
+import pytest
+
+import delta_sync
+from delta_sync import (DELTA_MAX_CHUNK, DELTA_MIN_CHUNK, chunk_digest, decode_signatures,
+                        encode_signatures, file_signature, iter_chunks, receive_delta, send_delta)
+from transfer_io import RecvBuffer
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def chunks_of(data):
+    return list(iter_chunks(io.BytesIO(data)))
+
+
+def test_chunks_cover_the_data_within_the_size_limits():
+    data = random_bytes(3 * 1024 * 1024, 1)
+    chunks = chunks_of(data)
+    assert b''.join(chunks) == data
+    assert all(DELTA_MIN_CHUNK <= len(chunk) <= DELTA_MAX_CHUNK for chunk in chunks[:-1])
+    # Repeated bytes never match a boundary and fall back to the maximum
+    assert {len(chunk) for chunk in chunks_of(b'\0' * (2 * DELTA_MAX_CHUNK))} == {DELTA_MAX_CHUNK}
+
+
+def test_chunks_do_not_depend_on_the_read_size(monkeypatch):
+    data = random_bytes(3 * 1024 * 1024, 2)
+    whole = chunks_of(data)
+    monkeypatch.setattr(delta_sync, '_SCAN_SIZE', 300 * 1024)
+    assert chunks_of(data) == whole
+
+
+def test_boundaries_after_an_insertion_stay_where_they_were():
+    data = random_bytes(4 * 1024 * 1024, 3)
+    middle = len(data) // 2
+    before = chunks_of(data)
+    after = chunks_of(data[:middle] + b'inserted' + data[middle:])
+    unchanged = set(before) & set(after)
+    # Only the chunk holding the insertion and at most its neighbour differ
+    assert len(before) - len(unchanged) <= 2
+    assert len(after) - len(unchanged) <= 2
+
+
+def test_signatures_round_trip(tmp_path):
+    (tmp_path / 'a.bin').write_bytes(random_bytes(1024 * 1024, 4))
+    (tmp_path / 'b.bin').write_bytes(b'')
+    signatures = {'dir/a.bin': file_signature(tmp_path / 'a.bin'),
+                  'b.bin': file_signature(tmp_path / 'b.bin'),
+                  'ünï/c.bin': [(chunk_digest(b'x'), 1)]}
+    decoded = decode_signatures(encode_signatures(signatures))
+
+    assert decoded.keys() == signatures.keys()
+    for relative_path, chunks in signatures.items():
+        offset = 0
+        expected = {}
+        for digest, length in chunks:
+            expected.setdefault(digest, (offset, length))
+            offset += length
+        assert decoded[relative_path] == expected
+    assert decoded['b.bin'] == {}
+
+
+def test_repeated_chunks_are_copied_from_their_first_offset():
+    chunk = chunk_digest(b'same')
+    decoded = decode_signatures(encode_signatures({'f': [(chunk, 4), (chunk_digest(b'x'), 1), (chunk, 4)]}))
+    assert decoded['f'][chunk] == (0, 4)
+
+
+def rebuild(tmp_path, basis, modified):
+    (tmp_path / 'basis').write_bytes(basis)
+    (tmp_path / 'modified').write_bytes(modified)
+    chunks = decode_signatures(encode_signatures({'f': file_signature(tmp_path / 'basis')}))['f']
+    sender, receiver = socket.socketpair()
+    sent = {}
+    out = io.BytesIO()
+    with sender, receiver:
+        sending = threading.Thread(
+            target=lambda: sent.update(literal=send_delta(sender, tmp_path / 'modified', chunks)))
+        sending.start()
+        written = receive_delta(receiver, out, tmp_path / 'basis', len(modified), RecvBuffer(64 * 1024))
+        sending.join()
+    assert written == len(modified)
+    return out.getvalue(), sent['literal']
+
+
+def test_modified_file_is_rebuilt_over_a_socket(tmp_path):
+    basis = random_bytes(3 * 1024 * 1024, 5)
+    modified = bytearray(basis)
+    modified[100 * 1024:100 * 1024 + 10] = b'0123456789'
+    modified[2 * 1024 * 1024:2 * 1024 * 1024] = b'an insertion'
+    modified = bytes(modified)
+    rebuilt, literal = rebuild(tmp_path, basis, modified + b'appended')
+    assert rebuilt == modified + b'appended'
+    assert literal < 4 * DELTA_MAX_CHUNK
+
+
+def test_unrelated_file_is_sent_as_literals(tmp_path):
+    modified = random_bytes(512 * 1024, 7)
+    rebuilt, literal = rebuild(tmp_path, random_bytes(512 * 1024, 6), modified)
+    assert rebuilt == modified
+    assert literal == len(modified)
+
+
+def test_basis_shorter_than_the_ops_is_rejected(tmp_path):
+    (tmp_path / 'basis').write_bytes(b'short')
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(delta_sync._COPY.pack(delta_sync._OP_COPY, 0, 100))
+        with pytest.raises(ValueError, match="changed during the delta transfer"):
+            receive_delta(receiver, io.BytesIO(), tmp_path / 'basis', 100, RecvBuffer(1024))
+
+
+def test_ops_beyond_the_file_size_are_rejected(tmp_path):
+    (tmp_path / 'basis').write_bytes(os.urandom(100))
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(delta_sync._COPY.pack(delta_sync._OP_COPY, 0, 100))
+        with pytest.raises(ValueError, match="more data than the file size"):
+            receive_delta(receiver, io.BytesIO(), tmp_path / 'basis', 50, RecvBuffer(1024))
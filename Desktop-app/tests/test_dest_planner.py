@@ -0,0 +1,11 @@
+from dest_planner import DestinationPlanner
+
+
+def test_unique_file_keeps_existing_files(tmp_path):
+    (tmp_path / 'report.txt').write_text('old')
+    (tmp_path / 'report (1).txt').write_text('old')
+    planner = DestinationPlanner()
+    assert planner.unique_file(str(tmp_path / 'report.txt')) == str(tmp_path / 'report (2).txt')
+    # Names handed out count as taken for the rest of the transfer
+    assert planner.unique_file(str(tmp_path / 'report.txt')) == str(tmp_path / 'report (3).txt')
+    assert planner.unique_file(str(tmp_path / 'new.txt')) == str(tmp_path / 'new.txt')
@@ -0,0 +1,39 @@
+import pytest
+from PyQt6.QtCore import Qt
+
+import file_receiver_python
+from file_receiver_python import ReceiveWorkerPython
+
+
+def test_unanswered_password_prompt_aborts_the_transfer(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_receiver_python, 'PASSWORD_TIMEOUT', 0.1)
+    worker = ReceiveWorkerPython('127.0.0.1', save_directory=str(tmp_path))
+    worker.resume_active = True
+    errors = []
+    worker.error_occurred.connect(lambda *error: errors.append(error), Qt.ConnectionType.DirectConnection)
+    with open(tmp_path / 'secret.bin', 'wb') as f, pytest.raises(TimeoutError):
+        worker._open_decrypt_writer(f, b'\0' * 64, 'secret.bin', 1024)
+    assert len(errors) == 1
+    assert not worker.resume_active
+
+
+@pytest.mark.parametrize('file_name, encrypted, expected', [
+    ('photo.jpg', False, 'photo (1).jpg'),
+    ('photo.jpg.crypt', True, 'photo.jpg (1).crypt'),
+])
+def test_name_collisions_are_resolved_like_the_other_receivers(app, tmp_path, file_name, encrypted, expected):
+    (tmp_path / file_name).write_bytes(b'kept')
+    worker = ReceiveWorkerPython('127.0.0.1', save_directory=str(tmp_path))
+    worker.destination_folder = str(tmp_path)
+    renamed = []
+    worker.file_renamed_signal.connect(lambda old, new: renamed.append(new), Qt.ConnectionType.DirectConnection)
+    name, path = worker.resolve_file_path(file_name, 'photo.jpg', encrypted)
+    assert path == str(tmp_path / expected)
+    assert name == expected
+    assert renamed == ['photo.jpg' if encrypted else expected]
+
+
+def test_file_names_leaving_the_destination_are_rejected(app, tmp_path):
+    worker = ReceiveWorkerPython('127.0.0.1', save_directory=str(tmp_path / 'dest'))
+    with pytest.raises(ValueError, match="outside"):
+        worker.resolve_file_path('../escaped.txt', '../escaped.txt', False)
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from file_receiver_swift import ReceiveWorkerSwift
+
+
+@pytest.mark.parametrize('metadata', [
+    # Folder paths relative to the sent folder, as the desktop senders write them
+    [{'path': 'sub/', 'size': 0}, {'path': 'sub/a.txt', 'size': 1},
+     {'base_folder_name': 'photos', 'path': '.delete', 'size': 0}],
+    # Folder paths starting with the sent folder
+    [{'path': 'photos/', 'size': 0}, {'path': 'photos/sub/', 'size': 0}, {'path': 'photos/sub/a.txt', 'size': 1}],
+])
+def test_folder_is_saved_under_the_name_it_was_sent_with(app, tmp_path, monkeypatch, metadata):
+    worker = ReceiveWorkerSwift('127.0.0.1')
+    monkeypatch.setattr(worker.config_manager, 'get_config', lambda: {'save_to_directory': str(tmp_path)})
+    assert worker.create_folder_structure(metadata) == os.path.join(str(tmp_path), 'photos')
+    assert worker.base_folder_name == 'photos'
@@ -0,0 +1,42 @@
+import os
+import threading
+import time
+
+from compression import available_codecs
+from integrity import available_checksums
+from portsss import DESKTOP_FEATURES
+
+
+def send(paths, destination):
+    """Send paths over 127.0.0.1 and return once the receiver is done."""
+    from file_sender import FileSender
+    from file_receiver_python import ReceiveWorkerPython
+    receiver = ReceiveWorkerPython('127.0.0.1', save_directory=str(destination))
+    receiving = threading.Thread(target=receiver.run)
+    receiving.start()
+    # Sent by the receiver during discovery, see file_receiver.py
+    receiver_data = {'features': DESKTOP_FEATURES, 'compression': available_codecs(),
+                     'checksums': available_checksums()}
+    FileSender('127.0.0.1', [str(path) for path in paths], None, receiver_data, encrypt=False).run()
+    receiving.join(60)
+    assert not receiving.is_alive()
+
+
+def test_files_edited_after_a_cached_scan_are_sent(app, tmp_path):
+    folder = tmp_path / 'folder'
+    folder.mkdir()
+    (folder / 'notes.txt').write_bytes(b'')
+    (folder / 'data.bin').write_bytes(os.urandom(1000))
+    # Listings of folders changed just before the scan are not reused, make this one old enough
+    old = time.time_ns() - 60 * 10 ** 9
+    os.utime(folder, ns=(old, old))
+
+    send([folder], tmp_path / 'first')
+    assert not (tmp_path / 'first' / 'folder' / 'notes.txt').exists()
+
+    # Editing a file in place leaves the folder's mtime, and so its cached listing, as it is
+    with open(folder / 'notes.txt', 'ab') as f:
+        f.write(b'written after the first transfer')
+    send([folder], tmp_path / 'second')
+    assert (tmp_path / 'second' / 'folder' / 'notes.txt').read_bytes() == b'written after the first transfer'
+    assert (tmp_path / 'second' / 'folder' / 'data.bin').read_bytes() == (folder / 'data.bin').read_bytes()
@@ -0,0 +1,131 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+import manifest
+from manifest import ManifestWriter, _BLOCK, _HEADER, _MAX_STRINGS_SIZE, read_manifest, read_manifest_part
+from portsss import MANIFEST_BLOCK_ENTRIES
+from transfer_io import recv_flag
+
+FILES = [('a.txt', 10, 1, 0o644), ('sub/b.bin', 0, -5, 0o600), ('sub/deeper/c', 2 ** 40, 2 ** 62, 0o755),
+         ('ünïcode/d.txt', 3, 7, 0o644), ('e', 1, 0, 0)]
+
+
+@pytest.fixture
+def pair():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        yield sender, receiver
+
+
+def write(sock, base_folder_name='', streamed=False, files=FILES, folders=(), before_close=None):
+    """Write a manifest of files in a thread, returns the thread and add_file()'s results."""
+    flushed = []
+
+    def run():
+        writer = ManifestWriter(sock, base_folder_name, streamed)
+        for folder in folders:
+            writer.add_folder(folder)
+        for entry in files:
+            flushed.append(writer.add_file(*entry))
+        if before_close:
+            before_close(writer)
+        writer.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, flushed
+
+
+def receive(sock):
+    assert recv_flag(sock) == b'encyp: m'
+    received = read_manifest(sock)
+    while not received.complete:
+        assert recv_flag(sock) == b'encyp: n'
+        read_manifest_part(sock, received)
+    return received
+
+
+def entries(received):
+    return list(zip(received.files, received.sizes, received.mtimes, received.modes))
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+@pytest.mark.parametrize('block_entries', [2, 4096])
+def test_folder_round_trip(pair, monkeypatch, streamed, block_entries):
+    monkeypatch.setattr(manifest, 'MANIFEST_BLOCK_ENTRIES', block_entries)
+    thread, flushed = write(pair[0], 'base', streamed, folders=['empty'])
+    received = receive(pair[1])
+    thread.join()
+    assert received.base_folder_name == 'base'
+    assert received.complete
+    assert entries(received) == FILES
+    assert received.folders == ['empty', 'sub', 'sub/deeper', 'ünïcode']
+    assert (received.total_files, received.folder_bytes) == (5, 2 ** 40 + 14)
+    # add_file() reports every full block that went out
+    assert flushed.count(True) == len(FILES) // block_entries
+
+
+def test_file_selection_round_trip(pair):
+    files = [('one.txt', 1, 2, 3), ('two.txt', 4, 5, 6)]
+    thread, _ = write(pair[0], files=files)
+    received = receive(pair[1])
+    thread.join()
+    assert not received.is_folder
+    assert entries(received) == files
+
+
+def test_streamed_manifest_starts_incomplete(pair):
+    thread, _ = write(pair[0], 'base', streamed=True)
+    assert recv_flag(pair[1]) == b'encyp: m'
+    received = read_manifest(pair[1])
+    assert not received.complete and received.total_files == 0
+    assert recv_flag(pair[1]) == b'encyp: n'
+    assert read_manifest_part(pair[1], received)
+    assert recv_flag(pair[1]) == b'encyp: n'
+    assert not read_manifest_part(pair[1], received)
+    thread.join()
+    assert received.complete and entries(received) == FILES
+
+
+@pytest.mark.parametrize('counter', ['total_files', 'total_bytes'])
+def test_streamed_totals_must_match(pair, counter):
+    thread, _ = write(pair[0], 'base', streamed=True,
+                      before_close=lambda writer: setattr(writer, counter, getattr(writer, counter) + 1))
+    with pytest.raises(ValueError, match="sender counted"):
+        receive(pair[1])
+    thread.join()
+
+
+@pytest.mark.parametrize('header', [b'XYZ' + _HEADER.pack(1, 0), b'DDM' + _HEADER.pack(3, 0)])
+def test_unknown_manifests_are_rejected(pair, header):
+    pair[0].sendall(header)
+    with pytest.raises(ValueError, match="Unsupported manifest"):
+        read_manifest(pair[1])
+
+
+def one_file(folder_id):
+    return struct.pack('<IQqI', folder_id, 1, 0, 0)
+
+
+@pytest.mark.parametrize('block, error', [
+    (_BLOCK.pack(0, MANIFEST_BLOCK_ENTRIES + 1, 0), "exceeds the limit"),
+    (_BLOCK.pack(MANIFEST_BLOCK_ENTRIES + 1, 0, 0), "exceeds the limit"),
+    (_BLOCK.pack(0, 1, _MAX_STRINGS_SIZE + 1), "exceeds the limit"),
+    (_BLOCK.pack(0, 2, 2) + b'a\0' + one_file(0) * 2, "do not match its counts"),
+    (_BLOCK.pack(1, 1, 4) + b'f\0a\0' + one_file(2), "names folder 2 of 1"),
+    (_BLOCK.pack(0, 1, 3) + b'\xff\xfe\0' + one_file(0), "can't decode"),
+])
+def test_malformed_blocks_are_rejected(pair, block, error):
+    pair[0].sendall(b'DDM' + _HEADER.pack(1, 0) + block)
+    with pytest.raises(ValueError, match=error):
+        read_manifest(pair[1])
+
+
+def test_manifest_cut_short_is_rejected(pair):
+    pair[0].sendall(b'DDM' + _HEADER.pack(1, 0) + _BLOCK.pack(0, 1, 2) + b'a\0' + one_file(0)[:5])
+    pair[0].shutdown(socket.SHUT_WR)
+    with pytest.raises(ConnectionError):
+        read_manifest(pair[1])
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+import dest_planner
+from dest_planner import DestinationPlanner
+from packed_batch import encode_index, unpack_batch
+
+
+def batch(*files):
+    return encode_index([(path, len(data)) for path, data in files]), b''.join(data for _, data in files)
+
+
+@pytest.mark.parametrize('path', ['../outside.txt', 'sub/../../outside.txt', '/tmp/outside.txt', '..\\outside.txt', '.'])
+def test_paths_leaving_the_destination_are_rejected(tmp_path, path):
+    destination = tmp_path / 'dest'
+    index, payload = batch(('fine.txt', b'fine'), (path, b'evil'))
+    with pytest.raises(ValueError, match="outside"):
+        unpack_batch(index, payload, str(destination))
+    # Nothing of the batch is written
+    assert not destination.exists()
+    assert not (tmp_path / 'outside.txt').exists()
+
+
+def test_taken_names_get_the_first_free_number(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'a.txt').write_bytes(b'old')
+    index, payload = batch(('sub/a.txt', b'new'), ('sub/b.txt', b'b'))
+    written = unpack_batch(index, payload, str(tmp_path), DestinationPlanner())
+    assert [(relative_path, os.path.basename(path)) for relative_path, path, _ in written] == [
+        ('sub/a.txt', 'a (1).txt'), ('sub/b.txt', 'b.txt')]
+    assert (tmp_path / 'sub' / 'a.txt').read_bytes() == b'old'
+    assert (tmp_path / 'sub' / 'a (1).txt').read_bytes() == b'new'
+
+
+def test_names_differing_in_case_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    # As on Windows and macOS
+    monkeypatch.setattr(dest_planner, '_name_key', str.casefold)
+    index, payload = batch(('Readme.txt', b'first'), ('README.txt', b'second'))
+    written = unpack_batch(index, payload, str(tmp_path))
+    assert [os.path.basename(path) for _, path, _ in written] == ['Readme.txt', 'README (1).txt']
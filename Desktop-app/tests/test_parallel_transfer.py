@@ -0,0 +1,71 @@
+import os
+import socket
+import struct
+import threading
+
+import pytest
+
+from parallel_transfer import ParallelReceiver, PARALLEL_TOKEN_SIZE
+
+
+@pytest.mark.parametrize('offset, length', [(90, 20), (1 << 40, 1), (10, 0)])
+def test_segments_outside_the_file_fail_the_transfer(tmp_path, offset, length):
+    token = os.urandom(PARALLEL_TOKEN_SIZE)
+    path = tmp_path / 'big.bin'
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        receiver = ParallelReceiver(server, token)
+        control, _ = socket.socketpair()
+        with control, socket.create_connection(server.getsockname()) as stream:
+            stream.sendall(token + struct.pack('<QQ', offset, length) + b'x' * length)
+            with pytest.raises(ValueError):
+                receiver.receive(control, str(path), 100)
+    assert path.stat().st_size == 100
+
+
+@pytest.mark.parametrize('control_goes_silent', [False, True])
+def test_transfer_resumes_after_a_drop_mid_parallel_file(app, tmp_path, monkeypatch, control_goes_silent):
+    import file_sender
+    import parallel_transfer
+    from file_sender import FileSender
+    from file_receiver_python import ReceiveWorkerPython
+    from parallel_transfer import ParallelSender
+    from integrity import available_checksums
+    from portsss import DESKTOP_FEATURES
+
+    monkeypatch.setattr(file_sender, 'PARALLEL_MIN_FILE_SIZE', 1024 * 1024)
+    monkeypatch.setattr(file_sender, 'RESUME_DELAY', 0.1)
+    monkeypatch.setattr(parallel_transfer, 'PARALLEL_SEGMENT_SIZE', 256 * 1024)
+    source = tmp_path / 'big.bin'
+    source.write_bytes(os.urandom(3 * 1024 * 1024))
+
+    stalled = []
+    send = ParallelSender.send
+
+    def send_then_drop(self, control_skt, *args, **kwargs):
+        if stalled:
+            return send(self, control_skt, *args, **kwargs)
+        token = os.urandom(PARALLEL_TOKEN_SIZE)
+        control_skt.sendall(token)
+        stream = socket.create_connection((self.ip_address, self.port))
+        stream.sendall(token + struct.pack('<QQ', 0, 1000) + b'x' * 500)
+        # The link goes quiet, the receiver sees no end on the data stream
+        stalled.append(stream)
+        if control_goes_silent:
+            # nor on the control connection the sender gives up on
+            stalled.append(control_skt.dup())
+        raise ConnectionResetError("Connection dropped")
+
+    monkeypatch.setattr(ParallelSender, 'send', send_then_drop)
+    receiver = ReceiveWorkerPython('127.0.0.1', save_directory=str(tmp_path / 'received'))
+    receiving = threading.Thread(target=receiver.run)
+    receiving.start()
+    # Without compression, so the file goes over parallel streams
+    receiver_data = {'features': DESKTOP_FEATURES, 'compression': [], 'checksums': available_checksums()}
+    try:
+        FileSender('127.0.0.1', [str(source)], None, receiver_data, encrypt=False).run()
+        receiving.join(30)
+    finally:
+        for sock in stalled:
+            sock.close()
+    assert not receiving.is_alive()
+    assert (tmp_path / 'received' / 'big.bin').read_bytes() == source.read_bytes()
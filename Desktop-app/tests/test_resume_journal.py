@@ -0,0 +1,54 @@
+import os
+
+from resume_journal import ResumeJournal, TAIL_CRC_BYTES
+
+
+def interrupted_journal(tmp_path):
+    """A journal saved after a transfer broke off with one complete and one partial file."""
+    journal = ResumeJournal(str(tmp_path))
+    journal.begin('transfer')
+    complete, partial = tmp_path / 'complete.bin', tmp_path / 'partial.bin'
+    complete.write_bytes(os.urandom(1000))
+    partial.write_bytes(os.urandom(3 * TAIL_CRC_BYTES))
+    journal.complete('complete.bin', str(complete), 1000)
+    journal.update('partial.bin', str(partial), 10 * TAIL_CRC_BYTES, 3 * TAIL_CRC_BYTES)
+    assert not os.path.exists(journal.path)
+    journal.save()
+    return complete, partial
+
+
+def test_checkpoints_survive_an_interruption(tmp_path):
+    interrupted_journal(tmp_path)
+    offsets = ResumeJournal(str(tmp_path)).begin('transfer')
+    assert offsets == {'complete.bin': [1000, 1000], 'partial.bin': [3 * TAIL_CRC_BYTES, 10 * TAIL_CRC_BYTES]}
+
+
+def test_changed_files_are_sent_again(tmp_path):
+    complete, partial = interrupted_journal(tmp_path)
+    with open(complete, 'ab') as f:
+        f.write(b'more')
+    data = bytearray(partial.read_bytes())
+    data[-1] ^= 0xff
+    partial.write_bytes(data)
+    assert ResumeJournal(str(tmp_path)).begin('transfer') == {}
+
+
+def test_finished_transfers_leave_no_journal_behind(tmp_path):
+    journal = ResumeJournal(str(tmp_path))
+    journal.begin('transfer')
+    journal.complete('file.bin', str(tmp_path / 'file.bin'), 10)
+    journal.finish()
+    assert not os.path.exists(journal.path)
+
+
+def test_files_interrupted_before_a_checkpoint_keep_their_path(tmp_path):
+    journal = ResumeJournal(str(tmp_path))
+    journal.begin('transfer')
+    started = tmp_path / 'started.bin'
+    started.write_bytes(b'\0' * 100)
+    journal.update('started.bin', str(started), 100, 0)
+    journal.save()
+
+    journal = ResumeJournal(str(tmp_path))
+    assert journal.begin('transfer') == {'started.bin': [0, 100]}
+    assert journal.file_path('started.bin') == str(started)
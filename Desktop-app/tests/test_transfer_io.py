@@ -0,0 +1,64 @@
+import hashlib
+import socket
+import threading
+
+import pytest
+
+from transfer_io import recv_flag, send_file_range
+
+
+@pytest.mark.parametrize('hasher', [None, hashlib.blake2b()], ids=['sendfile', 'read'])
+def test_send_file_range_raises_when_file_ends_early(tmp_path, hasher):
+    path = tmp_path / 'short.bin'
+    path.write_bytes(b'x' * 10)
+    sender, receiver = socket.socketpair()
+    with sender, receiver, open(path, 'rb') as f:
+        with pytest.raises(ConnectionError):
+            send_file_range(sender, f, 0, 20, 4, hasher=hasher)
+
+
+def test_send_file_range_sends_the_range(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes(range(256)) * 4)
+    sender, receiver = socket.socketpair()
+    with sender, receiver, open(path, 'rb') as f:
+        assert send_file_range(sender, f, 100, 500, 64) == 500
+        received = b''
+        while len(received) < 500:
+            received += receiver.recv(500 - len(received))
+    assert received == path.read_bytes()[100:600]
+
+
+def test_recv_flag_completes_a_split_flag():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(b'encyp')
+        threading.Timer(0.05, sender.sendall, (b': fencyp: h',)).start()
+        assert recv_flag(receiver) == b'encyp: f'
+        assert recv_flag(receiver) == b'encyp: h'
+
+
+def test_recv_flag_returns_nothing_when_the_peer_closed():
+    sender, receiver = socket.socketpair()
+    with receiver:
+        sender.close()
+        assert recv_flag(receiver) == b''
+
+
+@pytest.mark.parametrize('offset', [0, 100])
+def test_send_file_range_hashes_what_sendfile_sends(tmp_path, offset):
+    data = bytes(range(256)) * 4096
+    path = tmp_path / 'data.bin'
+    path.write_bytes(data)
+    hasher = hashlib.blake2b()
+    sender, receiver = socket.socketpair()
+    with sender, receiver, open(path, 'rb') as f:
+        sending = threading.Thread(target=send_file_range, args=(sender, f, offset, len(data) - offset, 4096),
+                                   kwargs={'hasher': hasher})
+        sending.start()
+        received = b''
+        while len(received) < len(data) - offset:
+            received += receiver.recv(1 << 20)
+        sending.join()
+    assert received == data[offset:]
+    assert hasher.digest() == hashlib.blake2b(data[offset:]).digest()
@@ -0,0 +1,336 @@
+import io
+import mmap
+import os
+import queue
+import threading
+import time
+from loges import logger
+from portsss import CHUNK_SIZE_MAX, WRITE_QUEUE_DEPTH, WRITE_BUFFER_SIZE
+
+# Largest slice handed to the kernel per sendfile() call. Keeping slices
+# bounded lets the caller refresh progress while the file is in flight.
+SENDFILE_SLICE = 8 * 1024 * 1024
+
+_HAS_SENDFILE = hasattr(os, 'sendfile')
+
+
+def _supports_sendfile(f):
+    """Return True if f is backed by a real file descriptor we can sendfile() from."""
+    if not _HAS_SENDFILE:
+        return False
+    try:
+        f.fileno()
+    except (AttributeError, io.UnsupportedOperation, OSError):
+        return False
+    return True
+
+
+def send_file_range(sock, f, offset, count, chunk_size, on_progress=None, sizer=None, hasher=None):
+    """Send count bytes of f, starting at offset, over sock.
+
+    Regular files are handed to the kernel with socket.sendfile() so the data
+    never passes through Python. Anything else (platforms without sendfile,
+    in-memory or transforming readers) falls back to read()/sendall() in
+    chunk_size pieces, or at the size currently chosen by sizer (a ChunkSizer)
+    when one is given. When a hasher is given, every slice is also hashed: from
+    a read-only mapping of the file next to sendfile(), so the hash reads the
+    page cache the kernel just sent from, or as it is read on the fallback
+    path. on_progress(n) is called after every slice with the number of bytes
+    just sent. Returns the total number of bytes sent.
+
+    Raises ConnectionError if f ends before count bytes were sent: the peer
+    was told the size up front and would read what follows as file data.
+    """
+    sent = 0
+    use_kernel = _supports_sendfile(f)
+    mapped = view = None
+    if use_kernel and hasher is not None and count:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+        except (OSError, ValueError) as e:
+            logger.debug("Cannot map %s for hashing, using user-space copy: %s", getattr(f, 'name', f), e)
+            use_kernel = False
+    if not use_kernel:
+        f.seek(offset)
+
+    try:
+        while sent < count:
+            remaining = count - sent
+            if use_kernel:
+                try:
+                    n = sock.sendfile(f, offset + sent, min(SENDFILE_SLICE, remaining))
+                except (OSError, ValueError) as e:
+                    if sent:
+                        raise
+                    # Some filesystems (and non-blocking sockets) reject sendfile,
+                    # nothing has been written yet so it is safe to fall back.
+                    logger.debug("sendfile unavailable, using user-space copy: %s", e)
+                    use_kernel = False
+                    f.seek(offset)
+                    continue
+                if view is not None:
+                    hasher.update(view[offset + sent:offset + sent + n])
+            else:
+                if sizer:
+                    chunk_size = sizer.size
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                if hasher:
+                    hasher.update(data)
+                sock.sendall(data)
+                n = len(data)
+
+            if n == 0:
+                break
+            sent += n
+            if sizer:
+                sizer.record(n)
+            if on_progress:
+                on_progress(n)
+    finally:
+        if mapped is not None:
+            view.release()
+            mapped.close()
+
+    if sent < count:
+        raise ConnectionError(f"File ended after {sent} of {count} bytes, the transfer cannot continue")
+    return sent
+
+
+def recv_exact(sock, size):
+    """Receive exactly size bytes from sock into a single preallocated buffer."""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("Connection closed before data was completely received.")
+        received += n
+    return data
+
+
+def recv_flag(sock):
+    """Receive the 8 byte flag of the next frame.
+
+    Returns b'' if the peer closed the connection before the flag, a flag
+    split over several segments is completed with recv_exact().
+    """
+    flag = sock.recv(8)
+    if 0 < len(flag) < 8:
+        flag += recv_exact(sock, 8 - len(flag))
+    return flag
+
+
+class RecvBuffer:
+    """Reusable receive buffer for streaming payloads straight to disk.
+
+    One bytearray is allocated per connection and reused for every recv_into()
+    call, so file payloads are written from the buffer without allocating a new
+    bytes object per chunk.
+    """
+
+    def __init__(self, size=CHUNK_SIZE_MAX):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def recv_into_file(self, sock, f, size, on_chunk=None, sizer=None, hasher=None):
+        """Receive size bytes from sock and write them to f.
+
+        Each recv_into() asks for at most the size chosen by sizer (or the whole
+        buffer). Written data is also fed to hasher when one is given. on_chunk(n)
+        is called after every write with the number of bytes just received.
+        Returns the number of bytes written.
+        """
+        view = self.view
+        capacity = len(view)
+        received = 0
+        while received < size:
+            want = min(capacity, size - received)
+            if sizer:
+                want = min(want, sizer.size)
+            n = sock.recv_into(view[:want])
+            if not n:
+                raise ConnectionError("Connection lost during file reception.")
+            f.write(view[:n])
+            if hasher:
+                hasher.update(view[:n])
+            received += n
+            if sizer:
+                sizer.record(n)
+            if on_chunk:
+                on_chunk(n)
+        return received
+
+    def skip(self, sock, size, on_chunk=None):
+        """Receive and discard size bytes from sock. Returns the number of bytes skipped."""
+        view = self.view
+        capacity = len(view)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[:min(capacity, size - received)])
+            if not n:
+                raise ConnectionError("Connection lost during file reception.")
+            received += n
+            if on_chunk:
+                on_chunk(n)
+        return received
+
+
+class DiskWriter:
+    """Receives payloads on the calling thread and writes them on a writer thread.
+
+    A drop-in for RecvBuffer: the network side fills buffers from a fixed pool
+    and queues them, the writer thread drains them into the output file and
+    hands the buffers back. A slow disk only blocks the network once the whole
+    pool is queued, and the network never waits for an individual write.
+
+    The time the network side waited for a free buffer (disk bound) and the time
+    the writer waited for data (network bound) are accumulated together with the
+    queue depth, see stats().
+    """
+
+    def __init__(self, depth=WRITE_QUEUE_DEPTH, buffer_size=WRITE_BUFFER_SIZE):
+        self.free = queue.Queue()
+        for _ in range(depth):
+            self.free.put(bytearray(buffer_size))
+        self.depth = depth
+        self.pending = queue.Queue()
+        self.error = None
+        self.active = False
+        # Counts recv_into_file() calls, idle time between two files is not a network stall
+        self.generation = 0
+        self.reset_stats()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def reset_stats(self):
+        self.network_wait = 0.0
+        self.disk_wait = 0.0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.bytes_written = 0
+
+    def stats(self):
+        """Return the pipeline statistics gathered since the last reset_stats()."""
+        return {
+            'bytes': self.bytes_written,
+            'mean_depth': self.depth_total / self.depth_samples if self.depth_samples else 0.0,
+            'max_depth': self.max_depth,
+            'network_wait': self.network_wait,
+            'disk_wait': self.disk_wait,
+        }
+
+    def log_stats(self):
+        """Log which side of the pipeline held the transfer back and reset the counters."""
+        stats = self.stats()
+        if stats['bytes']:
+            logger.info("Disk writer: %d bytes, queue depth mean %.1f max %d of %d, "
+                        "network waited %.2fs for the disk, disk waited %.2fs for the network",
+                        stats['bytes'], stats['mean_depth'], stats['max_depth'], self.depth,
+                        stats['network_wait'], stats['disk_wait'])
+        self.reset_stats()
+
+    def _run(self):
+        while True:
+            started, generation = time.monotonic(), self.generation
+            item = self.pending.get()
+            if self.active and generation == self.generation:
+                self.disk_wait += time.monotonic() - started
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            f, buffer, n = item
+            if self.error is None:
+                try:
+                    f.write(memoryview(buffer)[:n])
+                except Exception as e:
+                    self.error = e
+            self.free.put(buffer)
+
+    def _take_buffer(self):
+        started = time.monotonic()
+        buffer = self.free.get()
+        self.network_wait += time.monotonic() - started
+        return buffer
+
+    def flush(self):
+        """Wait until every queued write has reached the file."""
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait()
+
+    def recv_into_file(self, sock, f, size, on_chunk=None, sizer=None, hasher=None):
+        """Receive size bytes from sock and have the writer thread write them to f.
+
+        Same contract as RecvBuffer.recv_into_file(). Returns once all of the data
+        is written, so f may be closed afterwards, and raises the writer's error
+        if a write failed.
+        """
+        received = 0
+        self.generation += 1
+        self.active = True
+        try:
+            while received < size and self.error is None:
+                buffer = self._take_buffer()
+                view = memoryview(buffer)
+                want = min(len(view), size - received)
+                if sizer:
+                    want = min(want, sizer.size)
+                filled = 0
+                try:
+                    # Fill the buffer before queueing it, one write per buffer
+                    while filled < want:
+                        n = sock.recv_into(view[filled:want])
+                        if not n:
+                            raise ConnectionError("Connection lost during file reception.")
+                        filled += n
+                        if sizer:
+                            sizer.record(n)
+                        if on_chunk:
+                            on_chunk(n)
+                except BaseException:
+                    self.free.put(buffer)
+                    raise
+                if hasher:
+                    hasher.update(view[:filled])
+                self.pending.put((f, buffer, filled))
+                received += filled
+                depth = self.pending.qsize()
+                self.max_depth = max(self.max_depth, depth)
+                self.depth_total += depth
+                self.depth_samples += 1
+        finally:
+            self.flush()
+            self.active = False
+        self.bytes_written += received
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return received
+
+    def skip(self, sock, size, on_chunk=None):
+        """Receive and discard size bytes from sock. Returns the number of bytes skipped."""
+        buffer = self._take_buffer()
+        try:
+            view = memoryview(buffer)
+            received = 0
+            while received < size:
+                n = sock.recv_into(view[:min(len(view), size - received)])
+                if not n:
+                    raise ConnectionError("Connection lost during file reception.")
+                received += n
+                if on_chunk:
+                    on_chunk(n)
+            return received
+        finally:
+            self.free.put(buffer)
+
+    def close(self):
+        """Stop the writer thread."""
+        self.pending.put(None)